@@ -1,6 +1,9 @@
 import os
 import datetime
 
+# lazy module imports - defined next to get_data / get_output in utils so the internal test imports get them too
+from covey.utils import LazyModule, lazy_import
+
 _ROOT = os.path.abspath(os.path.dirname(__file__))
 
 def get_data(path):
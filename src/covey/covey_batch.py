@@ -0,0 +1,258 @@
+import os
+import time
+import warnings
+import pandas as pd
+from dotenv import load_dotenv
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+# # covey libraries - internal test
+# from utils import get_data, get_output
+# from covey_trade import Trade
+# from covey_ledger import Ledger, LedgerStore, LedgerIndexer
+# from covey_pricer import Pricer
+# from covey_calendar import CoveyCalendar
+# from covey_universe import Universe
+# from covey_portfolio import Portfolio
+# from covey_metrics import Metrics
+
+# covey libraries - packaging
+from covey import get_data, get_output
+from covey.covey_trade import Trade
+from covey.covey_ledger import Ledger, LedgerStore, LedgerIndexer
+from covey.covey_pricer import Pricer
+from covey.covey_calendar import CoveyCalendar
+from covey.covey_universe import Universe
+from covey.covey_portfolio import Portfolio
+from covey.covey_metrics import Metrics
+
+# inputs shared by every wallet - set once per worker process by the pool initializer
+_shared = {}
+
+
+def _init_worker(price_key, calendar_key, start_cash, ann_interest):
+    _shared['price_key'] = price_key
+    _shared['calendar_key'] = calendar_key
+    _shared['start_cash'] = start_cash
+    _shared['ann_interest'] = ann_interest
+
+
+# per wallet portfolio math - runs in the worker processes, no network calls
+def _calculate_wallet(address, trades):
+    price_key = _shared['price_key']
+
+    # only the prices of the wallet's own symbols - same dates, so DUMMY only wallets still get their timestamps
+    wallet_price_key = price_key.subset(trades['symbol'].unique())
+
+    p = Portfolio(address=address, trades=trades, price_key=wallet_price_key,
+                  calendar_key=_shared['calendar_key'], start_cash=_shared['start_cash'],
+                  ann_interest=_shared['ann_interest'], export=False)
+    p.calculate_portfolio()
+
+    return address, p.portfolio, p.trading_key
+
+
+class PortfolioBatch:
+    def __init__(self, **kwargs):
+        # load environment variables (aplaca private and public keys)
+        load_dotenv()
+
+        # wallet csvs in the data folder - all wallets and most active wallets by default
+        self.wallet_files = kwargs.get('wallet_files', ['allWallets.csv', 'most_active_wallets.csv'])
+
+        # the wallets to score - read from the wallet csvs if not provided
+        self.addresses = kwargs.get('addresses', None)
+        if self.addresses is None:
+            self.addresses = self.get_addresses()
+
+        # default start cash to 10000
+        self.start_cash = kwargs.get('start_cash', 10000)
+
+        # default annual interest to 0.2 %
+        self.ann_interest = kwargs.get('ann_interest', 0.02)
+
+        # bar resolutions - the pricer's time frame (alpaca TimeFrame, hourly if None) and a finer one only around the
+        # trade entries (i.e. TimeFrame.Day marks with TimeFrame.Minute entries)
+        self.timeframe = kwargs.get('timeframe', None)
+        self.entry_timeframe = kwargs.get('entry_timeframe', None)
+
+        # demand driven pricing - only the days the wallets' trades need priced, not the full history
+        self.demand_pricing = kwargs.get('demand_pricing', False)
+
+        # number of worker processes for the portfolio math - None defaults to the cpu count
+        self.max_workers = kwargs.get('max_workers', None)
+
+        # local ledger store (covey_ledger.LedgerStore) - brought up to date and read instead of getAllContent, the
+        # default store in the output folder once it has been built (it follows swapAddress, getAllContent doesn't)
+        self.ledger_store = kwargs.get('ledger_store', None)
+        if self.ledger_store is None and os.path.exists(get_output('covey_ledger.db')):
+            self.ledger_store = LedgerStore()
+
+        # ledger to read the wallets' content from (anything with get_analyst_content, i.e. a Ledger or a LedgerStore
+        # someone else keeps indexed) - used as is, before the ledger store
+        self.ledger = kwargs.get('ledger', None)
+
+        # tradable symbols and business dates - downloaded (or read from the output folder caches) if not provided
+        self.universe = kwargs.get('universe', None)
+        self.calendar_key = kwargs.get('calendar_key', None)
+
+        # columnar outputs partitioned by address (covey_export.Exporter) instead of the universe csvs
+        self.exporter = kwargs.get('exporter', None)
+
+        # stage timings and counters of the shared steps (covey_metrics.Metrics) - the wallet portfolio math runs in
+        # the worker processes and is timed as a whole
+        self.metrics = kwargs.get('metrics', None)
+        if self.metrics is None:
+            self.metrics = Metrics()
+
+        # transformed trades per address
+        self.trades = {}
+
+        # price key shared by every wallet - priced for the union of the wallets' symbols if not provided
+        self.price_key = kwargs.get('price_key', None)
+
+        # stacked outputs keyed by address
+        self.portfolio = pd.DataFrame()
+        self.trading_key = pd.DataFrame()
+
+        # addresses that could not be calculated
+        self.failed = []
+
+    # unique wallet addresses across the wallet csvs
+    def get_addresses(self):
+        wallets_df = pd.concat([pd.read_csv(get_data(f)) for f in self.wallet_files])
+        wallets_df['address_lower'] = wallets_df['eth_cust_address'].str.strip().str.lower()
+        return wallets_df.drop_duplicates('address_lower')['eth_cust_address'].str.strip().to_list()
+
+    # gather and transform the trades of every wallet - the ledger is read and the alpaca universe is
+    # downloaded once for all of them
+    def gather_trades(self):
+        if self.ledger is not None:
+            ledger = self.ledger
+        elif self.ledger_store is not None:
+            # only the blocks since the last run
+            LedgerIndexer(store=self.ledger_store).update()
+            ledger = self.ledger_store
+        else:
+            warnings.warn("No ledger store - reading the ledger with getAllContent, content moved with swapAddress stays "
+                          "under the old address (pass a covey_ledger.LedgerStore to follow swaps)", RuntimeWarning)
+            ledger = Ledger()
+
+        with self.metrics.stage('universe_filter'):
+            universe = self.universe if self.universe is not None else Universe().symbols
+
+        for address in self.addresses:
+            self.trades[address] = Trade(address=address, ledger=ledger.get_analyst_content(address),
+                                         universe=universe, pricing=False, metrics=self.metrics).trades
+        self.metrics.gauge('wallets', len(self.trades))
+
+        return 0
+
+    # earliest trade entry across all wallets
+    def get_min_trade_entry(self):
+        entries = [t['entry_date'].min() for t in self.trades.values() if len(t.index) > 0]
+        if len(entries) < 1:
+            return datetime(2021,12,31).strftime('%Y-%m-%d')
+        return min(entries).strftime('%Y-%m-%d')
+
+    # union of the symbols across all wallets
+    def get_symbols(self):
+        symbols = set()
+        for t in self.trades.values():
+            if len(t.index) > 0:
+                symbols.update(t['symbol'].unique())
+        return sorted(symbols)
+
+    # pricer time frames - the entries of every wallet get the entry time frame bars (and decide the days priced in
+    # demand mode)
+    def get_pricing_kwargs(self, calendar_key):
+        kwargs = {'calendar_key': calendar_key}
+        if self.timeframe is not None:
+            kwargs['timeframe'] = self.timeframe
+        if self.entry_timeframe is not None:
+            kwargs['entry_timeframe'] = self.entry_timeframe
+        if (self.entry_timeframe is not None or self.demand_pricing) and len(self.trades) > 0:
+            kwargs['entries'] = pd.concat([t[['symbol', 'entry_date_time', 'target_percentage']] for t in self.trades.values()],
+                                          ignore_index=True)
+            kwargs['demand'] = self.demand_pricing
+        return kwargs
+
+    def calculate_portfolios(self):
+        # trades per wallet
+        self.gather_trades()
+
+        # one calendar and one price key for the whole universe
+        start = self.get_min_trade_entry()
+        calendar_key = self.calendar_key
+        if calendar_key is None:
+            with self.metrics.stage('calendar'):
+                calendar_key = CoveyCalendar(start_date=start).business_dates
+        if self.price_key is None:
+            self.price_key = Pricer(start=start, symbols=self.get_symbols(), metrics=self.metrics,
+                                    **self.get_pricing_kwargs(calendar_key)).price_key
+
+        # fan out the per wallet portfolio math
+        portfolios = {}
+        trading_keys = {}
+        with self.metrics.stage('portfolio_loop'), \
+                ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker,
+                                    initargs=(self.price_key, calendar_key, self.start_cash, self.ann_interest)) as executor:
+            futures = {executor.submit(_calculate_wallet, address, trades): address
+                       for address, trades in self.trades.items()}
+            for future, address in futures.items():
+                try:
+                    _, portfolio, trading_key = future.result()
+                    portfolios[address] = portfolio
+                    trading_keys[address] = trading_key
+                except Exception as e:
+                    print("Could not calculate the portfolio for {}: {}".format(address, e))
+                    self.failed.append(address)
+        self.metrics.count('failed_wallets', len(self.failed))
+
+        if len(portfolios) > 0:
+            # stack the results keyed by address
+            self.portfolio = pd.concat(portfolios, names=['address', 'date_time'])
+            self.trading_key = pd.concat(trading_keys.values()).reset_index()
+
+        return 0
+
+    # export with the columnar exporter (one partition per address) if there is one, to csv otherwise
+    def export_output(self, key: str = 'portfolio'):
+        if self.exporter is None:
+            self.export_to_csv(key)
+        elif key == 'portfolio' and len(self.portfolio.index) > 0:
+            for address, df in self.portfolio.groupby(level='address'):
+                self.exporter.write('portfolio', df.droplevel('address').rename_axis('date_time'), address=address)
+        elif key == 'trading' and len(self.trading_key.index) > 0:
+            # same address partitions as the portfolios - the ledger address may come in a different case
+            for address in self.portfolio.index.get_level_values('address').unique():
+                df = self.trading_key[self.trading_key['address'].str.lower() == address.lower()]
+                self.exporter.write('trading_key', df.set_index('trade_id'), address=address)
+        elif key == 'price' and self.price_key is not None:
+            # written once for all the wallets - Exporter.load_portfolio takes each wallet's symbols out of it
+            self.exporter.write_price_key(self.price_key, key='universe_price_key')
+
+    # export to csv
+    def export_to_csv(self, key: str = 'portfolio'):
+        if key == 'portfolio':
+            self.portfolio.to_csv(get_output('portfolio_universe.csv'))
+        elif key == 'trading':
+            self.trading_key.to_csv(get_output('trading_key_universe.csv'), index=False)
+        elif key == 'price' and self.price_key is not None:
+            self.price_key.bars.to_csv(get_output('price_key_universe.csv'))
+
+
+if __name__ == '__main__':
+    # start the timer
+    start_time = time.time()
+
+    # score every wallet in the wallet csvs
+    b = PortfolioBatch()
+    b.calculate_portfolios()
+    b.export_output('portfolio')
+    b.export_output('trading')
+    b.export_output('price')
+
+    print(b.metrics.report())
+
+    print("---{} portfolios finished in {} seconds, {} failed ---".format(len(b.addresses), time.time() - start_time, len(b.failed)))
@@ -0,0 +1,397 @@
+import io
+import sys
+import json
+import time
+import tempfile
+import tracemalloc
+import numpy as np
+import pandas as pd
+from types import SimpleNamespace
+from contextlib import contextmanager, redirect_stdout
+from alpaca.trading.enums import AssetStatus
+from alpaca.trading.models import Calendar
+
+# # covey libraries - internal test
+# from utils import get_output
+# from covey_trade import Trade
+# from covey_pricer import Pricer
+# from covey_cache import BarCache
+# from covey_metrics import Metrics
+# from covey_universe import Universe
+# from covey_portfolio import Portfolio
+# from covey_calendar import CoveyCalendar
+
+# covey libraries - packaging
+from covey import get_output
+from covey.covey_trade import Trade
+from covey.covey_pricer import Pricer
+from covey.covey_cache import BarCache
+from covey.covey_metrics import Metrics
+from covey.covey_universe import Universe
+from covey.covey_portfolio import Portfolio
+from covey.covey_calendar import CoveyCalendar
+
+
+# reproducible ledger, hourly bars, exchange calendar and asset list for a number of wallets, posts, symbols and
+# days - the same seed always gives the same market
+class SyntheticMarket:
+    def __init__(self, **kwargs):
+        # scale - wallets, posts per wallet, symbols and calendar days
+        self.wallets = kwargs.get('wallets', 10)
+        self.trades = kwargs.get('trades', 100)
+        self.symbols = kwargs.get('symbols', 40)
+        self.days = kwargs.get('days', 90)
+
+        # first calendar day
+        self.start = pd.Timestamp(kwargs.get('start', '2022-01-03'))
+
+        # share of the symbols that are crypto (posted as XXXUSDT, traded around the clock)
+        self.crypto_share = kwargs.get('crypto_share', 0.1)
+
+        # positions per post (1 to max positions), share of covey-reset posts and of positions in unlisted symbols
+        self.max_positions = kwargs.get('max_positions', 3)
+        self.reset_share = kwargs.get('reset_share', 0.01)
+        self.unlisted_share = kwargs.get('unlisted_share', 0.02)
+
+        self.seed = kwargs.get('seed', 0)
+        self.rng = np.random.default_rng(self.seed)
+
+        self.end = self.start + pd.Timedelta(days=self.days - 1)
+
+        # equities as XAAA, XAAB... crypto as CAAAUSD, CAABUSD... (the way the trades have them once cleaned up)
+        crypto = int(round(self.symbols * self.crypto_share))
+        self.equity_symbols = ['X' + self.get_letters(i) for i in range(self.symbols - crypto)]
+        self.crypto_symbols = ['C' + self.get_letters(i) + 'USD' for i in range(crypto)]
+
+        self.addresses = ['0x' + ''.join(self.rng.choice(list('0123456789abcdef'), 40)) for _ in range(self.wallets)]
+        self.business_dates = pd.bdate_range(self.start, self.end)
+
+        self.bars = self.get_bars()
+        self.ledger = self.get_ledger()
+
+    # scale as a dict and as a key (i.e. for the baselines)
+    @property
+    def scale(self):
+        return {'wallets': self.wallets, 'trades': self.trades, 'symbols': self.symbols, 'days': self.days, 'seed': self.seed}
+
+    @property
+    def scale_key(self):
+        return 'w{wallets}-t{trades}-s{symbols}-d{days}-seed{seed}'.format(**self.scale)
+
+    # AAA, AAB, AAC...
+    @staticmethod
+    def get_letters(i):
+        return ''.join(chr(65 + (i // 26 ** p) % 26) for p in (2, 1, 0))
+
+    # hourly bars in the alpaca bars df format (symbol, timestamp (utc) index) - equities 13:00 to 20:00 utc on
+    # business days, crypto every hour
+    def get_bars(self):
+        equity_hours = (self.business_dates.repeat(8) + pd.to_timedelta(np.tile(np.arange(13, 21), len(self.business_dates)), unit='h'))
+        crypto_hours = pd.date_range(self.start, self.end + pd.Timedelta(hours=23), freq='h')
+
+        frames = []
+        for symbols, hours in ((self.equity_symbols, equity_hours), (self.crypto_symbols, crypto_hours)):
+            if len(symbols) < 1:
+                continue
+            # one random walk per symbol
+            steps = self.rng.normal(0, 0.01, (len(symbols), len(hours)))
+            vwap = self.rng.uniform(10, 500, (len(symbols), 1)) * np.exp(np.cumsum(steps, axis=1))
+            frames.append(pd.DataFrame({'symbol': np.repeat(symbols, len(hours)),
+                                        'timestamp': np.tile(hours.tz_localize('UTC'), len(symbols)),
+                                        'vwap': vwap.ravel()}))
+
+        bars = pd.concat(frames, ignore_index=True)
+        bars['open'] = bars['vwap'] * (1 + self.rng.normal(0, 0.002, len(bars.index)))
+        bars['high'] = bars[['open', 'vwap']].max(axis=1) * 1.003
+        bars['low'] = bars[['open', 'vwap']].min(axis=1) * 0.997
+        bars['close'] = bars['vwap'] * (1 + self.rng.normal(0, 0.002, len(bars.index)))
+        bars['volume'] = self.rng.integers(100, 100000, len(bars.index)).astype('float64')
+        bars['trade_count'] = self.rng.integers(1, 1000, len(bars.index)).astype('float64')
+        return bars.set_index(['symbol', 'timestamp'])[['open', 'high', 'low', 'close', 'volume', 'trade_count', 'vwap']]
+
+    # ledger rows (address, trades, entry_date_time (unix)) - posts spread over the whole range, any time of day
+    def get_ledger(self):
+        posted = [s + 'T' for s in self.crypto_symbols] + self.equity_symbols
+        posts = self.wallets * self.trades
+
+        positions = self.rng.integers(1, self.max_positions + 1, posts)
+        symbols = self.rng.choice(posted, positions.sum()).astype(object)
+        symbols[self.rng.random(len(symbols)) < self.unlisted_share] = 'ZZZZ'
+        targets = np.round(self.rng.uniform(-0.3, 0.3, len(symbols)), 2)
+        cells = ['{}:{}'.format(s, t) for s, t in zip(symbols, targets)]
+
+        bounds = np.concatenate([[0], np.cumsum(positions)])
+        strings = np.array([','.join(cells[bounds[i]:bounds[i + 1]]) for i in range(posts)], dtype=object)
+        strings[self.rng.random(posts) < self.reset_share] = 'covey-reset'
+
+        # leave the last couple of days for the trades to get priced
+        first = int(self.start.timestamp())
+        entries = self.rng.integers(first, first + max(self.days - 3, 1) * 86400, posts)
+
+        return pd.DataFrame({'address': np.repeat(self.addresses, self.trades), 'trades': strings,
+                             'entry_date_time': entries})
+
+    # exchange calendar as alpaca sends it - business days only (no holidays), 09:30 to 16:00 (new york)
+    def get_calendar(self, start, end=None):
+        dates = self.business_dates[(self.business_dates >= pd.Timestamp(start)) &
+                                    (self.business_dates <= pd.Timestamp(end if end is not None else self.end))]
+        return [Calendar(date=d.strftime('%Y-%m-%d'), open='09:30', close='16:00') for d in dates]
+
+    # active alpaca assets - crypto as XXX/USD like alpaca has them, ZZZZ isn't listed
+    def get_assets(self):
+        return [SimpleNamespace(symbol=s, tradable=True, status=AssetStatus.ACTIVE)
+                for s in self.equity_symbols + [c[:-3] + '/USD' for c in self.crypto_symbols]]
+
+
+# bars response - the bars df plus a non empty data dict when there are bars
+class StubBarSet:
+    def __init__(self, df):
+        self.df = df
+        self.data = {s: [] for s in df.index.get_level_values('symbol').unique()} if len(df.index) > 0 else {}
+
+
+# StockHistoricalDataClient stand in - serves the synthetic bars between the request start and end, daily bars
+# (stamped at midnight new york) and minute bars (the hour's bar every minute) made from the hourly ones
+class StubStockClient:
+    def __init__(self, market):
+        self.market = market
+        self.calls = 0
+
+    def get_bars(self, symbols, start, end, timeframe=None):
+        self.calls += 1
+        symbols = [symbols] if isinstance(symbols, str) else list(symbols)
+        df = self.market.bars[self.market.bars.index.get_level_values('symbol').isin(symbols)]
+        timestamps = df.index.get_level_values('timestamp')
+        mask = timestamps >= pd.Timestamp(start).tz_localize('UTC')
+        if end is not None:
+            mask &= timestamps < pd.Timestamp(end).tz_localize('UTC')
+        df = df[mask]
+
+        unit = None if timeframe is None else timeframe.unit.value
+        if unit == 'Day' and len(df.index) > 0:
+            df = df.reset_index()
+            df['timestamp'] = df['timestamp'].dt.normalize() + pd.Timedelta(hours=5)
+            df = df.groupby(['symbol', 'timestamp']).agg({'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last',
+                                                          'volume': 'sum', 'trade_count': 'sum', 'vwap': 'mean'})
+        elif unit == 'Min' and len(df.index) > 0:
+            df = df.loc[df.index.repeat(60)].reset_index()
+            df['timestamp'] = df['timestamp'] + pd.to_timedelta(np.tile(np.arange(60), len(df.index) // 60), unit='m')
+            df = df.set_index(['symbol', 'timestamp'])
+        return df
+
+    def get_stock_bars(self, request_params):
+        return StubBarSet(self.get_bars(request_params.symbol_or_symbols, request_params.start, request_params.end,
+                                        request_params.timeframe))
+
+
+# CryptoHistoricalDataClient stand in - same bars, XXX/USD symbols
+class StubCryptoClient(StubStockClient):
+    def get_crypto_bars(self, request_params):
+        symbols = request_params.symbol_or_symbols
+        symbols = [symbols] if isinstance(symbols, str) else list(symbols)
+        df = self.get_bars([s.replace('/', '') for s in symbols], request_params.start, request_params.end,
+                           request_params.timeframe)
+        return StubBarSet(df.rename(index=lambda s: s[:-3] + '/USD', level='symbol'))
+
+
+# TradingClient stand in - asset list and exchange calendar
+class StubTradingClient:
+    def __init__(self, market):
+        self.market = market
+        self.calls = 0
+
+    def get_all_assets(self, filter=None):
+        self.calls += 1
+        return self.market.get_assets()
+
+    def get_calendar(self, filters=None):
+        self.calls += 1
+        return self.market.get_calendar(filters.start, filters.end)
+
+
+# covey client stand in - the covey ledger contract's getAnalystContent(address).call() from the synthetic ledger
+class StubChainClient:
+    def __init__(self, market):
+        self.market = market
+        self.calls = 0
+        self.content = {a.lower(): list(df[['address', 'trades', 'entry_date_time']].itertuples(index=False, name=None))
+                        for a, df in market.ledger.groupby('address')}
+        self.covey_ledger = SimpleNamespace(functions=SimpleNamespace(getAnalystContent=self.get_analyst_content))
+
+    def get_analyst_content(self, address):
+        self.calls += 1
+        return SimpleNamespace(call=lambda: self.content.get(address.lower(), []))
+
+
+# runs the Trade -> Pricer -> Portfolio pipeline on a synthetic market with the stub clients (no network, caches
+# in a temporary folder) and records the wall time and peak memory of every stage
+class Benchmark:
+    def __init__(self, **kwargs):
+        # the market to run on - the default scale otherwise
+        self.market = kwargs.get('market', None)
+        if self.market is None:
+            self.market = SyntheticMarket()
+
+        # peak memory per stage (tracemalloc) - measured in a second run as tracing slows everything down ~10x
+        self.memory = kwargs.get('memory', True)
+
+        # hide what the pipeline prints along the way
+        self.quiet = kwargs.get('quiet', True)
+
+        # stage -> seconds and peak_mb, plus the pipeline's own metrics (of the timed run)
+        self.stages = {}
+        self.metrics = Metrics()
+
+    # seconds of the stage, or its peak memory on top of what was allocated before when tracing
+    @contextmanager
+    def stage(self, name):
+        stage = self.stages.setdefault(name, {})
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            try:
+                yield
+            finally:
+                stage['peak_mb'] = (tracemalloc.get_traced_memory()[1] - current) / 2 ** 20
+        else:
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                stage['seconds'] = time.perf_counter() - start
+
+    # same steps as covey_batch.PortfolioBatch, with the wallets in this process
+    def run_pipeline(self, root):
+        market = self.market
+        chain_client = StubChainClient(market)
+        trading_client = StubTradingClient(market)
+        stock_client = StubStockClient(market)
+        crypto_client = StubCryptoClient(market)
+
+        with self.stage('universe'):
+            universe = Universe(path=root + '/universe.pkl', trading_client=trading_client).symbols
+
+        with self.stage('trades'):
+            trades = {a: Trade(address=a, client=chain_client, universe=universe, pricing=False, metrics=self.metrics).trades
+                      for a in market.addresses}
+
+        start = min(t['entry_date_time'].min() for t in trades.values()).strftime('%Y-%m-%d')
+        symbols = sorted(set(s for t in trades.values() for s in t['symbol'].unique()))
+
+        with self.stage('calendar'):
+            calendar_key = CoveyCalendar(start_date=start, path=root + '/calendar.pkl',
+                                         trading_client=trading_client).business_dates
+
+        with self.stage('prices'):
+            price_key = Pricer(start=start, end=market.end.strftime('%Y-%m-%d'), symbols=symbols,
+                               stock_client=stock_client, crypto_client=crypto_client,
+                               bar_cache=BarCache(root=root + '/bars'), metrics=self.metrics).price_key
+
+        portfolios = {}
+        with self.stage('portfolios'):
+            for address, wallet_trades in trades.items():
+                p = Portfolio(address=address, trades=wallet_trades, client=chain_client,
+                              price_key=price_key.subset(wallet_trades['symbol'].unique()),
+                              calendar_key=calendar_key, export=False, metrics=self.metrics)
+                p.calculate_portfolio()
+                portfolios[address] = p.portfolio
+
+        self.metrics.gauge('stub_calls', chain_client.calls + trading_client.calls + stock_client.calls + crypto_client.calls)
+        return portfolios
+
+    # one pipeline run from scratch - fresh caches in a temporary folder
+    def run_once(self):
+        with tempfile.TemporaryDirectory() as root, redirect_stdout(io.StringIO() if self.quiet else sys.stdout):
+            return self.run_pipeline(root)
+
+    # stage timings and memory, the pipeline metrics and the scale - json friendly
+    def run(self):
+        self.stages = {}
+        self.metrics = Metrics()
+        portfolios = self.run_once()
+
+        if self.memory:
+            metrics = self.metrics
+            tracemalloc.start()
+            try:
+                self.run_once()
+            finally:
+                tracemalloc.stop()
+                self.metrics = metrics
+
+        return {'scale': self.market.scale, 'memory': self.memory, 'stages': self.stages,
+                'metrics': self.metrics.to_dict(), 'portfolios': len(portfolios),
+                'final_usd_value': float(sum(p['usd_value'].iloc[-1] for p in portfolios.values()))}
+
+
+# stages that got slower (or bigger) than the baseline by more than the tolerance - small absolute differences
+# (min seconds / min mb) are noise and don't count
+def compare(results, baseline, tolerance=1.25, min_seconds=0.05, min_mb=1.0):
+    regressions = []
+    for name, stage in results['stages'].items():
+        base = baseline['stages'].get(name)
+        if base is None:
+            continue
+        if stage['seconds'] > base['seconds'] * tolerance and stage['seconds'] - base['seconds'] > min_seconds:
+            regressions.append('{} {:.3f}s vs {:.3f}s'.format(name, stage['seconds'], base['seconds']))
+        if ('peak_mb' in stage and 'peak_mb' in base and stage['peak_mb'] > base['peak_mb'] * tolerance
+                and stage['peak_mb'] - base['peak_mb'] > min_mb):
+            regressions.append('{} {:.1f}mb vs {:.1f}mb'.format(name, stage['peak_mb'], base['peak_mb']))
+    return regressions
+
+
+# baselines per scale key in one json file
+def load_baseline(scale_key, path=None):
+    path = get_output('benchmark_baseline.json') if path is None else path
+    try:
+        with open(path) as f:
+            return json.load(f).get(scale_key)
+    except FileNotFoundError:
+        return None
+
+
+def save_baseline(scale_key, results, path=None):
+    path = get_output('benchmark_baseline.json') if path is None else path
+    try:
+        with open(path) as f:
+            baselines = json.load(f)
+    except FileNotFoundError:
+        baselines = {}
+    baselines[scale_key] = results
+    with open(path, 'w') as f:
+        json.dump(baselines, f, indent=2, default=str)
+
+
+if __name__ == '__main__':
+    # benchmark : python -m covey.covey_benchmark <wallets> <posts per wallet> <symbols> <days> [save]
+    # compares every stage against the stored baseline of the same scale, save stores this run as the baseline
+    # fails if a stage got more than 25% slower or bigger than the baseline
+    wallets = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    trades = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    symbols = int(sys.argv[3]) if len(sys.argv) > 3 else 40
+    days = int(sys.argv[4]) if len(sys.argv) > 4 else 90
+    save = 'save' in sys.argv[5:]
+
+    # start the timer
+    start_time = time.time()
+
+    market = SyntheticMarket(wallets=wallets, trades=trades, symbols=symbols, days=days)
+    results = Benchmark(market=market).run()
+
+    for name, stage in results['stages'].items():
+        print('{:<12} {:>8.3f}s {:>8.1f}mb'.format(name, stage['seconds'], stage.get('peak_mb', float('nan'))))
+
+    baseline = load_baseline(market.scale_key)
+    regressions = [] if baseline is None else compare(results, baseline)
+    if baseline is None:
+        print("---No baseline for {} yet ---".format(market.scale_key))
+    elif len(regressions) > 0:
+        print("---Slower than the baseline : {} ---".format(', '.join(regressions)))
+
+    if save:
+        save_baseline(market.scale_key, results)
+        print("---Saved as the baseline for {} ---".format(market.scale_key))
+
+    print("---Benchmark {} finished in {} seconds ---".format(market.scale_key, time.time() - start_time))
+
+    sys.exit(1 if len(regressions) > 0 else 0)
@@ -0,0 +1,99 @@
+import os
+import json
+import pandas as pd
+from datetime import datetime, timedelta
+
+# # covey libraries - internal test
+# from utils import get_output
+
+# covey libraries - packaging
+from covey import get_output
+
+
+# local bar cache - one pickle per symbol and month plus the list of day ranges already downloaded
+class BarCache:
+    def __init__(self, **kwargs):
+        # cache folder - in the output folder by default
+        self.root = kwargs.get('root', get_output('bars'))
+
+        # how long after midnight (UTC) the previous day's bars are considered final
+        self.settle = kwargs.get('settle', timedelta(hours=1))
+
+    # folder per timeframe and symbol - crypto symbols come in as ETH/USD
+    def get_symbol_path(self, timeframe, symbol):
+        return os.path.join(self.root, str(timeframe), symbol.replace('/', '_'))
+
+    # day ranges (inclusive) already downloaded for the symbol
+    def get_coverage(self, timeframe, symbol):
+        path = os.path.join(self.get_symbol_path(timeframe, symbol), 'coverage.json')
+        if not os.path.exists(path):
+            return []
+        with open(path) as f:
+            return [[datetime.strptime(s, '%Y-%m-%d').date(), datetime.strptime(e, '%Y-%m-%d').date()]
+                    for s, e in json.load(f)]
+
+    # record a downloaded day range - merged with the overlapping and adjacent ranges
+    def set_coverage(self, timeframe, symbol, start, end):
+        ranges = sorted(self.get_coverage(timeframe, symbol) + [[start, end]])
+        merged = [ranges[0]]
+        for s, e in ranges[1:]:
+            if s <= merged[-1][1] + timedelta(days=1):
+                merged[-1][1] = max(merged[-1][1], e)
+            else:
+                merged.append([s, e])
+
+        os.makedirs(self.get_symbol_path(timeframe, symbol), exist_ok=True)
+        with open(os.path.join(self.get_symbol_path(timeframe, symbol), 'coverage.json'), 'w') as f:
+            json.dump([[s.isoformat(), e.isoformat()] for s, e in merged], f)
+
+    # day ranges between start and end (inclusive dates) that still need to be downloaded
+    def get_missing(self, timeframe, symbol, start, end):
+        missing = []
+        current = start
+        for s, e in self.get_coverage(timeframe, symbol):
+            if e < current:
+                continue
+            if s > end:
+                break
+            if s > current:
+                missing.append((current, s - timedelta(days=1)))
+            current = e + timedelta(days=1)
+        if current <= end:
+            missing.append((current, end))
+        return missing
+
+    # cached bars for the symbols between start and end (inclusive dates) - same index as the alpaca bars df
+    def read(self, timeframe, symbols, start, end):
+        frames = []
+        months = pd.period_range(start, end, freq='M')
+        for symbol in symbols:
+            for month in months:
+                path = os.path.join(self.get_symbol_path(timeframe, symbol), '{}.pkl'.format(month))
+                if os.path.exists(path):
+                    frames.append(pd.read_pickle(path))
+
+        if len(frames) < 1:
+            return pd.DataFrame()
+
+        bars_df = pd.concat(frames)
+        timestamps = bars_df.index.get_level_values('timestamp').tz_convert(None)
+        mask = (timestamps >= pd.Timestamp(start)) & (timestamps < pd.Timestamp(end) + timedelta(days=1))
+        return bars_df[mask].copy()
+
+    # store freshly downloaded bars and record the range as covered - the still open current day (UTC) is
+    # stored but never marked covered so it gets downloaded again on the next run
+    def write(self, timeframe, bars_df, symbols, start, end):
+        if len(bars_df.index) > 0:
+            months = bars_df.index.get_level_values('timestamp').tz_convert(None).to_period('M')
+            for (symbol, month), df in bars_df.groupby([bars_df.index.get_level_values('symbol'), months]):
+                path = os.path.join(self.get_symbol_path(timeframe, symbol), '{}.pkl'.format(month))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if os.path.exists(path):
+                    df = pd.concat([pd.read_pickle(path), df])
+                    df = df[~df.index.duplicated(keep='last')]
+                df.sort_index().to_pickle(path)
+
+        last_closed_day = min(end, (datetime.utcnow() - self.settle).date() - timedelta(days=1))
+        if start <= last_closed_day:
+            for symbol in symbols:
+                self.set_coverage(timeframe, symbol, start, last_closed_day)
@@ -1,12 +1,22 @@
 import pytz
 import os
 import time
+import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 from alpaca.trading.client import TradingClient
 from alpaca.trading.requests import GetCalendarRequest
 
+# # covey libraries - internal test
+# from utils import get_output
+
+# covey libraries - packaging
+from covey import get_output
+
+# exchange calendars per cache file (date, next_market_open, next_market_close) - shared by every CoveyCalendar
+# in the process so the alpaca calendar is only fetched when the requested range isn't covered yet
+_calendars = {}
 
 
 class CoveyCalendar:
@@ -17,30 +27,73 @@ class CoveyCalendar:
         # get the start date, default to 3 years ago
         self.start_date = kwargs.get('start_date', (datetime.now() - timedelta(days=3*365)).strftime('%Y-%m-%d'))
 
-        # get the end date, default to today
-        self.end_date = kwargs.get('end_date', datetime.now().strftime('%Y-%m-%d'))
+        # exchange calendar cache file - in the output folder by default
+        self.path = kwargs.get('path', get_output('calendar.pkl'))
 
-        # # initialize the alpaca rest api if it is not provided
-        # self.alpaca_api = kwargs.get('alpaca_api', REST())
-        # create and fill the dates data frame
-        # initialize the trading client
-        self.trading_client = TradingClient(api_key=os.environ.get('APCA_API_KEY_ID'), 
-                                            secret_key=os.environ.get('APCA_API_SECRET_KEY'))
+        # how long before the calendar gets extended with newly published business days
+        self.max_age = kwargs.get('max_age', timedelta(days=1))
+
+        # alpaca trading client - only created when the calendar has to be fetched
+        self.trading_client = kwargs.get('trading_client', None)
 
         self.business_dates = self.set_business_dates()
 
+    # alpaca calendar from the start date (to the end date if provided) - one call for both opens and closes
+    def fetch_calendar(self, start, end=None):
+        if self.trading_client is None:
+            self.trading_client = TradingClient(api_key=os.environ.get('APCA_API_KEY_ID'),
+                                                secret_key=os.environ.get('APCA_API_SECRET_KEY'))
+
+        filters = GetCalendarRequest(start=start) if end is None else GetCalendarRequest(start=start, end=end)
+        calendar = self.trading_client.get_calendar(filters=filters)
+        df = pd.DataFrame({'next_market_open': [x.open.astimezone(pytz.utc).replace(tzinfo=None) for x in calendar],
+                           'next_market_close': [x.close.astimezone(pytz.utc).replace(tzinfo=None) for x in calendar]},
+                          columns=['next_market_open', 'next_market_close'])
+        df['date'] = pd.to_datetime(df['next_market_open']).dt.normalize()
+        return df
+
+    # the exchange calendar from the start date through the latest published business day (so today's trades still get
+    # their next business days) - from memory or disk, only fetching what is missing (dates before the cached ones,
+    # newly published days once the cache is older than max age)
+    def get_calendar(self):
+        start = pd.Timestamp(self.start_date).normalize()
+
+        cached = _calendars.get(self.path)
+        if cached is None and os.path.exists(self.path):
+            cached = pd.read_pickle(self.path)
+
+        frames = []
+        if cached is None:
+            cached = {'start': start, 'fetched_at': datetime.utcnow(), 'calendar': self.fetch_calendar(start.date())}
+            frames.append(cached['calendar'])
+        else:
+            if start < cached['start']:
+                frames.append(self.fetch_calendar(start.date(), (cached['start'] - timedelta(days=1)).date()))
+                cached['start'] = start
+            if datetime.utcnow() - cached['fetched_at'] > self.max_age:
+                frames.append(self.fetch_calendar((cached['calendar']['date'].max() + timedelta(days=1)).date()))
+                cached['fetched_at'] = datetime.utcnow()
+
+        # persist whenever something was fetched
+        if len(frames) > 0:
+            cached['calendar'] = pd.concat([cached['calendar']] + frames).drop_duplicates('date').sort_values('date').reset_index(drop=True)
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            pd.to_pickle(cached, self.path)
+
+        _calendars[self.path] = cached
+
+        return cached['calendar'][cached['calendar']['date'] >= start]
+
+    # business date columns (next_market_open, next_market_close, next_market_open_t_plus_1, ...) for the date of
+    # each timestamp
+    def lookup(self, timestamps, columns=None):
+        return lookup_business_dates(self.business_dates, timestamps, columns)
+
     def set_business_dates(self):
         # alpaca calendar to denote business days
         # the format comes in as date and time so we combine them
         # we are pulling the next available business open and close date time
-
-        delayed_trade_date_time_df = pd.DataFrame(
-            {
-                'next_market_open': [x.open.astimezone(pytz.utc).replace(tzinfo=None) for x in 
-                                        self.trading_client.get_calendar(filters = GetCalendarRequest(start = self.start_date))],
-                'next_market_close': [x.close.astimezone(pytz.utc).replace(tzinfo=None) for x in 
-                                        self.trading_client.get_calendar(filters = GetCalendarRequest(start = self.start_date))]
-            })
+        delayed_trade_date_time_df = self.get_calendar()[['next_market_open', 'next_market_close']].reset_index(drop=True)
 
         # agnostic date range of all days between min trade key date and max alpaca business date
         date_df = pd.DataFrame({'date': pd.date_range(start=self.start_date,
@@ -77,6 +130,15 @@ class CoveyCalendar:
         return bus_date_key_df
 
 
+# vectorized business date lookup on a business dates table (CoveyCalendar.business_dates or a shared calendar key)
+# - one row per timestamp, nan for dates outside of the table
+def lookup_business_dates(business_dates, timestamps, columns=None):
+    df = business_dates.drop_duplicates('date').set_index('date')
+    df = df if columns is None else df[columns]
+    dates = pd.to_datetime(pd.Series(np.asarray(timestamps))).dt.normalize()
+    return df.reindex(dates).reset_index(drop=True)
+
+
 if __name__ == '__main__':
     start_time = time.time()
 
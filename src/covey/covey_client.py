@@ -0,0 +1,96 @@
+import os
+import json
+import time
+import threading
+import requests
+from web3 import Web3
+from requests.adapters import HTTPAdapter
+from web3.middleware import geth_poa_middleware
+
+# covey ledger abi - read once per process
+_abi = None
+
+# shared clients per (polygon url, covey ledger address)
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+# the covey ledger abi - from the pre-extracted CoveyLedger.abi.json, the full CoveyLedger.json build file otherwise
+def get_abi():
+    global _abi
+    if _abi is None:
+        path = os.path.join(os.path.dirname(__file__), 'CoveyLedger.abi.json')
+        if os.path.exists(path):
+            with open(path) as f:
+                _abi = json.load(f)
+        else:
+            with open(os.path.join(os.path.dirname(__file__), 'CoveyLedger.json')) as f:
+                _abi = json.load(f)['abi']
+    return _abi
+
+
+# one keep-alive http session, web3 provider and covey ledger contract per node - shared by every Trade, Ledger,
+# LedgerIndexer and Poster in the process through get_client
+class CoveyClient:
+    def __init__(self, **kwargs):
+        # VARIABLE : polygon url
+        self.polygon_url = kwargs.get('POLYGON_URL', 'https://polygon-rpc.com/')
+
+        # VARIABLE : covey ledger address (polygon)
+        self.covey_ledger_polygon_address = kwargs.get('covey_ledger_polygon_address', '0x587Ec5a7a3F2DE881B15776BC7aaD97AA44862Be')
+
+        # connections kept open to the node - enough for every posting / reading thread
+        self.pool_size = kwargs.get('pool_size', 16)
+
+        # seconds before a node request gives up
+        self.timeout = kwargs.get('timeout', 30)
+
+        # keep-alive http session
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        # web3 connection - pass one in to use another chain (i.e. a local dev chain or a recorded stand in)
+        self.w3 = kwargs.get('w3', None)
+        if self.w3 is None:
+            self.w3 = Web3(Web3.HTTPProvider(self.polygon_url, request_kwargs={'timeout': self.timeout}, session=self.session))
+            self.w3.middleware_onion.inject(geth_poa_middleware, layer=0)
+
+        self.covey_ledger = self.w3.eth.contract(address=self.covey_ledger_polygon_address, abi=get_abi())
+
+    # json-rpc batch - calls is a list of (method, params), returns the results in the same order (None for errors)
+    def batch(self, calls):
+        if len(calls) < 1:
+            return []
+
+        response = self.session.post(self.polygon_url, timeout=self.timeout,
+                                     json=[{'jsonrpc': '2.0', 'id': i, 'method': method, 'params': params}
+                                           for i, (method, params) in enumerate(calls)])
+        response.raise_for_status()
+        results = {r.get('id'): r.get('result') for r in response.json()}
+        return [results.get(i) for i in range(len(calls))]
+
+
+# shared client for the node and ledger address - created on first use
+def get_client(**kwargs):
+    key = (kwargs.get('POLYGON_URL', 'https://polygon-rpc.com/'),
+           kwargs.get('covey_ledger_polygon_address', '0x587Ec5a7a3F2DE881B15776BC7aaD97AA44862Be'))
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = CoveyClient(**kwargs)
+        return _clients[key]
+
+
+if __name__ == '__main__':
+    # start the timer
+    start_time = time.time()
+
+    c = get_client()
+    print(c.batch([('eth_blockNumber', []), ('eth_gasPrice', [])]))
+
+    # second client comes out of the cache
+    cache_time = time.time()
+    get_client()
+
+    print("---Client in {} seconds, cached in {} seconds ---".format(cache_time - start_time, time.time() - cache_time))
@@ -0,0 +1,76 @@
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+
+# buffers data frame chunks (i.e. bars per symbol and segment) and builds the final frame in one go
+# instead of growing a frame with pd.concat per chunk, which copies everything collected so far each time
+class ChunkCollector:
+    def __init__(self, **kwargs):
+        # columns of the final frame
+        self.columns = kwargs.get('columns', [])
+
+        # pre-declared dtypes per column
+        self.dtypes = kwargs.get('dtypes', {})
+
+        # index columns of the final frame (i.e. symbol, timestamp) - None keeps the chunk index
+        self.index = kwargs.get('index', None)
+
+        # collected chunks and row count
+        self.chunks = []
+        self.rows = 0
+
+    # add a chunk - empty chunks are skipped
+    def append(self, df):
+        if df is not None and len(df.index) > 0:
+            self.chunks.append(df)
+            self.rows += len(df.index)
+
+    # the final frame - one concat over all the chunks
+    def to_frame(self):
+        if len(self.chunks) < 1:
+            df = pd.DataFrame({c: pd.Series(dtype=self.dtypes.get(c, object)) for c in self.columns})
+            if self.index is not None:
+                df.set_index(self.index, inplace=True)
+            return df
+
+        df = pd.concat(self.chunks, copy=False)
+
+        # the declared dtypes for the value columns we have
+        dtypes = {c: t for c, t in self.dtypes.items() if c in df.columns and df[c].dtype != t}
+        if len(dtypes) > 0:
+            df = df.astype(dtypes, copy=False)
+
+        return df
+
+
+if __name__ == '__main__':
+    # benchmark : symbols x segments chunks of hourly bars, per chunk concat vs collector
+    # python -m covey.covey_collector <symbols> <segments> <rows per chunk>
+    # 500 x 24 x 20 : collector ~5 seconds, per chunk concat ~200 seconds (the per chunk concat grows quadratically)
+    symbols = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    segments = int(sys.argv[2]) if len(sys.argv) > 2 else 24
+    rows = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+    columns = ['vwap', 'open', 'high', 'low', 'close', 'volume', 'trade_count']
+    chunks = []
+    for s in range(symbols):
+        for m in range(segments):
+            index = pd.MultiIndex.from_arrays([np.repeat('S{}'.format(s), rows),
+                                               pd.date_range('2021-01-01', periods=rows, freq='h') + pd.DateOffset(months=m)],
+                                              names=['symbol', 'timestamp'])
+            chunks.append(pd.DataFrame(np.random.rand(rows, len(columns)), index=index, columns=columns))
+
+    start_time = time.time()
+    collector = ChunkCollector(columns=columns, dtypes={c: 'float64' for c in columns})
+    for chunk in chunks:
+        collector.append(chunk)
+    collected = collector.to_frame()
+    print("collector : {} rows in {} seconds".format(len(collected.index), time.time() - start_time))
+
+    start_time = time.time()
+    prices = pd.DataFrame(columns=columns)
+    for chunk in chunks:
+        prices = pd.concat([prices, chunk])
+    print("per chunk concat : {} rows in {} seconds".format(len(prices.index), time.time() - start_time))
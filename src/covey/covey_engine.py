@@ -0,0 +1,391 @@
+import numpy as np
+import pandas as pd
+from datetime import timedelta
+
+# # covey libraries - internal test
+# from covey_reference import load_reference, parse_dividend_split
+
+# covey libraries - packaging
+from covey.covey_reference import load_reference, parse_dividend_split
+
+
+# open positions book - the latest trades per symbol (by entry date time, ties kept) among the trades entered so far,
+# kept up to date as trades enter so the positions as of a date are a read of the open positions, not a trading key scan
+class PositionBook:
+    def __init__(self, symbols, entry_date_time, market_entry, trade_ids=None):
+        # trades by row position - symbols (or symbol codes) key the book
+        self.symbols = np.asarray(symbols)
+        self.trade_ids = np.arange(len(self.symbols)) if trade_ids is None else np.asarray(trade_ids)
+        self.entry_date_time = np.asarray(entry_date_time, dtype='datetime64[ns]')
+        self.market_entry = np.asarray(market_entry, dtype='datetime64[ns]')
+
+        # trades in market entry order - advance walks them once
+        self.order = np.argsort(self.market_entry, kind='stable')
+        self.reset()
+
+    # empty book
+    def reset(self):
+        self.latest_entry = {}
+        self.latest_trades = {}
+        self.pointer = 0
+        self.as_of = None
+
+    # a trade enters the book - replaces the symbol's older trades, joins the ones with the same entry date time
+    def enter(self, i):
+        symbol = self.symbols[i]
+        if symbol not in self.latest_entry or self.entry_date_time[i] > self.latest_entry[symbol]:
+            self.latest_entry[symbol] = self.entry_date_time[i]
+            self.latest_trades[symbol] = [i]
+        elif self.entry_date_time[i] == self.latest_entry[symbol]:
+            self.latest_trades[symbol].append(i)
+
+    # enter the trades with a market entry strictly before date - going back in time starts over
+    def advance(self, date):
+        date = pd.Timestamp(date).to_datetime64()
+        if self.as_of is not None and date < self.as_of:
+            self.reset()
+
+        bound = np.searchsorted(self.market_entry[self.order], date, side='left')
+        while self.pointer < bound:
+            self.enter(self.order[self.pointer])
+            self.pointer += 1
+        self.as_of = date
+
+    # row positions of the open positions' trades in row order
+    def get_rows(self, date=None):
+        if date is not None:
+            self.advance(date)
+        return np.sort(np.array([i for trades in self.latest_trades.values() for i in trades], dtype=int))
+
+    # trade ids of the open positions as of date (trades with a market entry strictly before it)
+    def get_trade_ids(self, date):
+        return self.trade_ids[self.get_rows(date)]
+
+
+# event driven portfolio engine - one pass over the trades and market closes using numpy arrays
+class PortfolioEngine:
+    def __init__(self, **kwargs):
+        # default start cash to 10000
+        self.start_cash = kwargs.get('start_cash', 10000)
+
+        # default annual interest to 0.2 %
+        self.ann_interest = kwargs.get('ann_interest', 0.02)
+
+        # trading fee applied on the gross traded usd
+        self.fee_rate = kwargs.get('fee_rate', 0.0005)
+
+        # dividend and split amounts per (payment_date, symbol) (see covey_reference.parse_dividend_split) - the cached
+        # packaged csv if not provided
+        self.corporate_actions = kwargs.get('corporate_actions', None)
+        if self.corporate_actions is None:
+            self.corporate_actions = load_reference('dividend_split.csv', parse_dividend_split)
+
+    # dividend or split amounts keyed by (portfolio row, symbol) - matched on the exact market close timestamp
+    def get_close_actions(self, closes, kind):
+        actions = self.corporate_actions[kind]
+        actions = actions[actions.index.get_level_values('payment_date').isin(closes)]
+
+        if len(actions.index) < 1:
+            return {}
+
+        days = closes.get_indexer(actions.index.get_level_values('payment_date'))
+        return dict(zip(zip(days.tolist(), actions.index.get_level_values('symbol')), actions.to_numpy()))
+
+    # price marks at each market close as a (closes x symbols) matrix - nan when the symbol wasn't priced
+    def get_price_marks(self, closes, symbols, price_key):
+        vwap = price_key.get_vwap(np.tile(symbols.to_numpy(dtype=object), len(closes)), np.repeat(closes.to_numpy(), len(symbols)))
+        return vwap.reshape(len(closes), len(symbols))
+
+    # positions carried over in a state (see get_state) in trade id order - none without a state
+    def get_carried(self, state):
+        if state is None:
+            return pd.DataFrame(columns=['trade_id', 'symbol', 'vwap', 'shares', 'current_position', 'entry_date_time',
+                                         'market_entry_date_time', 'last', 'active'])
+        return state['positions'].sort_values('trade_id', kind='stable')
+
+    # end of day state after the last market close - what an update run needs to carry on without the earlier
+    # trades : cash, portfolio value, inception return, realized pnl totals and the carried positions, being the
+    # latest trade per symbol (previous position lookups of new trades) and the active positions book (shares and
+    # entry vwap of the latest trades per symbol, marked at every close)
+    def get_state(self, close, cash, usd_value, inception_return, realized_long, realized_short, last_entry,
+                  positions, pending):
+        return {'date_time': close, 'cash': cash, 'usd_value': usd_value, 'inception_return': inception_return,
+                'realized_long': realized_long, 'realized_short': realized_short, 'last_entry': last_entry,
+                'positions': positions, 'pending': pending}
+
+    def run(self, portfolio, trading_key, price_key, state=None):
+        """
+        Evaluates the portfolio at every market close in the portfolio index and fills in the
+        trade level metrics of the trading key.
+
+        Produces the same portfolio and trading key as the row by row Portfolio.evaluate_portfolio_row,
+        the first portfolio row is taken as the starting point (start cash, inception return of 1).
+
+        With a state (self.state of an earlier run) the first portfolio row is the state's market close
+        and the trading key only holds the trades entered since - the carried positions stand in for the
+        earlier trades, so the work is proportional to the new closes and trades. Trades with a market
+        entry at or before the state's close are processed at the first new close. Realized profit booked
+        on the carried trades ends up in self.carried_updates, the end of day state in self.state.
+        """
+        portfolio = portfolio.copy()
+        trading_key = trading_key.copy()
+
+        closes = pd.DatetimeIndex(portfolio.index)
+        close_values = closes.values
+        n_days = len(closes)
+
+        # trades in trade id order - previous position lookups follow the trade id
+        trading_key.sort_index(inplace=True)
+        n_trades = len(trading_key.index)
+
+        # carried positions go in front of the trades (they come first in trade id order), already processed
+        carried = self.get_carried(state)
+        n_carried = len(carried.index)
+        n_rows = n_carried + n_trades
+
+        symbol_codes, symbols = pd.factorize(pd.concat([carried['symbol'], trading_key['symbol']], ignore_index=True))
+        symbols = pd.Index(symbols)
+        trade_ids = np.concatenate([carried['trade_id'].to_numpy(dtype='int64'), trading_key.index.to_numpy(dtype='int64')])
+        vwap = np.concatenate([carried['vwap'].to_numpy(dtype=float), trading_key['vwap'].to_numpy(dtype=float)])
+        target = np.concatenate([np.zeros(n_carried), pd.to_numeric(trading_key['target_percentage']).to_numpy(dtype=float)])
+        entry_date_time = pd.to_datetime(pd.concat([carried['entry_date_time'], trading_key['entry_date_time']],
+                                                   ignore_index=True)).values
+        market_entry = pd.to_datetime(pd.concat([carried['market_entry_date_time'], trading_key['market_entry_date_time']],
+                                                ignore_index=True)).values
+
+        # previous trade of the same symbol, -1 if there is none
+        prev_trade = pd.Series(np.arange(n_rows)).groupby(symbol_codes).shift(1).fillna(-1).to_numpy(dtype=int)
+
+        # portfolio row where the trade gets processed - market entry between the previous and current close
+        trade_day = np.searchsorted(close_values, market_entry, side='left')
+        trade_day[:n_carried] = 0
+        if state is not None:
+            trade_day[n_carried:] = np.maximum(trade_day[n_carried:], 1)
+
+        # trades at or before the first row (or after the last one) never get processed
+        process_day = np.where((trade_day >= 1) & (trade_day < n_days), trade_day, n_days)
+        process_order = np.argsort(process_day, kind='stable')
+        day_bounds = np.searchsorted(process_day[process_order], np.arange(n_days + 1), side='left')
+
+        # trades enter the active positions once the market entry is strictly before the close - the carried ones
+        # are in the book from the start
+        active_order = n_carried + np.argsort(market_entry[n_carried:], kind='stable')
+        active_bounds = np.searchsorted(market_entry[active_order], close_values, side='left')
+
+        # trade level metrics
+        post_cumulative_share_count = np.zeros(n_rows)
+        prior_cumulative_share_count = np.zeros(n_rows)
+        realized_profit = np.zeros(n_rows)
+        long_realized_profit = np.zeros(n_rows)
+        short_realized_profit = np.zeros(n_rows)
+        prior_portfolio_value = np.zeros(n_rows)
+        current_position = np.zeros(n_rows)
+        prior_position_value = np.zeros(n_rows)
+        cash_used = np.zeros(n_rows)
+        share_count = np.zeros(n_rows)
+
+        post_cumulative_share_count[:n_carried] = carried['shares'].to_numpy(dtype=float)
+        current_position[:n_carried] = carried['current_position'].to_numpy(dtype=float)
+
+        # portfolio level metrics
+        cash = np.zeros(n_days)
+        usd_value = np.zeros(n_days)
+        positions_usd = np.zeros(n_days)
+        long_exposure_usd = np.zeros(n_days)
+        short_exposure_usd = np.zeros(n_days)
+        gross_traded_usd = np.zeros(n_days)
+        net_traded_usd = np.zeros(n_days)
+        unrealized_long_pnl = np.zeros(n_days)
+        unrealized_short_pnl = np.zeros(n_days)
+        realized_long_pnl = np.zeros(n_days)
+        realized_short_pnl = np.zeros(n_days)
+        inception_return = np.ones(n_days)
+
+        cash[0] = self.start_cash if state is None else state['cash']
+        usd_value[0] = self.start_cash if state is None else state['usd_value']
+        inception_return[0] = 1.0 if state is None else state['inception_return']
+
+        # realized profit totals of trades entered up to the current close, plus profit booked on trades entered later
+        realized_long_total = 0.0 if state is None else state['realized_long']
+        realized_short_total = 0.0 if state is None else state['realized_short']
+        pending_long = np.zeros(n_days + 1)
+        pending_short = np.zeros(n_days + 1)
+
+        # profit booked on trades entered after the last close (market entry, long, short) - carried in the state
+        pending_after = []
+        for entered, long_profit, short_profit in ([] if state is None else state['pending']):
+            day = max(int(np.searchsorted(close_values, np.datetime64(entered), side='left')), 1)
+            if day < n_days:
+                pending_long[day] += long_profit
+                pending_short[day] += short_profit
+            else:
+                pending_after.append((entered, long_profit, short_profit))
+
+        # latest trades per symbol (by entry date time) among the trades entered before the current close
+        book = PositionBook(symbol_codes, entry_date_time, market_entry)
+        latest_trades = book.latest_trades
+        active_pointer = 0
+
+        for i in np.flatnonzero(carried['active'].to_numpy(dtype=bool)):
+            book.enter(i)
+
+        marks = self.get_price_marks(closes, symbols, price_key)
+        dividends = self.get_close_actions(closes, 'dividend')
+        splits = self.get_close_actions(closes, 'split')
+
+        for day in range(1, n_days):
+            # daily interest
+            daily_interest = self.ann_interest * (closes[day] - closes[day - 1]) / timedelta(days=365)
+            prior_portfolio_usd = usd_value[day - 1]
+            prior_cash = cash[day - 1]
+
+            # interest cost for leverage
+            cash_interest_payment = 0 if prior_cash > 0 else prior_cash * daily_interest
+            new_cash = prior_cash + cash_interest_payment
+
+            # profit booked earlier on trades that count from today onwards
+            realized_long_total += pending_long[day]
+            realized_short_total += pending_short[day]
+
+            # process the new trades in trade id order
+            new_trades = process_order[day_bounds[day]:day_bounds[day + 1]]
+            for i in new_trades:
+                current_price = vwap[i]
+                p = prev_trade[i]
+                if p >= 0:
+                    prior_shares = post_cumulative_share_count[p]
+                    prior_cumulative_share_count[i] = prior_shares
+                    prior_profit = (current_price - vwap[p]) * prior_shares
+                    realized_profit[p] = prior_profit
+
+                    # profit counts once the previous trade is entered
+                    counts_from = max(day, trade_day[p])
+                    if prior_shares > 0:
+                        long_realized_profit[p] = prior_profit
+                        if counts_from == day:
+                            realized_long_total += prior_profit
+                        else:
+                            pending_long[counts_from] += prior_profit
+                    else:
+                        short_realized_profit[p] = prior_profit
+                        if counts_from == day:
+                            realized_short_total += prior_profit
+                        else:
+                            pending_short[counts_from] += prior_profit
+                    if counts_from == n_days:
+                        pending_after.append((pd.Timestamp(market_entry[p]), long_realized_profit[p], short_realized_profit[p]))
+
+                    prior_position_value[i] = current_price * prior_shares
+                else:
+                    prior_shares = 0
+
+                prior_portfolio_value[i] = prior_portfolio_usd
+                current_position[i] = 0 if current_price == 0 else target[i] * prior_portfolio_usd
+                cash_used[i] = prior_position_value[i] - current_position[i]
+                share_count[i] = 0 if current_price == 0 else -1 * cash_used[i] / current_price
+                post_cumulative_share_count[i] = 0 if current_price == 0 else share_count[i] + prior_shares
+
+            # traded usd and cash after the most recent trades
+            new_cash_used = cash_used[new_trades]
+            gross_traded_usd[day] = np.abs(new_cash_used).sum()
+            net_traded_usd[day] = -1 * new_cash_used.sum()
+            new_cash += new_cash_used.sum() + gross_traded_usd[day] * -self.fee_rate
+
+            # bring the active positions book up to date
+            while active_pointer < active_bounds[day]:
+                book.enter(active_order[active_pointer])
+                active_pointer += 1
+
+            # mark the active positions to the close
+            dividend_cash_long = 0.0
+            dividend_cash_short = 0.0
+            for symbol, trades in latest_trades.items():
+                price = marks[day, symbol]
+                if np.isnan(price):
+                    continue
+                for i in trades:
+                    shares = post_cumulative_share_count[i]
+                    if shares == 0 or current_position[i] == 0:
+                        continue
+                    dividend_cash = dividends.get((day, symbols[symbol]), 0) * shares
+                    split_amount = splits.get((day, symbols[symbol]), 1)
+                    shares = shares / split_amount
+                    price_change = price - vwap[i] * split_amount
+                    positions_usd[day] += shares * price
+                    if shares > 0:
+                        long_exposure_usd[day] += shares * price
+                        unrealized_long_pnl[day] += shares * price_change
+                        dividend_cash_long += dividend_cash
+                    elif shares < 0:
+                        short_exposure_usd[day] += shares * price
+                        unrealized_short_pnl[day] += shares * price_change
+                        dividend_cash_short += dividend_cash
+
+            cash[day] = new_cash + dividend_cash_long + dividend_cash_short
+            usd_value[day] = cash[day] + positions_usd[day]
+            realized_long_pnl[day] = realized_long_total + dividend_cash_long + cash_interest_payment
+            realized_short_pnl[day] = realized_short_total + dividend_cash_short
+            inception_return[day] = (usd_value[day] / prior_portfolio_usd) * inception_return[day - 1]
+
+        # trades entered at the last close count from the next one on - in the book for the next run
+        while active_pointer < len(active_order) and market_entry[active_order[active_pointer]] <= close_values[-1]:
+            book.enter(active_order[active_pointer])
+            active_pointer += 1
+
+        # carried positions of the next run - the latest entered trade per symbol plus the active positions book
+        entered = np.ones(n_rows, dtype=bool)
+        entered[n_carried:] = market_entry[n_carried:] <= close_values[-1]
+        entered_rows = np.flatnonzero(entered)
+        last_rows = pd.Series(trade_ids[entered_rows]).groupby(symbol_codes[entered_rows]).idxmax().to_numpy(dtype=int)
+        last_rows = entered_rows[last_rows] if len(entered_rows) > 0 else entered_rows
+        active_rows = book.get_rows()
+        rows = np.union1d(last_rows, active_rows)
+        positions = pd.DataFrame({'trade_id': trade_ids[rows], 'symbol': symbols[symbol_codes[rows]],
+                                  'vwap': vwap[rows], 'shares': post_cumulative_share_count[rows],
+                                  'current_position': current_position[rows],
+                                  'entry_date_time': entry_date_time[rows], 'market_entry_date_time': market_entry[rows],
+                                  'last': np.isin(rows, last_rows), 'active': np.isin(rows, active_rows)})
+
+        last_entry = state['last_entry'] if state is not None else None
+        if entered[n_carried:].any():
+            latest = pd.Timestamp(entry_date_time[n_carried:][entered[n_carried:]].max())
+            last_entry = latest if last_entry is None else max(last_entry, latest)
+
+        self.state = self.get_state(closes[-1], cash[-1], usd_value[-1], inception_return[-1], realized_long_total,
+                                    realized_short_total, last_entry, positions, pending_after)
+
+        # realized profit booked on the carried trades by the new trades
+        closed = np.unique(prev_trade[process_order[:day_bounds[n_days]]])
+        closed = closed[(closed >= 0) & (closed < n_carried)]
+        self.carried_updates = pd.DataFrame({'realized_profit': realized_profit[closed],
+                                             'long_realized_profit': long_realized_profit[closed],
+                                             'short_realized_profit': short_realized_profit[closed]},
+                                            index=pd.Index(trade_ids[closed], name='trade_id'))
+
+        # write back the trade level metrics
+        trading_key['post_cumulative_share_count'] = post_cumulative_share_count[n_carried:]
+        trading_key['realized_profit'] = realized_profit[n_carried:]
+        trading_key['long_realized_profit'] = long_realized_profit[n_carried:]
+        trading_key['short_realized_profit'] = short_realized_profit[n_carried:]
+        trading_key['prior_portfolio_value'] = prior_portfolio_value[n_carried:]
+        trading_key['current_position'] = current_position[n_carried:]
+        trading_key['prior_position_value'] = prior_position_value[n_carried:]
+        trading_key['cash_used'] = cash_used[n_carried:]
+        trading_key['share_count'] = share_count[n_carried:]
+        trading_key['prior_cumulative_share_count'] = prior_cumulative_share_count[n_carried:]
+
+        # write back the portfolio level metrics
+        portfolio['cash'] = cash
+        portfolio['usd_value'] = usd_value
+        portfolio['positions_usd'] = positions_usd
+        portfolio['long_exposure_usd'] = long_exposure_usd
+        portfolio['short_exposure_usd'] = short_exposure_usd
+        portfolio['gross_traded_usd'] = gross_traded_usd
+        portfolio['net_traded_usd'] = net_traded_usd
+        portfolio['unrealized_long_pnl'] = unrealized_long_pnl
+        portfolio['unrealized_short_pnl'] = unrealized_short_pnl
+        portfolio['realized_long_pnl'] = realized_long_pnl
+        portfolio['realized_short_pnl'] = realized_short_pnl
+        portfolio['inception_return'] = inception_return
+
+        return portfolio, trading_key
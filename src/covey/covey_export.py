@@ -0,0 +1,198 @@
+import os
+import json
+import glob
+import time
+import shutil
+import pandas as pd
+from dotenv import load_dotenv
+
+# # covey libraries - internal test
+# from utils import get_output
+# from covey_price_key import PriceKey
+# from covey_portfolio import Portfolio
+
+# covey libraries - packaging
+from covey import get_output
+from covey.covey_price_key import PriceKey
+from covey.covey_portfolio import Portfolio
+
+
+# columnar (parquet / feather) outputs partitioned by address and date, plus the loaders to read them back
+# i.e. <root>/portfolio/address=0x.../date=2022-02/part.parquet - both formats need pyarrow (pip install pyarrow)
+class Exporter:
+    def __init__(self, **kwargs):
+        # output folder - COVEY_OUTPUT_ROOT environment variable if set, the package output folder otherwise
+        self.root = kwargs.get('root', os.environ.get('COVEY_OUTPUT_ROOT', get_output('')))
+
+        # parquet or feather
+        self.format = kwargs.get('format', 'parquet')
+        if self.format not in ('parquet', 'feather'):
+            raise ValueError("Unknown export format {}, use parquet or feather".format(self.format))
+
+        # date partition size - one partition per month by default, 'D' for one per day
+        self.partition_freq = kwargs.get('partition_freq', 'M')
+
+        # date column to partition each output by - outputs not listed are only partitioned by address
+        self.date_columns = kwargs.get('date_columns', {'portfolio': 'date_time',
+                                                        'trading_key': 'market_entry_date_time',
+                                                        'trades': 'entry_date_time',
+                                                        'price_key': 'timestamp',
+                                                        'universe_price_key': 'timestamp'})
+
+        # unique row key of each output - appended rows replace the ones with the same key
+        self.key_columns = kwargs.get('key_columns', {'portfolio': 'date_time', 'trading_key': 'trade_id',
+                                                      'trades': 'trade_id'})
+
+    # folder of an output - per address if given
+    def get_path(self, key, address=None):
+        path = os.path.join(self.root, key)
+        return path if address is None else os.path.join(path, 'address={}'.format(address))
+
+    # write an output, replacing whatever was written before for the same address (or the whole output without one)
+    def write(self, key, df, address=None):
+        path = self.get_path(key, address)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+
+        # named indexes (date_time, trade_id) become columns - feather only takes a default index
+        df = df.reset_index(drop=all(n is None for n in df.index.names))
+
+        date_column = self.date_columns.get(key)
+        if date_column is None or len(df.index) < 1:
+            partitions = [(None, df)]
+        else:
+            partitions = df.groupby(pd.to_datetime(df[date_column]).dt.to_period(self.partition_freq))
+
+        for period, partition_df in partitions:
+            partition_path = path if period is None else os.path.join(path, 'date={}'.format(period))
+            os.makedirs(partition_path, exist_ok=True)
+            file_path = os.path.join(partition_path, 'part.{}'.format(self.format))
+            if self.format == 'parquet':
+                partition_df.to_parquet(file_path, index=False)
+            else:
+                partition_df.reset_index(drop=True).to_feather(file_path)
+
+    # add rows to an output (i.e. a portfolio update) - only the date partitions the rows fall in get rewritten, rows
+    # with a key already in there replace the old ones (the columns they have, partial rows patch just those)
+    def append(self, key, df, address=None):
+        path = self.get_path(key, address)
+        df = df.reset_index(drop=all(n is None for n in df.index.names))
+
+        date_column = self.date_columns.get(key)
+        if date_column is None or len(df.index) < 1:
+            partitions = [(None, df)]
+        else:
+            partitions = df.groupby(pd.to_datetime(df[date_column]).dt.to_period(self.partition_freq))
+
+        key_column = self.key_columns.get(key)
+        for period, partition_df in partitions:
+            partition_path = path if period is None else os.path.join(path, 'date={}'.format(period))
+            file_path = os.path.join(partition_path, 'part.{}'.format(self.format))
+            if os.path.exists(file_path):
+                old_df = pd.read_parquet(file_path) if self.format == 'parquet' else pd.read_feather(file_path)
+                partition_df = pd.concat([old_df, partition_df], ignore_index=True)
+                if key_column is not None:
+                    partition_df = partition_df.groupby(key_column, sort=True).last().reset_index()[old_df.columns]
+                partition_df = partition_df.astype(old_df.dtypes.to_dict(), errors='ignore')
+
+            os.makedirs(partition_path, exist_ok=True)
+            if self.format == 'parquet':
+                partition_df.to_parquet(file_path, index=False)
+            else:
+                partition_df.reset_index(drop=True).to_feather(file_path)
+
+    # read an output back - one address or all of them, optionally only the date partitions between start and end
+    def read(self, key, address=None, start=None, end=None):
+        path = self.get_path(key, address)
+        files = sorted(glob.glob(os.path.join(path, '**', 'part.{}'.format(self.format)), recursive=True))
+
+        frames = []
+        for file_path in files:
+            partition = os.path.basename(os.path.dirname(file_path))
+            if partition.startswith('date='):
+                period = pd.Period(partition[len('date='):], freq=self.partition_freq)
+                if start is not None and period.end_time < pd.Timestamp(start):
+                    continue
+                if end is not None and period.start_time > pd.Timestamp(end):
+                    continue
+            frames.append(pd.read_parquet(file_path) if self.format == 'parquet' else pd.read_feather(file_path))
+
+        if len(frames) < 1:
+            return pd.DataFrame()
+
+        return pd.concat(frames, ignore_index=True)
+
+    # the price key bars plus what's needed to rebuild the lookups (dates, hours, symbols, ticker changes) - per
+    # address like the other outputs, universe_price_key for the one price key a PortfolioBatch shares
+    def write_price_key(self, price_key, address=None, key='price_key'):
+        self.write(key, price_key.source, address=address)
+
+        ticker_changes = price_key.ticker_changes.copy()
+        ticker_changes['record_date'] = pd.to_datetime(ticker_changes['record_date']).dt.strftime('%Y-%m-%d')
+        with open(os.path.join(self.get_path(key, address), 'price_key.json'), 'w') as f:
+            json.dump({'start': price_key.start.strftime('%Y-%m-%d'), 'end': price_key.end.strftime('%Y-%m-%d'),
+                       'hours': list(price_key.hours), 'step': str(price_key.step), 'symbols': list(price_key.symbols),
+                       'crypto_symbols': list(price_key.crypto_symbols),
+                       'ticker_changes': ticker_changes.to_dict('records')}, f)
+
+    # None if no price key was written
+    def read_price_key(self, address=None, key='price_key'):
+        path = os.path.join(self.get_path(key, address), 'price_key.json')
+        if not os.path.exists(path):
+            return None
+
+        with open(path) as f:
+            meta = json.load(f)
+
+        bars = self.read(key, address)
+        if len(bars.index) < 1:
+            bars = pd.DataFrame(columns=['symbol', 'timestamp', 'vwap'])
+
+        return PriceKey(bars=bars, start=meta['start'], end=meta['end'], hours=meta['hours'],
+                        step=pd.Timedelta(meta.get('step', '1h')), symbols=meta['symbols'],
+                        crypto_symbols=meta['crypto_symbols'],
+                        ticker_changes=pd.DataFrame(meta['ticker_changes'], columns=['symbol', 'new_symbol', 'record_date']))
+
+    # the wallet's own price key, the wallet's symbols of the batch's shared one otherwise (as covey_batch prices them)
+    def read_wallet_price_key(self, address, trades):
+        price_key = self.read_price_key(address)
+        if price_key is None:
+            price_key = self.read_price_key(key='universe_price_key')
+            if price_key is not None:
+                price_key = price_key.subset(trades['symbol'].unique() if 'symbol' in trades.columns else [])
+        return price_key
+
+    # rehydrate a calculated portfolio - no ledger, alpaca or portfolio math calls
+    def load_portfolio(self, address, **kwargs):
+        trades = self.read('trades', address)
+        trading_key = self.read('trading_key', address)
+        portfolio = self.read('portfolio', address)
+
+        if len(portfolio.index) < 1:
+            raise ValueError("No portfolio written for {} in {}".format(address, self.root))
+
+        if len(trading_key.index) > 0:
+            trading_key = trading_key.set_index('trade_id').sort_index()
+
+        return Portfolio(address=address, trades=trades, trading_key=trading_key,
+                         portfolio=portfolio.set_index('date_time').rename_axis(None).sort_index(),
+                         price_key=self.read_wallet_price_key(address, trades), exporter=self, export=False, **kwargs)
+
+
+if __name__ == '__main__':
+    # load environment variables (aplaca private and public keys)
+    load_dotenv()
+
+    # start the timer
+    start_time = time.time()
+
+    # write an example portfolio, then load it back without recalculating
+    e = Exporter()
+    p = Portfolio(address='0x763A38Ba9F4dAb8a03BB3A9f9a72147badDf56Ba', exporter=e)
+    p.calculate_portfolio()
+
+    p = e.load_portfolio('0x763A38Ba9F4dAb8a03BB3A9f9a72147badDf56Ba')
+
+    print(p.portfolio)
+
+    print("---Portfolio loaded in %s seconds ---" % (time.time() - start_time))
@@ -0,0 +1,121 @@
+import time
+import warnings
+import threading
+import requests
+from web3 import Web3
+from eth_utils import from_wei
+from datetime import datetime, timedelta
+
+
+# gas price (gwei) for posting - from the polygon gas station, the node's eth_gasPrice when the gas station is down,
+# cached for max age so a batch of posts waits on at most one lookup per interval
+class GasOracle:
+    def __init__(self, **kwargs):
+        # set the gas station url
+        self.gas_station_url = kwargs.get('gas_station_url', 'https://gasstation.polygon.technology/v2')
+
+        # fee strategy - the gas station level to pay (safeLow, standard or fast)
+        self.strategy = kwargs.get('strategy', 'fast')
+
+        # node gas price multiplier per strategy - the node only has the one eth_gasPrice
+        self.node_multipliers = kwargs.get('node_multipliers', {'safeLow': 1.0, 'standard': 1.1, 'fast': 1.25})
+
+        # highest gas price (gwei) we are willing to pay, no cap by default
+        self.max_gas_price = kwargs.get('max_gas_price', None)
+
+        # how long a gas price is used before it's looked up again
+        self.max_age = kwargs.get('max_age', timedelta(seconds=15))
+
+        # seconds before a gas station request gives up
+        self.timeout = kwargs.get('timeout', 5)
+
+        # keep-alive http session for the gas station
+        self.session = kwargs.get('session', None)
+        if self.session is None:
+            self.session = requests.Session()
+
+        # web3 connection for the node fallback - no fallback without one
+        self.w3 = kwargs.get('w3', None)
+
+        # latest gas price, when and where it was looked up
+        self.gas_price = None
+        self.fetched_at = None
+        self.source = None
+        self.lock = threading.Lock()
+
+        # background refresher - keeps the gas price fresh so posting never waits on a lookup
+        self.stopped = threading.Event()
+        self.refresher = None
+        if kwargs.get('background', False):
+            self.start()
+
+    # gas price of the strategy - gas station first, node otherwise
+    def fetch_gas_price(self):
+        try:
+            levels = self.session.get(self.gas_station_url, timeout=self.timeout).json()
+            return float(levels.get(self.strategy).get('maxFee')), 'gas station'
+        except Exception as e:
+            if self.w3 is None:
+                raise
+            warnings.warn('Gas station unavailable ({}), using the node gas price'.format(e), RuntimeWarning)
+            return float(from_wei(self.w3.eth.gas_price, 'gwei')) * self.node_multipliers.get(self.strategy, 1.0), 'node'
+
+    # look the gas price up again - keeps the last one if both the gas station and the node fail
+    def refresh(self):
+        try:
+            gas_price, source = self.fetch_gas_price()
+        except Exception as e:
+            if self.gas_price is None:
+                raise
+            warnings.warn('Gas price lookup failed ({}), keeping {} gwei'.format(e, self.gas_price), RuntimeWarning)
+            gas_price, source = self.gas_price, self.source
+
+        self.gas_price, self.source, self.fetched_at = gas_price, source, datetime.utcnow()
+
+    def is_stale(self):
+        return self.gas_price is None or datetime.utcnow() - self.fetched_at > self.max_age
+
+    # gas price in gwei - only looked up when the cached one is older than max age, one lookup for all callers
+    def get_gas_price(self):
+        if self.is_stale():
+            with self.lock:
+                if self.is_stale():
+                    self.refresh()
+
+        return self.gas_price if self.max_gas_price is None else min(self.gas_price, self.max_gas_price)
+
+    def run(self):
+        while not self.stopped.wait(self.max_age.total_seconds() / 2):
+            with self.lock:
+                try:
+                    self.refresh()
+                except Exception as e:
+                    warnings.warn('Gas price refresh failed ({})'.format(e), RuntimeWarning)
+
+    # refresh in a background thread every half max age
+    def start(self):
+        if self.refresher is None:
+            self.get_gas_price()
+            self.stopped.clear()
+            self.refresher = threading.Thread(target=self.run, daemon=True)
+            self.refresher.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.refresher is not None:
+            self.refresher.join()
+            self.refresher = None
+
+
+if __name__ == '__main__':
+    # start the timer
+    start_time = time.time()
+
+    g = GasOracle(w3=Web3(Web3.HTTPProvider('https://polygon-rpc.com/')))
+    print('{} gwei from the {}'.format(g.get_gas_price(), g.source))
+
+    # second lookup comes out of the cache
+    cache_time = time.time()
+    g.get_gas_price()
+
+    print("---Gas price in {} seconds, cached in {} seconds ---".format(cache_time - start_time, time.time() - cache_time))
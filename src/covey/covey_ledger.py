@@ -0,0 +1,228 @@
+import time
+import sqlite3
+import pandas as pd
+from web3 import Web3
+from dotenv import load_dotenv
+
+# # covey libraries - internal test
+# from utils import get_output
+# from covey_client import get_abi, get_client
+
+# covey libraries - packaging
+from covey import get_output
+from covey.covey_client import get_abi, get_client
+
+
+# reads the whole covey ledger in one getAllContent call and partitions the content by analyst address
+class Ledger:
+    def __init__(self, **kwargs):
+        # VARIABLE : polygon url
+        self.polygon_url = kwargs.get('POLYGON_URL', 'https://polygon-rpc.com/')
+
+        # VARIABLE : covey ledger address (polygon)
+        self.covey_ledger_polygon_address = kwargs.get('covey_ledger_polygon_address', '0x587Ec5a7a3F2DE881B15776BC7aaD97AA44862Be')
+
+        # set the abi - read once per process
+        self.abi = get_abi()
+
+        # node connection and covey ledger contract - shared by the whole process unless one is passed in
+        self.client = kwargs.get('client', None)
+        if self.client is None:
+            self.client = get_client(POLYGON_URL=self.polygon_url, covey_ledger_polygon_address=self.covey_ledger_polygon_address)
+
+        # all of the ledger content - same columns as Trade.get_trades_polygon
+        self.content = self.get_all_content()
+
+        # content partitioned by lower case analyst address
+        self.analyst_content = {address: df for address, df in self.content.groupby(self.content['address'].str.lower())}
+
+    # output format [('address', 'position string', unix time),('address', 'position string', unix time),...]
+    def get_all_content(self):
+        result = self.client.covey_ledger.functions.getAllContent().call()
+        return pd.DataFrame(result, columns=['address', 'trades', 'entry_date_time'])
+
+    # the content posted by one analyst - empty if the address never posted
+    # note: content carried over with swapAddress stays under the original analyst address (LedgerStore follows swaps)
+    def get_analyst_content(self, address):
+        return self.analyst_content.get(address.lower(), pd.DataFrame(columns=['address', 'trades', 'entry_date_time'])).copy()
+
+
+# local sqlite store of the ledger events with the last indexed block as checkpoint
+class LedgerStore:
+    def __init__(self, **kwargs):
+        # sqlite file - in the output folder by default
+        self.path = kwargs.get('path', get_output('covey_ledger.db'))
+
+        self.connection = sqlite3.connect(self.path)
+
+        with self.connection:
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS content (
+                                        block_number INTEGER, log_index INTEGER, transaction_hash TEXT,
+                                        analyst TEXT, content TEXT, created_at INTEGER,
+                                        PRIMARY KEY (block_number, log_index))""")
+            self.connection.execute("""CREATE INDEX IF NOT EXISTS content_analyst ON content (lower(analyst))""")
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS swaps (
+                                        block_number INTEGER, log_index INTEGER, transaction_hash TEXT,
+                                        old_address TEXT, new_address TEXT,
+                                        PRIMARY KEY (block_number, log_index))""")
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS checkpoint (
+                                        id INTEGER PRIMARY KEY CHECK (id = 0), last_block INTEGER)""")
+
+    # last block that has been fully indexed, None if nothing was indexed yet
+    def get_checkpoint(self):
+        row = self.connection.execute("SELECT last_block FROM checkpoint WHERE id = 0").fetchone()
+        return None if row is None else row[0]
+
+    # write a block range worth of events and move the checkpoint in one transaction
+    def write_events(self, content, swaps, last_block):
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO content VALUES (?, ?, ?, ?, ?, ?)", content)
+            self.connection.executemany("INSERT OR REPLACE INTO swaps VALUES (?, ?, ?, ?, ?)", swaps)
+            self.connection.execute("INSERT OR REPLACE INTO checkpoint VALUES (0, ?)", (last_block,))
+
+    # every post in ledger order - same columns as Ledger.get_all_content
+    def get_all_content(self):
+        return pd.read_sql_query("""SELECT analyst AS address, content AS trades, created_at AS entry_date_time
+                                    FROM content ORDER BY block_number, log_index""", self.connection)
+
+    # same result as the getAnalystContent contract call: swapAddress replaces the new address's
+    # content with a copy of the old address's content, later posts get appended
+    def get_analyst_content(self, address, before=None):
+        # (block number, log index) upper bound - everything by default
+        before = before if before is not None else (2**62, 0)
+
+        swap = self.connection.execute("""SELECT old_address, block_number, log_index FROM swaps
+                                          WHERE lower(new_address) = lower(?) AND (block_number, log_index) < (?, ?)
+                                          ORDER BY block_number DESC, log_index DESC LIMIT 1""",
+                                       (address, before[0], before[1])).fetchone()
+
+        if swap is None:
+            after = (-1, -1)
+            swapped_df = pd.DataFrame(columns=['address', 'trades', 'entry_date_time'])
+        else:
+            after = (swap[1], swap[2])
+            swapped_df = self.get_analyst_content(swap[0], after)
+
+        own_df = pd.read_sql_query("""SELECT analyst AS address, content AS trades, created_at AS entry_date_time
+                                      FROM content WHERE lower(analyst) = lower(?)
+                                      AND (block_number, log_index) > (?, ?) AND (block_number, log_index) < (?, ?)
+                                      ORDER BY block_number, log_index""",
+                                   self.connection, params=(address, after[0], after[1], before[0], before[1]))
+
+        return pd.concat([swapped_df, own_df], ignore_index=True)
+
+
+# scans the ContentCreated (and AddressSwapped) logs in block ranges into the ledger store
+class LedgerIndexer:
+    def __init__(self, **kwargs):
+        # VARIABLE : polygon url
+        self.polygon_url = kwargs.get('POLYGON_URL', 'https://polygon-rpc.com/')
+
+        # VARIABLE : covey ledger address (polygon)
+        self.covey_ledger_polygon_address = kwargs.get('covey_ledger_polygon_address', '0x587Ec5a7a3F2DE881B15776BC7aaD97AA44862Be')
+
+        # set the abi - read once per process
+        self.abi = get_abi()
+
+        # web3 instance - can be swapped for a local node or a recorded log stand in, the shared client otherwise
+        self.w3 = kwargs.get('w3', None)
+        if self.w3 is None:
+            client = get_client(POLYGON_URL=self.polygon_url, covey_ledger_polygon_address=self.covey_ledger_polygon_address)
+            self.w3 = client.w3
+            self.covey_ledger = client.covey_ledger
+        else:
+            self.covey_ledger = self.w3.eth.contract(address=self.covey_ledger_polygon_address, abi=self.abi)
+
+        # the store to index into
+        self.store = kwargs.get('store', None)
+        if self.store is None:
+            self.store = LedgerStore()
+
+        # first block to scan if the store is empty - looked up from the contract code if not provided
+        self.start_block = kwargs.get('start_block', None)
+
+        # number of blocks per get_logs request
+        self.chunk_size = kwargs.get('chunk_size', 2000)
+
+        # stay this many blocks behind the chain head so we don't index blocks that can still reorg
+        self.confirmations = kwargs.get('confirmations', 64)
+
+        # event topics
+        self.content_topic = Web3.keccak(text='ContentCreated(address,string,uint256)').hex()
+        self.swap_topic = Web3.keccak(text='AddressSwapped(address,address)').hex()
+
+    # first block with the ledger contract code - binary search over the chain history
+    def get_deployment_block(self):
+        low = 0
+        high = self.w3.eth.block_number
+        while low < high:
+            mid = (low + high) // 2
+            if len(self.w3.eth.get_code(self.covey_ledger_polygon_address, block_identifier=mid)) > 0:
+                high = mid
+            else:
+                low = mid + 1
+        return low
+
+    # decode the raw logs into content and swap rows for the store
+    def get_events(self, logs):
+        content = []
+        swaps = []
+        for log in logs:
+            topic = log['topics'][0]
+            topic = topic.hex() if isinstance(topic, bytes) else topic
+            if topic == self.content_topic:
+                e = self.covey_ledger.events.ContentCreated().processLog(log)
+                content.append((e['blockNumber'], e['logIndex'], e['transactionHash'].hex(),
+                                e['args']['analyst'], e['args']['content'], e['args']['created_at']))
+            elif topic == self.swap_topic:
+                e = self.covey_ledger.events.AddressSwapped().processLog(log)
+                swaps.append((e['blockNumber'], e['logIndex'], e['transactionHash'].hex(),
+                              e['args']['oldAddress'], e['args']['newAddress']))
+        return content, swaps
+
+    # index the blocks since the last checkpoint, returns the number of new posts
+    def update(self):
+        last_block = self.store.get_checkpoint()
+        if last_block is not None:
+            from_block = last_block + 1
+        elif self.start_block is not None:
+            from_block = self.start_block
+        else:
+            from_block = self.get_deployment_block()
+
+        to_block = self.w3.eth.block_number - self.confirmations
+
+        new_posts = 0
+        chunk_size = self.chunk_size
+        while from_block <= to_block:
+            end_block = min(from_block + chunk_size - 1, to_block)
+            try:
+                logs = self.w3.eth.get_logs({'address': self.covey_ledger_polygon_address,
+                                             'fromBlock': from_block, 'toBlock': end_block,
+                                             'topics': [[self.content_topic, self.swap_topic]]})
+            except ValueError:
+                # too many results / range too large for the node - retry with a smaller range
+                if chunk_size == 1:
+                    raise
+                chunk_size = max(1, chunk_size // 2)
+                continue
+
+            content, swaps = self.get_events(logs)
+            self.store.write_events(content, swaps, end_block)
+            new_posts += len(content)
+            from_block = end_block + 1
+
+        return new_posts
+
+if __name__ == '__main__':
+    # load environment variables
+    load_dotenv()
+
+    # start the timer
+    start_time = time.time()
+
+    l = Ledger()
+
+    print(l.content)
+
+    print("---Ledger with {} posts from {} analysts finished in {} seconds ---".format(len(l.content.index), len(l.analyst_content), time.time() - start_time))
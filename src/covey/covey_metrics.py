@@ -0,0 +1,122 @@
+import io
+import time
+import pstats
+import cProfile
+import threading
+from contextlib import contextmanager
+
+
+# sink that prints every metric as it comes in
+def print_sink(event):
+    print('{kind} {name} {value}'.format(**event))
+
+
+# per stage timings and counters (rows, symbols, api calls) of a Trade -> Pricer -> Portfolio run - read them with
+# to_dict() or pass a sink (a callable taking {'kind', 'name', 'value'}) to get every timing / count as it happens
+# profiler='cprofile' (or 'pyinstrument', pip install pyinstrument) also profiles the stages - see get_profile
+class Metrics:
+    def __init__(self, **kwargs):
+        # called with every timing and count - None keeps them in here only
+        self.sink = kwargs.get('sink', None)
+
+        # None, 'cprofile' or 'pyinstrument'
+        self.profiler = kwargs.get('profiler', None)
+        if self.profiler not in (None, 'cprofile', 'pyinstrument'):
+            raise ValueError("Unknown profiler {}, use cprofile or pyinstrument".format(self.profiler))
+
+        # stages to profile - all of them by default (nested stages are part of the outer stage's profile)
+        self.profile_stages = kwargs.get('profile_stages', None)
+
+        # stage -> seconds and calls, counter -> value, stage -> profile report
+        self.timings = {}
+        self.counters = {}
+        self.profiles = {}
+
+        self.lock = threading.Lock()
+        self.profiling = False
+
+    def emit(self, kind, name, value):
+        if self.sink is not None:
+            self.sink({'kind': kind, 'name': name, 'value': value})
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        self.emit('count', name, value)
+
+    # set a counter to a value (i.e. the number of symbols) instead of adding to it
+    def gauge(self, name, value):
+        with self.lock:
+            self.counters[name] = value
+        self.emit('gauge', name, value)
+
+    def start_profile(self, name):
+        if self.profiler is None or self.profiling or (self.profile_stages is not None and name not in self.profile_stages):
+            return None
+        self.profiling = True
+        if self.profiler == 'cprofile':
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            from pyinstrument import Profiler
+            profiler = Profiler()
+            profiler.start()
+        return profiler
+
+    def stop_profile(self, name, profiler):
+        if self.profiler == 'cprofile':
+            profiler.disable()
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(30)
+            report = stream.getvalue()
+        else:
+            profiler.stop()
+            report = profiler.output_text()
+        self.profiles[name] = report
+        self.profiling = False
+
+    # times the block under the stage name - calls of the same stage add up
+    @contextmanager
+    def stage(self, name):
+        profiler = self.start_profile(name)
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            seconds = time.perf_counter() - start
+            if profiler is not None:
+                self.stop_profile(name, profiler)
+            with self.lock:
+                timing = self.timings.setdefault(name, {'seconds': 0.0, 'calls': 0})
+                timing['seconds'] += seconds
+                timing['calls'] += 1
+            self.emit('timing', name, seconds)
+
+    # profile report of the stage - None if it wasn't profiled
+    def get_profile(self, name):
+        return self.profiles.get(name)
+
+    def to_dict(self):
+        with self.lock:
+            return {'timings': {k: dict(v) for k, v in self.timings.items()}, 'counters': dict(self.counters)}
+
+    # one line per stage and counter
+    def report(self):
+        metrics = self.to_dict()
+        lines = ['{:<24} {:>10.3f}s {:>6} calls'.format(k, v['seconds'], v['calls']) for k, v in metrics['timings'].items()]
+        lines += ['{:<24} {:>10}'.format(k, v) for k, v in metrics['counters'].items()]
+        return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    # start the timer
+    start_time = time.time()
+
+    m = Metrics(sink=print_sink, profiler='cprofile')
+    with m.stage('example'):
+        m.count('rows', sum(range(1000000)) % 7)
+
+    print(m.report())
+    print(m.get_profile('example'))
+
+    print("---Metrics finished in %s seconds ---" % (time.time() - start_time))
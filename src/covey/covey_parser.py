@@ -0,0 +1,90 @@
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+
+# parses raw ledger rows (address, trades, entry_date_time[, chain]) where trades is the posted 'SYM:pct,SYM:pct'
+# string into one typed row per position - symbol (categorical), target_percentage, entry_date_time (unix seconds)
+# entries that aren't 'SYM:number' (i.e. covey-reset, blank cells) are kept like before (target 0) and also
+# reported in self.malformed
+class TradeParser:
+    def __init__(self, **kwargs):
+        # dtype of the target percentages - float32 keeps millions of positions small, float64 for the portfolio math
+        self.target_dtype = kwargs.get('target_dtype', 'float32')
+
+        # keep the raw 'SYM:pct' cell per position (the trades column)
+        self.keep_cells = kwargs.get('keep_cells', False)
+
+        # malformed entries of the last parse (address, chain, entry_date_time, trades, reason)
+        self.malformed = pd.DataFrame(columns=['address', 'chain', 'entry_date_time', 'trades', 'reason'])
+
+    def parse(self, df):
+        raw = df['trades'].fillna('').astype(str)
+
+        # one cell per position - the posts have one more cell than commas, split everything in one go
+        raw_codes, raw_uniques = pd.factorize(raw)
+        counts = (pd.Series(raw_uniques, dtype=object).str.count(',') + 1).to_numpy(dtype='int64')[raw_codes]
+        rows = np.repeat(np.arange(len(df.index)), counts)
+        cells = ','.join(raw.to_list()).split(',') if len(raw.index) > 0 else []
+
+        # the same 'SYM:pct' cells come up over and over - parse each distinct cell once
+        codes, uniques = pd.factorize(pd.Series(cells, dtype=object))
+        uniques = pd.Series(uniques, dtype=object)
+
+        # blank cells become BLANK:0
+        empty = (uniques.str.len() == 0).to_numpy(dtype=bool)
+        uniques[empty] = 'BLANK:0'
+
+        # symbol and target - anything after a second ':' is ignored
+        parts = uniques.str.split(':', n=2, expand=True).reindex(columns=[0, 1])
+        symbols = parts[0].str.strip()
+        targets = parts[1]
+
+        # the target should be numeric, otherwise it's 0
+        numeric = targets.str.match(r'^-?(\d+\.?\d*|\.\d+)$').fillna(False).to_numpy(dtype=bool)
+        target_percentage = pd.to_numeric(targets.where(numeric), errors='coerce').fillna(0).to_numpy(dtype=self.target_dtype)
+
+        symbol_codes, symbol_uniques = pd.factorize(symbols)
+
+        trades = pd.DataFrame({'address': df['address'].to_numpy()[rows]}, index=df.index[rows])
+        trades['chain'] = df['chain'].to_numpy()[rows] if 'chain' in df.columns else None
+        if self.keep_cells:
+            trades['trades'] = uniques.to_numpy()[codes]
+        trades['entry_date_time'] = pd.to_numeric(df['entry_date_time']).to_numpy()[rows].astype('int64')
+        trades['symbol'] = pd.Categorical.from_codes(symbol_codes[codes], categories=symbol_uniques)
+        trades['target_percentage'] = target_percentage[codes]
+
+        # side channel for the entries that weren't SYM:number
+        reasons = np.select([empty, targets.isnull().to_numpy(), ~numeric, (symbols.str.len() == 0).to_numpy()],
+                            ['blank', 'no target', 'bad target', 'no symbol'], '')[codes]
+        bad = reasons != ''
+        self.malformed = pd.DataFrame({'address': trades['address'].to_numpy()[bad],
+                                       'chain': trades['chain'].to_numpy()[bad],
+                                       'entry_date_time': trades['entry_date_time'].to_numpy()[bad],
+                                       'trades': uniques.to_numpy()[codes][bad],
+                                       'reason': reasons[bad]})
+
+        return trades
+
+
+if __name__ == '__main__':
+    # benchmark : <posts> ledger rows with <positions> positions each, 1 in 100 posts is a covey-reset
+    # python -m covey.covey_parser <posts> <positions>
+    # 200000 x 10 : ~2 million positions in ~1 second
+    posts = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    positions = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    symbols = np.array(['AAPL', 'MSFT', 'ETHUSDT', 'TSLA', 'AMZN', 'BTCUSDT', 'META', 'NVDA'])
+    strings = [','.join('{}:{:.2f}'.format(s, t) for s, t in zip(np.random.choice(symbols, positions), np.random.uniform(-0.3, 0.3, positions)))
+               for _ in range(1000)]
+    ledger_df = pd.DataFrame({'address': '0x763A38Ba9F4dAb8a03BB3A9f9a72147badDf56Ba',
+                              'trades': [strings[i % 1000] if i % 100 else 'covey-reset' for i in range(posts)],
+                              'entry_date_time': np.arange(posts) + 1640995200,
+                              'chain': 'MATIC'})
+
+    start_time = time.time()
+    p = TradeParser()
+    trades_df = p.parse(ledger_df)
+    print(trades_df.dtypes)
+    print("---{} positions ({} malformed) parsed in {} seconds ---".format(len(trades_df.index), len(p.malformed.index), time.time() - start_time))
@@ -9,25 +9,55 @@ from datetime import date, datetime,timedelta
 # from utils import get_data, get_output, get_checks
 # from covey_trade import Trade
 # import covey_checks as covey_checks 
-# from covey_calendar import CoveyCalendar
+# from covey_engine import PortfolioEngine, PositionBook
+# from covey_pricer import Pricer
+# from covey_reference import get_corporate_actions
 
 # covey libraries - packaging
-from covey import get_data, get_output, get_checks
+from covey import get_output, get_checks
 from covey.covey_trade import Trade
 import covey.covey_checks as covey_checks 
-from covey.covey_calendar import CoveyCalendar
+from covey.covey_engine import PortfolioEngine, PositionBook
+from covey.covey_pricer import Pricer
+from covey.covey_reference import get_corporate_actions
 
 class Portfolio(Trade):
     def __init__(self, **kwargs):
-        super().__init__(**kwargs)
+        # end of day state of an earlier run (see save_state / load_state) - update mode, only the market closes and
+        # trades after it get calculated and priced
+        self.state = kwargs.get('state', None)
+        super().__init__(**dict(kwargs, pricing=False) if self.state is not None else kwargs)
         # default start cash to 10000
         self.start_cash = kwargs.get('start_cash', 10000)
         # default annual interest to 0.2 %
         self.ann_interest = kwargs.get('ann_interest', 0.02)
-        # initialize the portfolio
-        self.reset_portfolio()
-        # initialize trading_key portfolio derived columns
-        self.set_trading_key()
+        # use the event driven engine by default, legacy row by row evaluation otherwise
+        self.use_engine = kwargs.get('use_engine', True)
+        # write the outputs to csv once calculated - turned off when many wallets run side by side
+        self.export = kwargs.get('export', True)
+        # columnar outputs (covey_export.Exporter) instead of csv
+        self.exporter = kwargs.get('exporter', None)
+        # also write the latest positions (latest_positions.csv) with the other outputs - off by default
+        self.export_positions = kwargs.get('export_positions', False)
+        # open positions book over the trading key - built on the first positions lookup
+        self.position_book = None
+        # update mode - prices from this long before the state's close, so the carried positions get the same as-of prices
+        self.price_lookback = kwargs.get('price_lookback', timedelta(days=7))
+        if self.state is not None and not self.use_engine:
+            raise ValueError("Updating from a state needs the portfolio engine (use_engine=True)")
+        # end of day state after calculate_portfolio and the realized profit it booked on trades of earlier runs
+        self.end_state = None
+        self.carried_updates = None
+        # already calculated portfolio (i.e. loaded back by covey_export.Exporter)
+        self.portfolio = kwargs.get('portfolio', None)
+        if self.portfolio is None:
+            # only the trades since the state in update mode
+            if self.state is not None:
+                self.set_update_trading_key()
+            # initialize the portfolio
+            self.reset_portfolio()
+            # initialize trading_key portfolio derived columns
+            self.set_trading_key()
         # generate crypto pricing error report
         self.unpriced_crypto = covey_checks.check_crypto_tickers(self.trading_key)
     
@@ -94,17 +124,23 @@ class Portfolio(Trade):
         ])
         
         # initialize the first row of the portfolio - start date, start cash, and remanining 9 zeros 
-        self.portfolio = pd.DataFrame([portfolio_entry(self.get_start_date(-1), self.start_cash, self.start_cash,
-                        0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,1.0, self.start_cash)])
+        # (the state's close, cash, value and inception return in update mode)
+        if self.state is None:
+            start_date = self.get_start_date()
+            self.portfolio = pd.DataFrame([portfolio_entry(self.get_start_date(-1), self.start_cash, self.start_cash,
+                            0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,1.0, self.start_cash)])
+        else:
+            start_date = self.state['date_time']
+            self.portfolio = pd.DataFrame([portfolio_entry(start_date, self.state['cash'], self.state['usd_value'],
+                            *[0.0] * 22, self.state['inception_return'], self.state['usd_value'])])
         
         # set the index to be date_time
         self.portfolio.set_index('date_time', inplace=True)
 
         # fill in the rest of the date index using covey calender market close times
-        c = CoveyCalendar(start_date = self.get_start_date().strftime('%Y-%m-%d'))
-        calendar_key = c.set_business_dates()
-        max_calendar_date = min(self.price_key.reset_index()['timestamp'].max(),calendar_key['next_market_close'].max())
-        calendar_mask = calendar_key['next_market_close'] <= max_calendar_date
+        calendar_key = self.get_calendar_key(start_date.strftime('%Y-%m-%d'))
+        max_calendar_date = min(self.price_key.get_max_timestamp(),calendar_key['next_market_close'].max())
+        calendar_mask = (calendar_key['next_market_close'] <= max_calendar_date) & (calendar_key['next_market_close'] > self.portfolio.index[0])
         calendar_key_df = pd.DataFrame(calendar_key[calendar_mask]['next_market_close'].unique())
         
         # set the calendar index to be datetime so we can concat easily
@@ -115,48 +151,81 @@ class Portfolio(Trade):
 
         return 0
 
+    # update mode - the trades entered after the state's last entry, priced together with the carried positions
+    def set_update_trading_key(self):
+        if self.state['last_entry'] is not None and len(self.trades.index) > 0:
+            self.trades = self.trades[self.trades['entry_date_time'] > self.state['last_entry']].reset_index(drop=True)
+
+        if self.price_key is None:
+            symbols = sorted(set(self.get_symbols()) | set(self.state['positions']['symbol']))
+            start = (self.state['date_time'] - self.price_lookback).strftime('%Y-%m-%d')
+            self.price_key = Pricer(start=start, symbols=symbols if len(symbols) > 0 else ['DUMMY'], metrics=self.metrics,
+                                    **self.get_pricing_kwargs()).price_key
+
+        with self.metrics.stage('trading_key_build'):
+            self.trading_key = self.get_trading_key()
+        self.metrics.count('trading_key_rows', len(self.trading_key.index))
+
+        # trade ids carry on from the trades of the earlier runs
+        if len(self.state['positions'].index) > 0:
+            self.trading_key.index = self.trading_key.index + int(self.state['positions']['trade_id'].max())
+
+    # update mode - the carried open positions need their market closes priced too in demand mode
+    def get_pricing_kwargs(self):
+        kwargs = super().get_pricing_kwargs()
+        if self.state is not None and self.demand_pricing:
+            positions = self.state['positions']
+            positions = positions[positions['active'] & (positions['shares'] != 0)]
+            carried = pd.DataFrame({'symbol': positions['symbol'], 'entry_date_time': self.state['date_time'],
+                                    'target_percentage': 1.0})
+            kwargs['entries'] = pd.concat([kwargs.get('entries'), carried], ignore_index=True)
+            kwargs['demand'] = True
+        return kwargs
+
+    # end of day state after calculate_portfolio - an update from it calculates the same as a full run
+    def save_state(self, path=None):
+        path = get_output(os.path.join('state', '{}.pkl'.format(self.address))) if path is None else path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pd.to_pickle(self.end_state, path)
+
+    # the trading key's open positions book - trades enter it in market entry order as the lookups move forward
+    def get_position_book(self):
+        if self.position_book is None:
+            self.position_book = PositionBook(self.trading_key['symbol'], pd.to_datetime(self.trading_key['entry_date_time']),
+                                              pd.to_datetime(self.trading_key['market_entry_date_time']),
+                                              trade_ids=self.trading_key.index)
+        return self.position_book
+
+    # latest trade per symbol (ties on the entry date time kept) among the trades entered before the portfolio date,
+    # if it still holds shares - read from the position book, no trading key scan
+    def get_latest_positions(self, portfolio_date):
+        df = self.trading_key.loc[self.get_position_book().get_trade_ids(portfolio_date)]
+        df = df[df['post_cumulative_share_count'] != 0].copy()
+        df['current_position'] = df['current_position'].fillna(0)
+
+        return df
+
     def get_active_positions(self, portfolio_date):
 
         columns = ['address','symbol', 'target_percentage','post_cumulative_share_count', 'vwap', 
         'current_position', 'long_post_cumulative_share_count','short_post_cumulative_share_count',
         'realized_profit', 'dividend_cash', 'dividend_cash_long','dividend_cash_short']
 
-        df = self.trading_key.copy()
-        
-        df = df[(df['market_entry_date_time'] < portfolio_date) ]
-        df['symbol_date_rank'] = df.groupby('symbol')['entry_date_time'].rank('dense', ascending=False)
-
-        # realized profit sum partitioned by symbol
-        df['realized_profit_symbol_agg'] = df.groupby('symbol')['realized_profit'].transform(sum)
-        df['realized_profit_final'] = df['realized_profit_symbol_agg'] - df['realized_profit']
-        df = df[(df['symbol_date_rank'] == 1) & (df['post_cumulative_share_count'] != 0)]
-        df['current_position'].fillna(0, inplace=True)
+        df = self.get_latest_positions(portfolio_date)
 
         if len(df.index) < 1:
             return pd.DataFrame(columns=columns)
 
-        # export to csv
-        self.export_to_csv(key = 'position', df = df)
-
-        # dividend logic 
-        dividends_df = pd.read_csv(get_data('dividend_split.csv'))
-        dividends_df['payment_date'] = pd.to_datetime(dividends_df['payment_date'])
-        dividends_df = dividends_df[(dividends_df['div_or_split'] == 'dividend') & (dividends_df['payment_date'] == portfolio_date)][['symbol','amount']]
-
-        # merge to main df (trading key) and calculate dividends
-        df = pd.merge(left=df, right=dividends_df, on = 'symbol', how='left')
-        df.rename(columns={'amount':'div_amount'}, inplace=True)
+        # dividend logic - dividends paid on the portfolio date
+        df.reset_index(drop=True, inplace=True)
+        df['div_amount'] = get_corporate_actions('dividend', portfolio_date, df['symbol'])
         df['dividend_cash'] = df['div_amount'] * df['post_cumulative_share_count']
 
         # if we don't have dividends, sad but have to fill with 0
         df['dividend_cash'].fillna(0,inplace=True)
 
-        # split logic
-        splits_df = pd.read_csv(get_data('dividend_split.csv'))
-        splits_df['payment_date'] = pd.to_datetime(splits_df['payment_date'])
-        splits_df = splits_df[(splits_df['div_or_split'] == 'split') & (splits_df['payment_date'] == portfolio_date)][['symbol', 'amount']]
-        df = pd.merge(left=df, right=splits_df, on = 'symbol', how='left')
-        df.rename(columns={'amount':'split_amount'}, inplace=True)
+        # split logic - splits paid on the portfolio date
+        df['split_amount'] = get_corporate_actions('split', portfolio_date, df['symbol'])
 
         # fill NA split amounts as 1 so it won't nullify the new vwap price post multiplication
         df['split_amount'] .fillna(1, inplace=True)
@@ -165,19 +234,16 @@ class Portfolio(Trade):
         df['post_cumulative_share_count'] = df['post_cumulative_share_count'] / df['split_amount'] 
 
         # split out long and short share counts - to be multiplied by active prices later
-        df['long_post_cumulative_share_count'] = df.apply(lambda x : x['post_cumulative_share_count'] if x['post_cumulative_share_count'] > 0 else 0, axis=1)
-        df['short_post_cumulative_share_count'] = df.apply(lambda x : x['post_cumulative_share_count'] if x['post_cumulative_share_count'] < 0 else 0, axis = 1)
+        df['long_post_cumulative_share_count'] = df['post_cumulative_share_count'].where(df['post_cumulative_share_count'] > 0, 0)
+        df['short_post_cumulative_share_count'] = df['post_cumulative_share_count'].where(df['post_cumulative_share_count'] < 0, 0)
 
         # split out the long vs short dividends
-        df['dividend_cash_long'] = df.apply(lambda x : x['dividend_cash'] if x['post_cumulative_share_count'] > 0  else 0, axis=1)
-        df['dividend_cash_short'] = df.apply(lambda x : x['dividend_cash'] if x['post_cumulative_share_count'] < 0  else 0, axis=1)
+        df['dividend_cash_long'] = df['dividend_cash'].where(df['post_cumulative_share_count'] > 0, 0)
+        df['dividend_cash_short'] = df['dividend_cash'].where(df['post_cumulative_share_count'] < 0, 0)
 
         # final filter for no current positions of 0 value in case they were missed with the post cumulative filter
         df = df[df['current_position'] != 0]
 
-        # # export to csv
-        # self.export_to_csv(key = 'position', df = df)
-
         return df[columns]
     
     def get_previous_positions(self, symbol, latest_index):
@@ -284,7 +350,7 @@ class Portfolio(Trade):
         # get the previous portfolio inception return 
         prior_portfolio_inception_return = self.portfolio.loc[start_date,'inception_return']
 
-        print(end_date, prior_portfolio_usd)
+        self.metrics.count('portfolio_rows_evaluated')
 
         # get prior cash
         prior_cash = self.portfolio.loc[start_date,'cash']
@@ -327,7 +393,7 @@ class Portfolio(Trade):
         active_trade_stats_df = self.get_active_positions(end_date)
 
         # get the most up to date prices for the tickers we already had trades for
-        active_prices_df = self.price_key.loc[self.price_key.timestamp == end_date]
+        active_prices_df = self.price_key.get_prices_at(end_date)
 
         # merge active trades with active prices to get the up to date values on all the existing positions
         active_df = pd.merge(left=active_trade_stats_df, right=active_prices_df, how='inner', on='symbol')
@@ -369,21 +435,30 @@ class Portfolio(Trade):
         self.portfolio.iloc[current_loc,24] = (self.portfolio.iloc[current_loc,1] / prior_portfolio_usd) * prior_portfolio_inception_return
     
     def calculate_portfolio(self):
-        if len(self.trading_key.index)==0:
+        # in update mode the carried positions still need marking without new trades
+        if len(self.trading_key.index)==0 and self.state is None:
             self.portfolio.ffill(inplace=True)
 
             # exit the function
             return 0
 
         # if its effectively no trading history (DUMMY ticker only)
-        if (self.trading_key.symbol.unique()[0] == 'DUMMY' and len(self.trading_key.index) == 1):
+        if (self.state is None and self.trading_key.symbol.unique()[0] == 'DUMMY' and len(self.trading_key.index) == 1):
             self.portfolio.ffill(inplace=True)
 
             # exit the function
             return 0
 
         # get the main portfolio calculations
-        self.portfolio.iloc[1:,:].groupby(self.portfolio.index[1:]).apply(self.evaluate_portfolio_row)
+        with self.metrics.stage('portfolio_loop'):
+            if self.use_engine:
+                engine = PortfolioEngine(start_cash=self.start_cash, ann_interest=self.ann_interest)
+                self.portfolio, self.trading_key = engine.run(self.portfolio, self.trading_key, self.price_key, state=self.state)
+                self.end_state = engine.state
+                self.carried_updates = engine.carried_updates
+            else:
+                self.portfolio.iloc[1:,:].groupby(self.portfolio.index[1:]).apply(self.evaluate_portfolio_row)
+        self.metrics.count('portfolio_rows', len(self.portfolio.index))
 
         # previous portfolio value as a helper
         self.portfolio.iloc[:,25] = self.portfolio.iloc[:,1].shift(fill_value=self.start_cash)
@@ -427,23 +502,102 @@ class Portfolio(Trade):
         # derived column : total pnl = unrealized pnl + realized pnl or total long pnl + total short pnl
         self.portfolio.iloc[1:,23] = self.portfolio.iloc[1:,21] + self.portfolio.iloc[1:,22]
 
-        # export portfolio output to csv format
-        self.export_to_csv('portfolio')
+        # update mode - the first row is the state's close, already part of the earlier run
+        if self.state is not None:
+            self.portfolio = self.portfolio.iloc[1:]
+
+        if self.export and self.state is not None:
+            with self.metrics.stage('export'):
+                # add the new portfolio rows and trades to the outputs of the earlier runs
+                self.check_trading_key_csv()
+                self.append_output('portfolio')
+                self.append_output('trading')
+                self.append_output('trades')
+        elif self.export:
+            with self.metrics.stage('export'):
+                # export portfolio output
+                self.export_output('portfolio')
+
+                # export trading key output
+                self.export_output('trading')
 
-        # export trading key output to csv format
-        self.export_to_csv('trading')
+                # export price key output
+                self.export_output('price')
 
-        # export price key output to csv format
-        self.export_to_csv('price')
+                # export the trades (only kept by the columnar exporter, to load the portfolio back)
+                self.export_output('trades')
+
+                # export the latest positions as of the last portfolio date if asked for
+                if self.export_positions:
+                    self.export_latest_positions(self.portfolio.index[-1])
 
         return 0
 
+    # export with the columnar exporter if there is one, to csv otherwise
+    def export_output(self, key: str = 'trading', df : pd.DataFrame = None):
+        if self.exporter is None:
+            self.export_to_csv(key, df)
+        elif key == 'trading':
+            self.exporter.write('trading_key', self.trading_key, address=self.address)
+        elif key == 'price':
+            self.exporter.write_price_key(self.price_key, address=self.address)
+        elif key == 'portfolio':
+            self.exporter.write('portfolio', self.portfolio.rename_axis('date_time'), address=self.address)
+        elif key == 'trades':
+            self.exporter.write('trades', self.trades, address=self.address)
+        elif key == 'position':
+            self.exporter.write('latest_positions', df, address=self.address)
+
+    # latest positions output - the open positions' trading key rows plus the realized profit of the symbols' earlier trades
+    def export_latest_positions(self, portfolio_date):
+        df = self.get_latest_positions(portfolio_date)
+        if len(df.index) < 1:
+            return 0
+
+        entered = self.trading_key[self.trading_key['market_entry_date_time'] < portfolio_date]
+        df['realized_profit_final'] = df['symbol'].map(entered.groupby('symbol')['realized_profit'].sum()) - df['realized_profit']
+        self.export_output(key = 'position', df = df)
+
+        return 0
+
+    # trading_key.csv written before the trade ids were exported (no trade_id column) can't be patched or appended to
+    def check_trading_key_csv(self):
+        path = get_output('trading_key.csv')
+        if self.exporter is None and os.path.exists(path) and 'trade_id' not in pd.read_csv(path, nrows=0).columns:
+            raise ValueError("{} has no trade_id column (written by an older version) - run a full calculate_portfolio "
+                             "without a state to rewrite it before updating".format(path))
+
+    # update mode export - new rows added to the outputs of the earlier runs, the realized profit booked on their
+    # trades patched in by trade id
+    def append_output(self, key: str = 'trading'):
+        if self.exporter is None:
+            if key == 'trading':
+                path = get_output('trading_key.csv')
+                if len(self.carried_updates.index) > 0 and os.path.exists(path):
+                    # the csv gets rewritten with the patched rows - the new rows are appended below
+                    trading_key_df = pd.read_csv(path, index_col='trade_id', float_precision='round_trip')
+                    trading_key_df.update(self.carried_updates)
+                    trading_key_df.to_csv(path)
+                self.trading_key.to_csv(path, mode='a', header=False)
+            elif key == 'portfolio':
+                self.portfolio.to_csv(get_output('portfolio.csv'), mode='a', header=False)
+        elif key == 'trading':
+            self.exporter.append('trading_key', self.trading_key, address=self.address)
+            if len(self.carried_updates.index) > 0:
+                updates = self.carried_updates.join(self.state['positions'].set_index('trade_id')['market_entry_date_time'])
+                self.exporter.append('trading_key', updates, address=self.address)
+        elif key == 'portfolio':
+            self.exporter.append('portfolio', self.portfolio.rename_axis('date_time'), address=self.address)
+        elif key == 'trades':
+            self.exporter.append('trades', self.trades, address=self.address)
+
     # export to csv
     def export_to_csv(self, key: str = 'trading', df : pd.DataFrame = None):
         if key == 'trading':
-            self.trading_key.to_csv(get_output('trading_key.csv'), index=False)
+            # keyed by trade id - updates patch the earlier rows by it (see append_output)
+            self.trading_key.to_csv(get_output('trading_key.csv'))
         elif key == 'price':
-            self.price_key.to_csv(get_output('price_key.csv'))
+            self.price_key.bars.to_csv(get_output('price_key.csv'))
         elif key == 'portfolio':
             self.portfolio.to_csv(get_output('portfolio.csv'))
         elif key == 'crypto_check':
@@ -452,6 +606,14 @@ class Portfolio(Trade):
             df.to_csv(get_output('latest_positions.csv'), index=False)
 
 
+# end of day state saved by Portfolio.save_state - None if there is none yet
+def load_state(address, path=None):
+    path = get_output(os.path.join('state', '{}.pkl'.format(address))) if path is None else path
+    if not os.path.exists(path):
+        return None
+    return pd.read_pickle(path)
+
+
 if __name__ == '__main__':
      # load environment variables (aplaca private and public keys)
     load_dotenv()
@@ -474,6 +636,9 @@ if __name__ == '__main__':
     # blockchain positions
     blockchain_positions = p.get_active_positions(current_time_stamp_clean)
     print(blockchain_positions)
+
+    # where the time went - per stage timings and counters
+    print(p.metrics.report())
     
     # print statement announcing finish and run time taken
     print("---Portfolio finished in %s seconds ---" % (time.time() - start_time))
@@ -0,0 +1,188 @@
+import os
+import time
+import threading
+from web3 import Web3
+from eth_utils import to_wei
+from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+
+# # covey libraries - internal test
+# from utils import lazy_import
+# from covey_gas import GasOracle
+# from covey_client import CoveyClient, get_client
+
+# covey libraries - packaging
+from covey import lazy_import
+from covey.covey_gas import GasOracle
+from covey.covey_client import CoveyClient, get_client
+
+# pandas is only needed for the post_many results - posting only doesn't import it
+pd = lazy_import('pandas')
+
+
+# local nonce counter per address - the node is only asked for the pending transaction count the first time an
+# address posts (or after a failed send), after that the nonces are handed out locally
+class NonceManager:
+    def __init__(self, w3):
+        self.w3 = w3
+        self.nonces = {}
+        self.lock = threading.Lock()
+
+    def next_nonce(self, address):
+        with self.lock:
+            if address not in self.nonces:
+                self.nonces[address] = self.w3.eth.get_transaction_count(address, 'pending')
+            nonce = self.nonces[address]
+            self.nonces[address] = nonce + 1
+            return nonce
+
+    # forget the local count - the next nonce comes from the node again
+    def reset(self, address):
+        with self.lock:
+            self.nonces.pop(address, None)
+
+
+# posts position strings to the covey ledger (createContent) for many wallets at once - one provider, http session,
+# contract and nonce manager for all of them, wallets are posted concurrently and each wallet's posts in order
+class Poster:
+    def __init__(self, **kwargs):
+        # load environment variables (polygon url)
+        load_dotenv()
+
+        # VARIABLE : polygon url
+        self.polygon_url = kwargs.get('POLYGON_URL', 'https://polygon-rpc.com/')
+
+        # VARIABLE : covey ledger address (polygon)
+        self.covey_ledger_polygon_address = kwargs.get('covey_ledger_polygon_address', '0x587Ec5a7a3F2DE881B15776BC7aaD97AA44862Be')
+
+        # VARIABLE : polygon chain id
+        self.polygon_chain_id = kwargs.get('polygon_chain_id', 137)
+
+        # set the gas station url
+        self.gas_station_url = kwargs.get('gas_station_url', 'https://gasstation.polygon.technology/v2')
+
+        # number of wallets posted at the same time
+        self.max_workers = kwargs.get('max_workers', 8)
+
+        # node connection and covey ledger contract - the shared client by default, pass in a client or a web3
+        # connection to post to another chain (i.e. a local dev chain)
+        self.client = kwargs.get('client', None)
+        if self.client is None and kwargs.get('w3', None) is not None:
+            self.client = CoveyClient(w3=kwargs.get('w3'), POLYGON_URL=self.polygon_url,
+                                      covey_ledger_polygon_address=self.covey_ledger_polygon_address)
+        elif self.client is None:
+            self.client = get_client(POLYGON_URL=self.polygon_url, covey_ledger_polygon_address=self.covey_ledger_polygon_address)
+        self.polygon_url = self.client.polygon_url
+        self.covey_ledger_polygon_address = self.client.covey_ledger_polygon_address
+        self.w3 = self.client.w3
+        self.covey_ledger = self.client.covey_ledger
+
+        # http session for the gas station - the client's keep-alive session by default
+        self.session = kwargs.get('session', self.client.session)
+
+        self.nonce_manager = NonceManager(self.w3)
+
+        # gas price lookups - pass one in to share it between posters or to use another fee strategy
+        self.gas_oracle = kwargs.get('gas_oracle', None)
+        if self.gas_oracle is None:
+            self.gas_oracle = GasOracle(gas_station_url=self.gas_station_url, session=self.session, w3=self.w3)
+
+        # createContent gas estimates per (address, 32 byte words of the position string) - the cost only changes
+        # with the length of the stored string
+        self.gas_estimates = {}
+        self.gas_lock = threading.Lock()
+
+    # gas price in gwei - cached by the gas oracle
+    def get_gas_price(self):
+        return self.gas_oracle.get_gas_price()
+
+    def estimate_gas(self, address, position_string, nonce):
+        key = (address, (len(position_string.encode('utf-8')) + 31) // 32)
+        with self.gas_lock:
+            gas = self.gas_estimates.get(key)
+        if gas is None:
+            gas = self.covey_ledger.functions.createContent(position_string).estimate_gas({'from': address, 'nonce': nonce})
+            with self.gas_lock:
+                self.gas_estimates[key] = gas
+        return gas
+
+    # sign and send one post - returns the transaction hash, nonce and gas price (gwei) it was sent with
+    # pass a nonce to replace a pending post (i.e. the same post with a higher gas price)
+    def submit(self, address, address_private, position_string, gas_price=None, nonce=None):
+        address = Web3.toChecksumAddress(address)
+        gas_price = self.get_gas_price() if gas_price is None else gas_price
+        local_nonce = nonce is None
+        nonce = self.nonce_manager.next_nonce(address) if local_nonce else nonce
+        try:
+            txn = self.covey_ledger.functions.createContent(position_string).build_transaction({
+                'chainId': int(self.polygon_chain_id),
+                'gas': self.estimate_gas(address, position_string, nonce),
+                'gasPrice': to_wei(round(gas_price), 'gwei'),
+                'nonce': nonce,
+                'from': address
+            })
+            signed_txn = self.w3.eth.account.sign_transaction(txn, private_key=address_private)
+            return self.w3.eth.send_raw_transaction(signed_txn.rawTransaction).hex(), nonce, round(gas_price)
+        except Exception:
+            # the nonce may or may not have been used - ask the node again next time
+            if local_nonce:
+                self.nonce_manager.reset(address)
+            raise
+
+    # sign and send one post - returns the transaction hash
+    def post(self, address, address_private, position_string, gas_price=None):
+        return self.submit(address, address_private, position_string, gas_price)[0]
+
+    # one wallet's posts in order - a failed post is reported and the wallet's remaining posts still go out
+    def post_wallet(self, posts, gas_price):
+        results = []
+        for address, address_private, position_string in posts:
+            submitted_at = time.time()
+            try:
+                (transaction_hash, nonce, sent_gas_price), error = self.submit(address, address_private, position_string, gas_price), None
+            except Exception as e:
+                (transaction_hash, nonce, sent_gas_price), error = (None, None, None), str(e)
+            results.append((Web3.toChecksumAddress(address), position_string, nonce, sent_gas_price, submitted_at,
+                            transaction_hash, error))
+            print('Posted Trade to: {} for positions: {} on polygon'.format(address, position_string) if error is None else
+                  'Posting to: {} for positions: {} failed: {}'.format(address, position_string, error))
+        return results
+
+    # posts is a list of (address, private key, position string) - returns address, positions, nonce, gas_price,
+    # submitted_at (unix time), transaction_hash and error per post, in the order of the posts
+    def post_many(self, posts):
+        columns = ['address', 'positions', 'nonce', 'gas_price', 'submitted_at', 'transaction_hash', 'error']
+        if len(posts) < 1:
+            return pd.DataFrame(columns=columns)
+
+        # one gas price for the whole batch
+        gas_price = self.get_gas_price()
+
+        wallets = {}
+        for i, post in enumerate(posts):
+            wallets.setdefault(Web3.toChecksumAddress(post[0]), []).append((i, post))
+
+        results = [None] * len(posts)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {address: executor.submit(self.post_wallet, [post for _, post in wallet], gas_price)
+                       for address, wallet in wallets.items()}
+            for address, future in futures.items():
+                for (i, _), result in zip(wallets[address], future.result()):
+                    results[i] = result
+
+        return pd.DataFrame(results, columns=columns)
+
+
+if __name__ == '__main__':
+    # load environment variables (wallet keys)
+    load_dotenv()
+
+    # start the timer
+    start_time = time.time()
+
+    p = Poster()
+    posted = p.post_many([(os.environ.get('WALLET_PUBLIC'), os.environ.get('WALLET_PRIVATE'), 'GOOG:0.25')])
+
+    print(posted)
+
+    print("---{} posts finished in {} seconds ---".format(len(posted.index), time.time() - start_time))
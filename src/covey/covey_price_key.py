@@ -0,0 +1,147 @@
+import numpy as np
+import pandas as pd
+from datetime import timedelta
+
+
+# sparse price key - only the observed bars, with as-of lookups that give the same vwap the dense
+# (every market hour x every symbol, forward then back filled) price key used to hold
+class PriceKey:
+    def __init__(self, **kwargs):
+        # first and last date of the price key
+        self.start = pd.Timestamp(kwargs.get('start')).normalize()
+        self.end = pd.Timestamp(kwargs.get('end')).normalize()
+
+        # the market hours (UTC) a price is available for - 13:00 - 21:00 by default
+        self.hours = sorted(kwargs.get('hours', range(13, 22)))
+
+        # step of the lookup timestamps within the market hours - hourly by default, one minute when minute bars are in
+        # (coarser bars, i.e. daily ones stamped at the market close, sit on the grid as well)
+        self.step = pd.Timedelta(kwargs.get('step', timedelta(hours=1)))
+
+        # the priced symbols as requested from alpaca (i.e. ETH/USD, PARA) - priced at 0 when no bars came back
+        self.symbols = list(kwargs.get('symbols', []))
+
+        # crypto symbols (i.e. ETH/USD) - named ETHUSDT in the price key
+        self.crypto_symbols = list(kwargs.get('crypto_symbols', []))
+
+        # ticker changes (symbol, new_symbol, record_date) - new symbols are named as the old symbol before the record date
+        self.ticker_changes = kwargs.get('ticker_changes', pd.DataFrame(columns=['symbol', 'new_symbol', 'record_date']))
+
+        # observed bars (symbol, timestamp, vwap) - only the ones with a vwap at a market hour between start and end
+        bars = kwargs.get('bars', pd.DataFrame(columns=['symbol', 'timestamp', 'vwap']))
+        bars = bars[['symbol', 'timestamp', 'vwap']].copy()
+        bars['timestamp'] = pd.to_datetime(bars['timestamp'])
+        bars['vwap'] = bars['vwap'].astype(float)
+        bars = bars[bars['vwap'].notnull() & self.on_grid(bars['timestamp'])]
+        self.source = bars.drop_duplicates(['symbol', 'timestamp']).sort_values('timestamp').reset_index(drop=True)
+
+        # price key symbol -> alpaca symbol with the time range the name applies to
+        self.symbol_map = self.get_symbol_map()
+
+        # the observed bars under the price key symbol names
+        self.bars = self.get_bars()
+
+    # timestamps on a step within the market hours - up to the last market hour on the hour
+    def in_session(self, timestamps):
+        timestamps = pd.Series(pd.to_datetime(timestamps))
+        return (timestamps.dt.hour.isin(self.hours) & (timestamps.dt.floor(self.step) == timestamps) &
+                (timestamps - timestamps.dt.normalize() <= timedelta(hours=self.hours[-1]))).to_numpy()
+
+    # timestamps on a step within the market hours between the start and end dates
+    def on_grid(self, timestamps):
+        timestamps = pd.Series(pd.to_datetime(timestamps))
+        return self.in_session(timestamps) & ((timestamps >= self.start) & (timestamps < self.end + timedelta(days=1))).to_numpy()
+
+    # price key symbol names - USDT instead of /USD for crypto and the old symbol before a ticker change
+    def get_symbol_map(self):
+        symbol_map = pd.DataFrame({'source_symbol': pd.Series(self.symbols, dtype=object).unique()})
+        crypto_mask = symbol_map['source_symbol'].str.endswith('/USD') & symbol_map['source_symbol'].isin(self.crypto_symbols)
+        symbol_map['symbol'] = np.where(crypto_mask, symbol_map['source_symbol'].str.replace('/USD', 'USDT', regex=False),
+                                        symbol_map['source_symbol'])
+        symbol_map['valid_from'] = pd.Timestamp.min
+        symbol_map['valid_to'] = pd.Timestamp.max
+
+        # latest ticker change per new symbol
+        changes = self.ticker_changes.copy()
+        changes['record_date'] = pd.to_datetime(changes['record_date'])
+        changes = changes.sort_values('record_date').groupby('new_symbol').tail(1)
+        changes = pd.merge(left=symbol_map, right=changes, left_on='symbol', right_on='new_symbol', how='inner', suffixes=('', '_old'))
+
+        # the new symbol name applies from the record date, the old one before it
+        symbol_map = pd.merge(left=symbol_map, right=changes[['symbol', 'record_date']], on='symbol', how='left')
+        symbol_map['valid_from'] = symbol_map['record_date'].fillna(symbol_map['valid_from'])
+        old_symbol_map = pd.DataFrame({'source_symbol': changes['source_symbol'], 'symbol': changes['symbol_old'],
+                                       'valid_from': pd.Timestamp.min, 'valid_to': changes['record_date']})
+
+        return pd.concat([symbol_map.drop(columns=['record_date']), old_symbol_map], ignore_index=True)
+
+    # observed bars named like the price key symbols
+    def get_bars(self):
+        bars = pd.merge(left=self.source.rename(columns={'symbol': 'source_symbol'}), right=self.symbol_map,
+                        on='source_symbol', how='inner')
+        bars = bars[(bars['timestamp'] >= bars['valid_from']) & (bars['timestamp'] < bars['valid_to'])].copy()
+        bars['delayed_trade_date'] = bars['timestamp'].dt.normalize()
+        return bars[['timestamp', 'symbol', 'vwap', 'delayed_trade_date']].sort_values(['symbol', 'timestamp']).reset_index(drop=True)
+
+    # latest timestamp of the price key
+    def get_max_timestamp(self):
+        return self.end + timedelta(hours=self.hours[-1])
+
+    # price key for a subset of the symbols - same dates and hours
+    def subset(self, symbols):
+        source_symbols = self.symbol_map[self.symbol_map['symbol'].isin(symbols)]['source_symbol'].unique()
+        return PriceKey(start=self.start, end=self.end, hours=self.hours, step=self.step, symbols=source_symbols,
+                        crypto_symbols=self.crypto_symbols, ticker_changes=self.ticker_changes,
+                        bars=self.source[self.source['symbol'].isin(source_symbols)])
+
+    # vwap per (symbol, timestamp) - the latest bar at or before the timestamp, the first one after it if there is
+    # none before, 0 for symbols without bars and nan for symbols / timestamps outside of the price key
+    def get_vwap(self, symbols, timestamps):
+        query = pd.DataFrame({'symbol': np.asarray(symbols, dtype=object),
+                              'timestamp': pd.to_datetime(np.asarray(timestamps))})
+        query['row'] = np.arange(len(query.index))
+        vwap = np.full(len(query.index), np.nan)
+
+        query = query[self.on_grid(query['timestamp'])]
+        query = pd.merge(left=query, right=self.symbol_map, on='symbol', how='inner')
+        query = query[(query['timestamp'] >= query['valid_from']) & (query['timestamp'] < query['valid_to'])]
+
+        if len(query.index) < 1:
+            return vwap
+
+        query = query[['row', 'source_symbol', 'timestamp']].sort_values('timestamp')
+        source = self.source.rename(columns={'symbol': 'source_symbol'})
+        before = pd.merge_asof(query, source, on='timestamp', by='source_symbol', direction='backward')
+        after = pd.merge_asof(query, source, on='timestamp', by='source_symbol', direction='forward')
+
+        vwap[before['row'].to_numpy()] = before['vwap'].fillna(after['vwap']).fillna(0).to_numpy()
+        return vwap
+
+    # vwap of every price key symbol at the timestamp (symbol, vwap)
+    def get_prices_at(self, timestamp):
+        timestamp = pd.Timestamp(timestamp)
+        symbol_map = self.symbol_map[(self.symbol_map['valid_from'] <= timestamp) & (self.symbol_map['valid_to'] > timestamp)]
+        df = pd.DataFrame({'symbol': symbol_map['symbol'].to_numpy()})
+        df['vwap'] = self.get_vwap(df['symbol'], np.repeat(timestamp, len(df.index)))
+        return df[df['vwap'].notnull()]
+
+    # last market hour on the date of the timestamps - NaT if the symbol isn't priced that day
+    def get_last_timestamp(self, symbols, timestamps):
+        last = pd.to_datetime(pd.Series(np.asarray(timestamps))).dt.normalize() + timedelta(hours=self.hours[-1])
+        return pd.Series(np.where(np.isnan(self.get_vwap(symbols, last)), pd.NaT, last), dtype='datetime64[ns]').to_numpy()
+
+    # first step within the market hours at or after the timestamps (same date) and the vwap at that step
+    def get_next_price(self, symbols, timestamps):
+        timestamps = pd.to_datetime(pd.Series(np.asarray(timestamps)))
+        dates = timestamps.dt.normalize()
+        hours = np.ceil((timestamps - dates) / timedelta(hours=1)).to_numpy()
+        hour_idx = np.searchsorted(self.hours, hours, side='left')
+        next_timestamps = pd.Series(pd.NaT, index=timestamps.index, dtype='datetime64[ns]')
+        mask = hour_idx < len(self.hours)
+        next_timestamps[mask] = dates[mask] + pd.to_timedelta(np.asarray(self.hours)[hour_idx[mask]], unit='h')
+
+        # the next step is still within the market hours - only when the step is finer than an hour
+        next_steps = timestamps.dt.ceil(self.step)
+        mask = self.in_session(next_steps) & (next_steps.dt.normalize() == dates).to_numpy()
+        next_timestamps[mask] = next_steps[mask]
+        return next_timestamps.to_numpy(), self.get_vwap(symbols, next_timestamps)
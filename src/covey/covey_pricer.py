@@ -1,18 +1,41 @@
 import os
 import time
+import random
 import asyncio
+import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
-from alpaca.data.timeframe import TimeFrame
+from datetime import datetime, timedelta, time as dt_time
+from alpaca.data.timeframe import TimeFrame, TimeFrameUnit
 from alpaca.data.requests import CryptoBarsRequest, StockBarsRequest
 from alpaca.data import CryptoHistoricalDataClient, StockHistoricalDataClient
+from alpaca.common.exceptions import APIError
+from concurrent.futures import ThreadPoolExecutor
 
 # for packaging
-from covey import get_data, get_segments
+from covey import get_segments
+from covey.covey_calendar import CoveyCalendar, lookup_business_dates
+from covey.covey_collector import ChunkCollector
+from covey.covey_price_key import PriceKey
+from covey.covey_reference import get_ticker_changes
+from covey.covey_metrics import Metrics
 
 # # for internal testing
 # from utils import get_data, get_checks
+# from covey_calendar import CoveyCalendar, lookup_business_dates
+# from covey_collector import ChunkCollector
+# from covey_price_key import PriceKey
+# from covey_reference import get_ticker_changes
+# from covey_metrics import Metrics
+
+
+# bar length of an alpaca timeframe (i.e. 1 minute for TimeFrame.Minute)
+def get_timeframe_step(timeframe):
+    units = {TimeFrameUnit.Minute: timedelta(minutes=1), TimeFrameUnit.Hour: timedelta(hours=1),
+             TimeFrameUnit.Day: timedelta(days=1)}
+    if timeframe.unit not in units:
+        raise ValueError("Unsupported timeframe {}, use minute, hour or day bars".format(timeframe))
+    return timeframe.amount * units[timeframe.unit]
 
 
 # Pricer class using the new alpaca-SDK (alpaca-py) package
@@ -21,11 +44,13 @@ class Pricer:
         # load environment variables (aplaca private and public keys)
         load_dotenv()
 
-        # initialize the 'df' variable, the data frame with final output depending on what we ask (prices, quotes)
-        self.prices = pd.DataFrame(columns=['symbol','timestamp','vwap', 'open', 'high', 'low', 'close', 'volume', 'trade_count'])
+        # collects the price chunks as they come in - index is symbol & timestamp, the native format for new alpaca
+        self.price_chunks = ChunkCollector(columns=['symbol','timestamp','vwap', 'open', 'high', 'low', 'close', 'volume', 'trade_count'],
+                                           dtypes={c: 'float64' for c in ['vwap', 'open', 'high', 'low', 'close', 'volume', 'trade_count']},
+                                           index=['symbol','timestamp'])
 
-        # set the index to be symbol & timestamp - this is the native format for new alpaca
-        self.prices.set_index(['symbol','timestamp'], inplace=True)
+        # initialize the 'df' variable, the data frame with final output depending on what we ask (prices, quotes)
+        self.prices = self.price_chunks.to_frame()
 
         # set the start date (if not provided)
         self.start = kwargs.get('start',pd.Timestamp('2022-01-01', tz=None).date().isoformat())
@@ -34,9 +59,24 @@ class Pricer:
         self.end = kwargs.get('end', pd.Timestamp(datetime.now().strftime('%Y-%m-%d'),
                                                   tz=None).date().isoformat())
 
-        # set the time frame - default to Hour
+        # set the time frame - default to Hour (TimeFrame.Day for end of day marks, stamped at the market close)
         self.timeframe = kwargs.get('timeframe',TimeFrame.Hour)
 
+        # finer bars (i.e. TimeFrame.Minute) only around the trade entries (symbol, entry_date_time) - from the entry
+        # date through the next business day, downloaded alongside the time frame bars
+        self.entry_timeframe = kwargs.get('entry_timeframe', None)
+        self.entries = kwargs.get('entries', None)
+
+        # demand driven pricing - the time frame bars only for the days the entries need (market entries and the market
+        # closes while their positions are open, see get_demand_windows) instead of the full history from start to end
+        self.demand = kwargs.get('demand', False)
+        if self.demand and self.entries is None:
+            raise ValueError("Demand driven pricing needs the trade entries (symbol, entry_date_time, target_percentage)")
+
+        # business dates (covey_calendar) - the entry windows and the market closes daily bars get stamped at,
+        # fetched if needed and not provided
+        self.calendar_key = kwargs.get('calendar_key', None)
+
         # the entire symbol list
         self.symbols = kwargs.get('symbols', ['AAPL', 'ETHUSDT'])
 
@@ -46,6 +86,30 @@ class Pricer:
         # hard us equity exclusions - no exclusions by default
         self.us_equity_exclusions = kwargs.get('us_equity_exclusions', [])
 
+        # local bar cache (covey_cache.BarCache) so only the missing days get downloaded - opt in, None (the default)
+        # downloads the full history every time and writes nothing to disk
+        self.bar_cache = kwargs.get('bar_cache', None)
+
+        # maximum number of bar requests in flight at once (historic database download)
+        self.max_concurrency = kwargs.get('max_concurrency', 8)
+
+        # retries with exponential backoff (seconds) when alpaca rate limits us or has a server error
+        self.max_retries = kwargs.get('max_retries', 5)
+        self.backoff = kwargs.get('backoff', 1.0)
+
+        # per request timings - symbol, start, end, seconds, attempts, rows
+        self.request_timings = []
+
+        # alpaca data clients - only created when prices have to be fetched, pass them in to price from another
+        # source (i.e. the offline stand ins of covey_benchmark)
+        self.stock_client = kwargs.get('stock_client', None)
+        self.crypto_client = kwargs.get('crypto_client', None)
+
+        # stage timings and counters (covey_metrics.Metrics) - i.e. the one of the Trade asking for the prices
+        self.metrics = kwargs.get('metrics', None)
+        if self.metrics is None:
+            self.metrics = Metrics()
+
         # us equity Tickers - set upon initialization
         self.us_equity_symbols = self.get_us_equity_symbols()
 
@@ -53,10 +117,14 @@ class Pricer:
         self.crypto_symbols = self.get_crypto_symbols()
 
         # gather the trades
-        asyncio.run(self.gather_prices())
+        with self.metrics.stage('price_download'):
+            asyncio.run(self.gather_prices())
+        self.metrics.count('bar_rows', len(self.prices.index))
+        self.metrics.gauge('priced_symbols', len(self.us_equity_symbols) + len(self.crypto_symbols))
 
         # generate price key
-        self.price_key = self.get_price_key()
+        with self.metrics.stage('price_key_build'):
+            self.price_key = self.get_price_key()
 
     # extracting us equity symbols from symbols list
     def get_us_equity_symbols(self):
@@ -69,6 +137,19 @@ class Pricer:
         return [c.replace('USDT', '/USD') for c in self.symbols if c.endswith('USDT')
                 and c not in self.crypto_exclusions]
 
+    # alpaca stock client - needs the public and private keys
+    def get_stock_client(self):
+        if self.stock_client is None:
+            self.stock_client = StockHistoricalDataClient(os.environ.get('APCA_API_KEY_ID'),
+                                                          os.environ.get('APCA_API_SECRET_KEY'))
+        return self.stock_client
+
+    # alpaca crypto client - no keys needed
+    def get_crypto_client(self):
+        if self.crypto_client is None:
+            self.crypto_client = CryptoHistoricalDataClient()
+        return self.crypto_client
+
     # pulling equity prices
     async def get_prices_equity(self):
         # make sure we have equity symbols
@@ -78,51 +159,80 @@ class Pricer:
             # not so fast check for ticker changes
             self.us_equity_symbols = self.check_ticker_change(self.us_equity_symbols)
 
-            client = StockHistoricalDataClient(os.environ.get('APCA_API_KEY_ID'),  
-                                                os.environ.get('APCA_API_SECRET_KEY'))
-            
-            # set the request parameters (i.e. start, frequency, symbols)
-            request_params = StockBarsRequest(
-                            symbol_or_symbols=self.us_equity_symbols,
-                            timeframe=self.timeframe,
-                            start=datetime.strptime(self.start,'%Y-%m-%d')
-                    )
-
-            # capture the bars list
-            bars = client.get_stock_bars(request_params)
-
-            # perform dataframe operatios only if we have any bars
-            if len(bars.data) > 0:
-
-                # convert the bars list 
-                bars_df = bars.df
-
-                bars_df['vwap'] = bars_df.groupby('symbol')['vwap'].shift()
-
-                # append to the initial price df - we only need vwap 
-                self.prices = pd.concat([self.prices, bars_df])
+            client = self.get_stock_client()
+
+            def get_equity_bars(symbols, start, end, timeframe):
+                # set the request parameters (i.e. start, frequency, symbols)
+                request_params = StockBarsRequest(
+                                symbol_or_symbols=symbols,
+                                timeframe=timeframe,
+                                start=start,
+                                end=end
+                        )
+
+                # capture the bars list - retried on rate limits and server errors
+                return self.request_bars(client.get_stock_bars, request_params)
+
+            # capture the bars - from the bar cache where we can, the time frame bars and the entry windows side by side
+            bar_frames, entry_frames = await asyncio.gather(
+                asyncio.to_thread(self.get_timeframe_bars, self.us_equity_symbols, get_equity_bars),
+                asyncio.to_thread(self.get_entry_bars, self.us_equity_symbols, get_equity_bars))
+
+            # intraday vwaps are taken as of the end of the bar (the previous bar's vwap), daily ones at the close
+            for frame, timeframe in [(f, self.timeframe) for f in bar_frames] + [(f, self.entry_timeframe) for f in entry_frames]:
+                # perform dataframe operatios only if we have any bars
+                if len(frame.index) > 0:
+                    if timeframe.unit == TimeFrameUnit.Day:
+                        frame = self.stamp_daily_bars(frame)
+                    else:
+                        frame['vwap'] = frame.groupby('symbol')['vwap'].shift()
+
+                    # append to the price chunks - we only need vwap 
+                    self.price_chunks.append(frame)
         
         return 0
 
 
-    async def get_single_equity_prices(self, symbol, client, start, end):
+    # one bars request (i.e. client.get_stock_bars) - retried with exponential backoff on rate limits and server
+    # errors, the timing, attempts and row count go into the request timings
+    def request_bars(self, get_bars, request_params):
+        request_start_time = time.time()
+        attempt = 1
+        while True:
+            try:
+                # capture the bars list
+                self.metrics.count('alpaca_calls')
+                bars = get_bars(request_params)
+                break
+            except APIError as e:
+                if e.status_code not in [429, 500, 502, 503, 504] or attempt > self.max_retries:
+                    raise
+                # back off with some jitter so the waiting requests don't all come back at once
+                time.sleep(self.backoff * 2 ** (attempt - 1) * (1 + random.random()))
+                attempt += 1
+
+        bars_df = bars.df if len(bars.data) > 0 else pd.DataFrame()
+        self.request_timings.append({'symbol': request_params.symbol_or_symbols, 'start': request_params.start,
+                                     'end': request_params.end, 'attempts': attempt, 'rows': len(bars_df.index),
+                                     'seconds': time.time() - request_start_time})
+
+        return bars_df
+
+    # bars for one symbol and segment
+    def get_single_equity_prices(self, symbol, client, start, end):
         # set the request parameters (i.e. start, frequency, symbols)
-        
         request_params = StockBarsRequest(
                         symbol_or_symbols=symbol,
                         timeframe=self.timeframe,
                         start=start,
                         end = end
                 )
-        try:
-            # capture the bars list
-            bars = client.get_stock_bars(request_params)
 
-            # append to the initial price df - we only need vwap 
-            self.prices = pd.concat([self.prices, bars.df])
+        try:
+            return self.request_bars(client.get_stock_bars, request_params)
         except AttributeError:
             print("Could not find prices for {} between {} and {}".format(symbol,start,end))
-        
+            return pd.DataFrame()
 
     async def get_equity_historic_database(self):
         # make sure we have equity symbols
@@ -132,20 +242,24 @@ class Pricer:
             # not so fast check for ticker changes
             self.us_equity_symbols = self.check_ticker_change(self.us_equity_symbols)
 
-            client = StockHistoricalDataClient(os.environ.get('APCA_API_KEY_ID'),  
-                                                os.environ.get('APCA_API_SECRET_KEY'))
+            client = self.get_stock_client()
 
             # break up the dates into segments 
             segments = get_segments(self.start, self.end)
 
+            # every symbol x segment request runs in the thread pool - at most max concurrency at once
+            # segments are inclusive so the request ends at midnight after the segment's last day
+            loop = asyncio.get_running_loop()
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                frames = await asyncio.gather(*[loop.run_in_executor(executor, self.get_single_equity_prices, symbol, client,
+                                                pd.Timestamp(segment[0], tz=None).to_pydatetime(), 
+                                                (pd.Timestamp(segment[1], tz=None) + timedelta(days=1)).to_pydatetime())
+                                                for symbol in self.us_equity_symbols for segment in segments])
 
-            # loop through the symbols and create a task group/coroutine
-            for symbol in self.us_equity_symbols:
-                for segment in segments:
-                    await asyncio.gather(self.get_single_equity_prices(symbol, client, 
-                                    pd.Timestamp(segment[0], tz=None).date().isoformat(), 
-                                    pd.Timestamp(segment[1], tz=None).date().isoformat())
-                    )
+            # build the price df once all the requests are back
+            for f in frames:
+                self.price_chunks.append(f)
+            self.prices = self.price_chunks.to_frame()
 
    
     # pulling crypto prices (no need to authenticate with public/private keys here)
@@ -153,118 +267,214 @@ class Pricer:
         # make sure we have crypt symbols
         if len(self.crypto_symbols) > 0:
             # initialize the client
-            client = CryptoHistoricalDataClient()
-            
-            # set the request parameters (i.e. start, frequency, symbols)
-            request_params = CryptoBarsRequest(
-                            symbol_or_symbols=self.crypto_symbols,
-                            timeframe=self.timeframe,
-                            start=datetime.strptime(self.start,'%Y-%m-%d')
-                    )
-
-            # capture the bars list
-            bars = client.get_crypto_bars(request_params)
-
-             # perform dataframe operatios only if we have any bars
-            if len(bars.data) > 0:
-
-                # convert the bars list 
-                bars_df = bars.df
-
-                # append to the initial price df - we only need vwap 
-                self.prices = pd.concat([self.prices, bars_df])
+            client = self.get_crypto_client()
+
+            def get_crypto_bars(symbols, start, end, timeframe):
+                # set the request parameters (i.e. start, frequency, symbols)
+                request_params = CryptoBarsRequest(
+                                symbol_or_symbols=symbols,
+                                timeframe=timeframe,
+                                start=start,
+                                end=end
+                        )
+
+                # capture the bars list - retried on rate limits and server errors
+                return self.request_bars(client.get_crypto_bars, request_params)
+
+            # capture the bars - from the bar cache where we can, the time frame bars and the entry windows side by side
+            bar_frames, entry_frames = await asyncio.gather(
+                asyncio.to_thread(self.get_timeframe_bars, self.crypto_symbols, get_crypto_bars),
+                asyncio.to_thread(self.get_entry_bars, self.crypto_symbols, get_crypto_bars))
+
+            for frame, timeframe in [(f, self.timeframe) for f in bar_frames] + [(f, self.entry_timeframe) for f in entry_frames]:
+                 # perform dataframe operatios only if we have any bars
+                if len(frame.index) > 0:
+                    if timeframe.unit == TimeFrameUnit.Day:
+                        frame = self.stamp_daily_bars(frame)
+
+                    # append to the price chunks - we only need vwap 
+                    self.price_chunks.append(frame)
 
         return 0
 
+    # bars from start to end (the pricer's dates by default) for the symbols - only the day ranges missing from the
+    # bar cache get downloaded
+    def get_bars(self, symbols, get_bars_df, timeframe=None, start=None, end=None):
+        timeframe = self.timeframe if timeframe is None else timeframe
+        start = datetime.strptime(self.start,'%Y-%m-%d').date() if start is None else start
+
+        # no cache - the full history up to the latest bar (up to the end date if one is given)
+        if self.bar_cache is None:
+            return get_bars_df(symbols, datetime.combine(start, dt_time()),
+                               None if end is None else datetime.combine(end + timedelta(days=1), dt_time()), timeframe)
+
+        end = datetime.strptime(self.end,'%Y-%m-%d').date() if end is None else end
+
+        # symbols missing the same day range share one request
+        missing = {}
+        for symbol in symbols:
+            for missing_range in self.bar_cache.get_missing(timeframe, symbol, start, end):
+                missing.setdefault(missing_range, []).append(symbol)
+
+        for (missing_start, missing_end), missing_symbols in missing.items():
+            bars_df = get_bars_df(missing_symbols, datetime.combine(missing_start, dt_time()),
+                                  datetime.combine(missing_end + timedelta(days=1), dt_time()), timeframe)
+            self.bar_cache.write(timeframe, bars_df, missing_symbols, missing_start, missing_end)
+
+        return self.bar_cache.read(timeframe, symbols, start, end)
+
+    # business dates from the start date - only fetched when daily bars or entry windows need them
+    def get_calendar_key(self):
+        if self.calendar_key is None:
+            self.calendar_key = CoveyCalendar(start_date=self.start).business_dates
+        return self.calendar_key
+
+    # the entries under the alpaca symbols (ETHUSDT -> ETH/USD, old tickers -> the new ones), only the given symbols
+    def get_symbol_entries(self, symbols):
+        ticker_changes = get_ticker_changes().set_index('symbol')['new_symbol']
+        entries = pd.DataFrame({'symbol': self.entries['symbol'].str.replace('USDT$', '/USD', regex=True),
+                                'entry_date_time': pd.to_datetime(self.entries['entry_date_time'])})
+        if 'target_percentage' in self.entries.columns:
+            entries['target_percentage'] = pd.to_numeric(self.entries['target_percentage'], errors='coerce')
+        entries['symbol'] = entries['symbol'].map(ticker_changes).fillna(entries['symbol'])
+
+        return entries[entries['symbol'].isin(symbols)].reset_index(drop=True)
+
+    # business day after the date of each timestamp (the latest a trade can enter the market) - the date itself past
+    # the end of the calendar
+    def get_next_business_date(self, timestamps):
+        timestamps = pd.to_datetime(pd.Series(np.asarray(timestamps)))
+        next_open = lookup_business_dates(self.get_calendar_key(), timestamps, ['next_market_open_t_plus_1'])
+        return pd.to_datetime(next_open['next_market_open_t_plus_1']).dt.normalize().fillna(timestamps.dt.normalize())
+
+    # business day before the date of each timestamp - the date itself before the start of the calendar
+    def get_previous_business_date(self, timestamps):
+        calendar_key = self.get_calendar_key()
+        business_dates = np.sort(calendar_key[calendar_key['date'] == calendar_key['next_market_open_date']]['date'].unique())
+        dates = pd.to_datetime(pd.Series(np.asarray(timestamps))).dt.normalize()
+        idx = np.searchsorted(business_dates, dates.to_numpy(), side='left') - 1
+        return pd.Series(np.where(idx >= 0, business_dates[np.maximum(idx, 0)], dates.to_numpy()), dtype='datetime64[ns]')
+
+    # day ranges (inclusive) per alpaca symbol within the pricer's dates - overlapping and adjacent ranges merged
+    def merge_windows(self, symbols, starts, ends):
+        windows_df = pd.DataFrame({'symbol': np.asarray(symbols, dtype=object),
+                                   'start': pd.to_datetime(pd.Series(np.asarray(starts))).clip(lower=pd.Timestamp(self.start)).dt.date,
+                                   'end': pd.to_datetime(pd.Series(np.asarray(ends))).clip(upper=pd.Timestamp(self.end)).dt.date})
+        windows_df = windows_df[windows_df['start'] <= windows_df['end']].sort_values(['symbol', 'start'])
+
+        windows = {}
+        for symbol, window_start, window_end in windows_df.itertuples(index=False):
+            ranges = windows.setdefault(symbol, [])
+            if len(ranges) > 0 and window_start <= ranges[-1][1] + timedelta(days=1):
+                ranges[-1][1] = max(ranges[-1][1], window_end)
+            else:
+                ranges.append([window_start, window_end])
+
+        return windows
+
+    # day ranges the entry bars are needed for - through the next business day, from the business day before so the
+    # entry bar has the bar before it (intraday vwaps are the previous bar's) and the as-of lookups find the same
+    # latest bar as on the full history
+    def get_entry_windows(self, symbols):
+        if self.entry_timeframe is None or self.entries is None or len(self.entries.index) < 1:
+            return {}
+
+        entries = self.get_symbol_entries(symbols)
+        return self.merge_windows(entries['symbol'], self.get_previous_business_date(entries['entry_date_time']),
+                                  self.get_next_business_date(entries['entry_date_time']))
+
+    # day ranges the time frame bars are needed for in demand mode - the market entries, and the market closes while
+    # a position is open (from an entry with a target until the symbol's next entry enters the market, or the end)
+    # - each from the business day before, so the as-of lookups find the same latest bar as on the full history
+    def get_demand_windows(self, symbols):
+        entries = self.get_symbol_entries(symbols).sort_values(['symbol', 'entry_date_time'], kind='stable')
+        if 'target_percentage' not in entries.columns:
+            entries['target_percentage'] = np.nan
+
+        # trades of a symbol with the same entry date time stay open together (see PositionBook) - the position is only
+        # closed if all of their targets are zero, a missing target counts as an open position
+        entries['held'] = entries['target_percentage'].fillna(1) != 0
+        entries = entries.groupby(['symbol', 'entry_date_time'], sort=False, as_index=False)['held'].any()
+        next_entry = entries.groupby('symbol')['entry_date_time'].shift(-1).fillna(pd.Timestamp(self.end))
+        until = next_entry.where(entries['held'], entries['entry_date_time'])
+
+        return self.merge_windows(entries['symbol'], self.get_previous_business_date(entries['entry_date_time']).to_numpy(),
+                                  self.get_next_business_date(until).to_numpy())
+
+    # bars in day ranges per symbol - one frame per range, symbols with the same range share it
+    def get_window_bars(self, windows, get_bars_df, timeframe):
+        symbols_per_window = {}
+        for symbol, ranges in windows.items():
+            for window_start, window_end in ranges:
+                symbols_per_window.setdefault((window_start, window_end), []).append(symbol)
+
+        return [self.get_bars(window_symbols, get_bars_df, timeframe, window_start, window_end)
+                for (window_start, window_end), window_symbols in sorted(symbols_per_window.items())]
+
+    # time frame bars - the full history from start to end, only the demand windows in demand mode
+    def get_timeframe_bars(self, symbols, get_bars_df):
+        if not self.demand:
+            return [self.get_bars(symbols, get_bars_df)]
+
+        windows = self.get_demand_windows(symbols)
+        self.metrics.count('demand_windows', sum(len(ranges) for ranges in windows.values()))
+        return self.get_window_bars(windows, get_bars_df, self.timeframe)
+
+    # entry time frame bars in the entry windows
+    def get_entry_bars(self, symbols, get_bars_df):
+        windows = self.get_entry_windows(symbols)
+        if len(windows) > 0:
+            self.metrics.count('entry_windows', sum(len(ranges) for ranges in windows.values()))
+        return self.get_window_bars(windows, get_bars_df, self.entry_timeframe)
+
+    # daily bars re-stamped at the market close of their date - the day's vwap is known by then, non business days
+    # are dropped
+    def stamp_daily_bars(self, bars_df):
+        calendar_key = self.get_calendar_key()
+        business_dates = calendar_key[calendar_key['date'] == calendar_key['next_market_open_date']]
+        closes = business_dates.drop_duplicates('date').set_index('date')['next_market_close']
+
+        bars_df = bars_df.reset_index()
+        bars_df['timestamp'] = pd.to_datetime(bars_df['timestamp']).dt.tz_convert(None).dt.normalize().map(closes)
+        bars_df = bars_df[bars_df['timestamp'].notnull()]
+        bars_df['timestamp'] = pd.to_datetime(bars_df['timestamp']).dt.tz_localize('UTC')
+
+        return bars_df.set_index(['symbol', 'timestamp'])
+
+    # step of the price key - the finest of the bars, at most an hour so the market closes stay on the grid
+    def get_step(self):
+        timeframes = [self.timeframe] + ([self.entry_timeframe] if self.entry_timeframe is not None else [])
+        return min([timedelta(hours=1)] + [get_timeframe_step(t) for t in timeframes])
+
     # gather prices into one dataframe
     async def gather_prices(self):
         await asyncio.gather(self.get_prices_equity(), self.get_prices_crypto())
 
-    # generate the final clean price key to be used by trade and portfolio files
-    def get_price_key(self):
-        # make a copy of original df
-        price_key = self.prices.copy()
+        # one concat over all the chunks
+        self.prices = self.price_chunks.to_frame()
 
+    # generate the final clean price key to be used by trade and portfolio files - only the bars we got back,
+    # the in between market hours are looked up as of the latest bar (see covey_price_key.PriceKey)
+    def get_price_key(self):
         # reset the index because we'll need to work with the data and ticker columns
-        price_key.reset_index(inplace=True)
-
-         # conversion for future date operations
-        price_key['timestamp'] = pd.to_datetime(price_key['timestamp'])
+        price_key = self.prices.reset_index()[['symbol','timestamp','vwap']]
 
-        # remove time zone awareness
-        price_key['timestamp'] = price_key['timestamp'].dt.tz_localize(None)
-
-        # add in the delayed trade date column for future joining
-        price_key['delayed_trade_date'] = price_key['timestamp'].dt.strftime('%Y-%m-%d')
-
-        # conversion for merge
-        price_key['delayed_trade_date'] = pd.to_datetime(price_key['delayed_trade_date'])
-
-        # set price key index to symbol + timestamp for easier join with the date symbol cross df later
-        price_key.set_index(['timestamp','symbol'], inplace=True)
-
-        # create date range between start and end with one hour frequency
-        date_range = pd.date_range(self.start, datetime.strptime(self.end,'%Y-%m-%d') + timedelta(days=1),freq = 'h')
-
-        # filter date range above to be between 13:00 - 21:00 (UTC market hours)
-        date_range_market_hours = pd.DataFrame(date_range[(date_range.hour >= 13) & (date_range.hour <= 21)], columns = ['timestamp']) 
+        # conversion for future date operations and remove time zone awareness
+        price_key['timestamp'] = pd.to_datetime(price_key['timestamp']).dt.tz_localize(None)
 
         # get the ticker list - counter for no symbols due to no trades providing the DUMMY ticker - price will be 0$
         ticker_list = self.crypto_symbols + self.us_equity_symbols if len(self.crypto_symbols + self.us_equity_symbols) > 0 else ['DUMMY']
 
-        # cross with symbol list - set the index to symbol and timestamp for easier join with price key
-        date_symbol_cross = date_range_market_hours.merge(pd.DataFrame(list(set(ticker_list)), 
-                                columns =['symbol']), how='cross').set_index(['timestamp','symbol'])
-
-        # merge with date range so that I can say for sure we have prices 13:00 - 21:00
-        price_key_full = date_symbol_cross.merge(price_key,how='left', left_index=True, right_index=True)
-
-        # forward fill and backfill and unpriced time stamps (i.e. daylight savings time oscillating between 20:00 vs
-        # 21:00 closing and 13:00 vs 14:00 open)
-        price_key_full.reset_index(inplace=True)
-        price_key_full.sort_values(by='timestamp', ascending=True, inplace=True)
-        price_key_full['vwap'] = price_key_full.groupby('symbol')['vwap'].transform(lambda x: x.ffill().bfill())
-
-        # fill in the weekend delayed trade dates
-        price_key_full['delayed_trade_date'].fillna(value = pd.to_datetime(price_key_full['timestamp'].dt.floor('D')), inplace=True)
-
-        # remove tickers that absolutely have never been priced - then it's just an alpaca issue
-        checks_df = pd.DataFrame(price_key_full.vwap.notnull().groupby(price_key_full['symbol']).sum().reset_index())
-        checks_df = checks_df[checks_df.vwap !=0]
-
-        # make sure the remaining things that are priced have no nulls - so all the priced counts should be the same per symbol
-        assert(len(checks_df['vwap'].unique()) == 1 or checks_df.isnull().sum().sum() == 0)
-
-        # fill in the rest of prices with 0 so it doesn't affect portfolio math / cash used
-        price_key_full['vwap'].fillna(0, inplace=True)
-
-        # put back the USDT instead of the USD so it doesn't cause problems later in posting the trades
-        price_key_full['symbol'] = price_key_full.apply(lambda x : x['symbol'].replace('/USD', 'USDT') if x['symbol'].endswith('/USD') 
-                                                                and x['symbol'] in self.crypto_symbols else x['symbol'], axis=1)
-
-
-        # check for ticker changes - grab the old symbol 
-        #price_key_full = self.check_ticker_change(price_key_full)
-
         # map back to initial ticker if there was a ticker change (i.e. map PARA back to VIAC before 2/16/2022)
-        ticker_change_df = pd.read_csv(get_data('ticker_changes.csv'))
-        ticker_change_df['record_date'] = pd.to_datetime(ticker_change_df['record_date'])
-        price_key_full = pd.merge(left = price_key_full, right=ticker_change_df, left_on = 'symbol', right_on='new_symbol', how = 'left')
+        ticker_change_df = get_ticker_changes()
 
-        price_key_full['symbol'] = price_key_full.apply(lambda x : x['symbol_y'] if not(pd.isna(x['symbol_y']))
-                                                                 and x['timestamp'] < x['record_date'] else x['symbol_x'],axis=1)
-   
-        # desired columns 
-        output_columns = ['timestamp','symbol','vwap','delayed_trade_date']
-        
-        return price_key_full[output_columns]
+        return PriceKey(bars=price_key, symbols=ticker_list, crypto_symbols=self.crypto_symbols,
+                        ticker_changes=ticker_change_df, start=self.start, end=self.end, step=self.get_step())
 
 # check for ticker changes, i.e. CREE -> WOLF on 10/1/2021
     def check_ticker_change(self,equity_symbols):
-        ticker_change_df = pd.read_csv(get_data('ticker_changes.csv'))
-
-        # grab the latest ticker change per original ticker, just in case
-        ticker_change_df = ticker_change_df.sort_values('record_date').groupby('symbol').tail(1)
+        # the latest ticker change per original ticker, just in case
+        ticker_change_df = get_ticker_changes()
 
         # merge the equity symbols with the ticker change df -  see what remains
         df = pd.merge(left = pd.DataFrame(equity_symbols, columns=['symbol']), right = ticker_change_df, how = 'inner', on  = 'symbol')
@@ -293,7 +503,7 @@ if __name__ == '__main__':
 
     p = Pricer(symbols=symbols , start = '2022-01-01', end = '2022-09-15')
 
-    print(p.price_key)
+    print(p.price_key.bars)
 
     # print how long it took
     print(f"took {time.time() - start_time} sec")
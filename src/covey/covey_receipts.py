@@ -0,0 +1,161 @@
+import os
+import time
+import asyncio
+import warnings
+import aiohttp
+import pandas as pd
+from dotenv import load_dotenv
+
+# # covey libraries - internal test
+# from covey_poster import Poster
+
+# covey libraries - packaging
+from covey.covey_poster import Poster
+
+
+# confirms posted trades (Poster.post_many output) - polls the receipts of all pending transactions in batched
+# json-rpc requests with a growing interval, and replaces transactions that stay pending with a higher gas price
+class ReceiptTracker:
+    def __init__(self, **kwargs):
+        # VARIABLE : polygon url
+        self.polygon_url = kwargs.get('POLYGON_URL', 'https://polygon-rpc.com/')
+
+        # poster to resubmit stuck transactions with - no resubmissions without one
+        self.poster = kwargs.get('poster', None)
+
+        # receipts per json-rpc batch request
+        self.batch_size = kwargs.get('batch_size', 100)
+
+        # seconds between polls - multiplied by backoff after every poll up to max poll interval
+        self.poll_interval = kwargs.get('poll_interval', 2)
+        self.backoff = kwargs.get('backoff', 1.5)
+        self.max_poll_interval = kwargs.get('max_poll_interval', 15)
+
+        # seconds without a receipt before a transaction is resubmitted with the gas price times fee bump
+        # (nodes want at least 10% more to replace a pending transaction)
+        self.stuck_after = kwargs.get('stuck_after', 120)
+        self.fee_bump = kwargs.get('fee_bump', 1.25)
+        self.max_resubmissions = kwargs.get('max_resubmissions', 3)
+
+        # seconds before we stop polling - whatever isn't mined by then is reported as pending
+        self.timeout = kwargs.get('timeout', 600)
+
+        # async json-rpc batch call (list of requests -> list of responses) - pass one in to track on another chain
+        self.rpc = kwargs.get('rpc', None)
+
+    # one json-rpc batch over the shared http session
+    async def post_batch(self, session, batch):
+        async with session.post(self.polygon_url, json=batch) as response:
+            return await response.json(content_type=None)
+
+    # receipt per transaction hash (None while pending) - one batch request per batch size hashes, all at once
+    async def get_receipts(self, session, transaction_hashes):
+        rpc = self.rpc if self.rpc is not None else lambda batch: self.post_batch(session, batch)
+        batches = [transaction_hashes[i:i + self.batch_size] for i in range(0, len(transaction_hashes), self.batch_size)]
+        responses = await asyncio.gather(*[rpc([{'jsonrpc': '2.0', 'id': j, 'method': 'eth_getTransactionReceipt',
+                                                 'params': [transaction_hash]} for j, transaction_hash in enumerate(batch)])
+                                           for batch in batches])
+
+        receipts = {}
+        for batch, response in zip(batches, responses):
+            results = {r.get('id'): r.get('result') for r in response}
+            receipts.update({transaction_hash: results.get(j) for j, transaction_hash in enumerate(batch)})
+        return receipts
+
+    # same nonce, more gas - None if it couldn't be sent (i.e. the original got mined in the meantime)
+    async def resubmit(self, post, address_private):
+        gas_price = max(post['gas_price'] * self.fee_bump, post['gas_price'] + 1)
+        try:
+            transaction_hash, _, gas_price = await asyncio.to_thread(self.poster.submit, post['address'], address_private,
+                                                                     post['positions'], gas_price, int(post['nonce']))
+        except Exception as e:
+            warnings.warn('Resubmitting nonce {} for {} failed: {}'.format(int(post['nonce']), post['address'], e), RuntimeWarning)
+            return None
+        print('Resubmitted nonce {} for {} at {} gwei'.format(int(post['nonce']), post['address'], gas_price))
+        return transaction_hash, gas_price
+
+    # posted is the Poster.post_many output, private keys per address are needed to resubmit stuck transactions
+    # returns per post : status (confirmed, failed, pending or not sent), the mined transaction hash, block number,
+    # gas used, latency (seconds from submission until the receipt was seen) and the number of resubmissions
+    async def track(self, posted, private_keys=None):
+        private_keys = {} if private_keys is None else {a.lower(): k for a, k in private_keys.items()}
+        start = time.time()
+
+        df = posted.reset_index(drop=True).copy()
+        df['status'] = 'not sent'
+        df['block_number'] = None
+        df['gas_used'] = None
+        df['latency'] = None
+        df['resubmissions'] = 0
+        if 'submitted_at' not in df.columns:
+            df['submitted_at'] = start
+
+        # every hash sent per pending post - the original and its replacements, whichever gets mined
+        pending = {i: {'hashes': [row['transaction_hash']], 'last_sent': row['submitted_at'],
+                       'gas_price': row.get('gas_price'), 'nonce': row.get('nonce'),
+                       'address': row['address'], 'positions': row['positions']}
+                   for i, row in df[df['transaction_hash'].notnull()].iterrows()}
+        df.loc[list(pending.keys()), 'status'] = 'pending'
+
+        interval = self.poll_interval
+        async with aiohttp.ClientSession() as session:
+            while len(pending) > 0 and time.time() - start < self.timeout:
+                await asyncio.sleep(interval)
+                interval = min(interval * self.backoff, self.max_poll_interval)
+
+                receipts = await self.get_receipts(session, [h for post in pending.values() for h in post['hashes']])
+                now = time.time()
+
+                for i, post in list(pending.items()):
+                    receipt = next((receipts[h] for h in post['hashes'] if receipts.get(h) is not None), None)
+                    if receipt is not None:
+                        df.loc[i, ['transaction_hash', 'status', 'block_number', 'gas_used', 'latency']] = [
+                            receipt['transactionHash'], 'confirmed' if int(receipt['status'], 16) == 1 else 'failed',
+                            int(receipt['blockNumber'], 16), int(receipt['gasUsed'], 16), now - df.loc[i, 'submitted_at']]
+                        del pending[i]
+                        continue
+
+                    # still nothing - resubmit with more gas if it's been pending for too long
+                    address_private = private_keys.get(post['address'].lower())
+                    if (now - post['last_sent'] > self.stuck_after and self.poster is not None and address_private is not None
+                            and pd.notnull(post['nonce']) and df.loc[i, 'resubmissions'] < self.max_resubmissions):
+                        resubmitted = await self.resubmit(post, address_private)
+                        post['last_sent'] = time.time()
+                        df.loc[i, 'resubmissions'] += 1
+                        if resubmitted is not None:
+                            post['hashes'].append(resubmitted[0])
+                            post['gas_price'] = resubmitted[1]
+
+        return df
+
+    # per wallet : posts, confirmed, failed, pending and not sent counts, mean / max latency and the gas used
+    def summarize(self, tracked):
+        df = tracked.copy()
+        for status in ['confirmed', 'failed', 'pending', 'not sent']:
+            df[status] = (df['status'] == status).astype(int)
+        df['latency'] = pd.to_numeric(df['latency'])
+        df['gas_used'] = pd.to_numeric(df['gas_used'])
+        return df.groupby('address').agg(posts=('status', 'size'), confirmed=('confirmed', 'sum'), failed=('failed', 'sum'),
+                                         pending=('pending', 'sum'), not_sent=('not sent', 'sum'),
+                                         mean_latency=('latency', 'mean'), max_latency=('latency', 'max'),
+                                         gas_used=('gas_used', 'sum'), resubmissions=('resubmissions', 'sum'))
+
+
+if __name__ == '__main__':
+    # load environment variables (wallet keys)
+    load_dotenv()
+
+    # start the timer
+    start_time = time.time()
+
+    # post and wait for the receipt
+    p = Poster()
+    posted = p.post_many([(os.environ.get('WALLET_PUBLIC'), os.environ.get('WALLET_PRIVATE'), 'GOOG:0.25')])
+
+    r = ReceiptTracker(poster=p)
+    tracked = asyncio.run(r.track(posted, private_keys={os.environ.get('WALLET_PUBLIC'): os.environ.get('WALLET_PRIVATE')}))
+
+    print(tracked)
+    print(r.summarize(tracked))
+
+    print("---{} posts confirmed in {} seconds ---".format(len(tracked.index), time.time() - start_time))
@@ -0,0 +1,99 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+
+# # covey libraries - internal test
+# from utils import get_data
+
+# covey libraries - packaging
+from covey import get_data
+
+# parsed reference files per path - (file modification time, parsed data), loaded once per process and
+# reloaded when the csv changes on disk
+_cache = {}
+
+
+# read and parse a csv in the data folder unless we already have it at the same modification time
+def load_reference(name, parse):
+    path = get_data(name)
+    mtime = os.path.getmtime(path)
+    cached = _cache.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, parse(pd.read_csv(path)))
+        _cache[path] = cached
+    return cached[1]
+
+
+# typed dividend / split table plus the amounts per (payment_date, symbol) - multiple dividends on the same
+# day add up, multiple splits multiply
+def parse_dividend_split(df):
+    df = df.astype({'symbol': str, 'div_or_split': str, 'amount': float})
+    df['record_date'] = pd.to_datetime(df['record_date'], errors='coerce')
+    df['payment_date'] = pd.to_datetime(df['payment_date'])
+    return {
+        'table': df,
+        'dividend': df[df['div_or_split'] == 'dividend'].groupby(['payment_date', 'symbol'])['amount'].sum().sort_index(),
+        'split': df[df['div_or_split'] == 'split'].groupby(['payment_date', 'symbol'])['amount'].prod().sort_index()
+    }
+
+
+# typed ticker changes - the latest change per old symbol (i.e. CREE -> WOLF from 10/1/2021)
+def parse_ticker_changes(df):
+    df = df.astype({'symbol': str, 'new_symbol': str})
+    df['record_date'] = pd.to_datetime(df['record_date'])
+    return df.sort_values('record_date').groupby('symbol').tail(1).reset_index(drop=True)
+
+
+# merger entry prices indexed by symbol
+def parse_mergers(df):
+    df = df.astype({'symbol': str, 'entry_price': float})
+    return df.drop_duplicates('symbol', keep='last').set_index('symbol')['entry_price']
+
+
+def get_dividend_split():
+    return load_reference('dividend_split.csv', parse_dividend_split)['table']
+
+
+def get_ticker_changes():
+    return load_reference('ticker_changes.csv', parse_ticker_changes)
+
+
+def get_mergers():
+    return load_reference('mergers.csv', parse_mergers)
+
+
+# dividend or split amount per (payment date, symbol) - nan when there is none
+def get_corporate_actions(kind, payment_dates, symbols):
+    actions = load_reference('dividend_split.csv', parse_dividend_split)[kind]
+    symbols = np.asarray(symbols, dtype=object)
+    payment_dates = pd.to_datetime(np.broadcast_to(np.asarray(payment_dates, dtype='datetime64[ns]'), symbols.shape))
+    return actions.reindex(pd.MultiIndex.from_arrays([payment_dates, symbols])).to_numpy()
+
+
+# the symbol in effect at each timestamp - the new symbol from the record date on, the symbol itself otherwise
+def get_symbols_as_of(symbols, timestamps):
+    changes = get_ticker_changes().set_index('symbol')
+    symbols = pd.Series(np.asarray(symbols, dtype=object))
+    record_dates = symbols.map(changes['record_date'])
+    changed = (record_dates <= pd.to_datetime(pd.Series(np.asarray(timestamps)))).to_numpy()
+    return np.where(changed, symbols.map(changes['new_symbol']), symbols)
+
+
+# merger entry price per symbol - nan for symbols that didn't merge
+def get_merger_prices(symbols):
+    return pd.Series(np.asarray(symbols, dtype=object)).map(get_mergers()).to_numpy(dtype=float)
+
+
+if __name__ == '__main__':
+    # start the timer
+    start_time = time.time()
+
+    print(get_dividend_split())
+    print(get_ticker_changes())
+
+    # second read comes out of the cache
+    cache_time = time.time()
+    get_dividend_split()
+
+    print("---Reference data loaded in {} seconds, cached read in {} seconds ---".format(cache_time - start_time, time.time() - cache_time))
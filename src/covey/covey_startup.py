@@ -0,0 +1,42 @@
+import sys
+import json
+import subprocess
+
+
+# code timed in a fresh interpreter per run - import the trade module and set up a posting only Trade, then report
+# how long that took and which of the analytics libraries got imported along the way
+STARTUP_CODE = """
+import sys, time, json
+start = time.perf_counter()
+import covey.covey_trade as ct
+t = ct.Trade(posting_only=True, address='0x763A38Ba9F4dAb8a03BB3A9f9a72147badDf56Ba')
+print(json.dumps({'seconds': time.perf_counter() - start,
+                  'loaded': [m for m in ('pandas', 'numpy', 'alpaca', 'covey.covey_pricer', 'covey.covey_portfolio')
+                             if m in sys.modules]}))
+"""
+
+
+# posting only startup (import + Trade(posting_only=True)) timed over a number of fresh interpreters
+def measure_startup(runs=5):
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', STARTUP_CODE], capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    seconds = sorted(r['seconds'] for r in results)
+    return {'median': seconds[len(seconds) // 2], 'min': seconds[0], 'max': seconds[-1], 'loaded': results[-1]['loaded']}
+
+
+if __name__ == '__main__':
+    # benchmark : python -m covey.covey_startup <budget in seconds> <runs>
+    # fails if the median posting only startup is over budget or pulls in the analytics libraries
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else 1.2
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    startup = measure_startup(runs)
+
+    print("---Posting only startup : median {:.3f}s (min {:.3f}s, max {:.3f}s) over {} runs, budget {}s ---".format(
+        startup['median'], startup['min'], startup['max'], runs, budget))
+    if len(startup['loaded']) > 0:
+        print("---Analytics modules imported on the posting only path : {} ---".format(startup['loaded']))
+
+    sys.exit(0 if startup['median'] <= budget and len(startup['loaded']) < 1 else 1)
@@ -1,36 +1,47 @@
 import os
-import json
 import time
 import asyncio
 import eth_keys
-import pandas as pd
-import requests
 from web3 import Web3
 from dotenv import load_dotenv
 from eth_account import account
 from datetime import datetime, timedelta
-from web3.middleware import geth_poa_middleware
-from alpaca.trading.client import TradingClient
 
 # # covey libraries - internal test
-# from utils import get_data, get_output, get_checks
-# from covey_pricer import Pricer
-# from covey_calendar import CoveyCalendar
-# from alpaca.trading.requests import GetAssetsRequest
-# from alpaca.trading.enums import AssetClass, AssetExchange
+# from utils import get_data, get_output, get_checks, lazy_import
+# from covey_poster import Poster
+# from covey_client import get_abi, get_client
+# from covey_metrics import Metrics
+# covey_pricer = lazy_import('covey_pricer')
+# covey_calendar = lazy_import('covey_calendar')
+# covey_collector = lazy_import('covey_collector')
+# covey_parser = lazy_import('covey_parser')
+# covey_universe = lazy_import('covey_universe')
+# covey_reference = lazy_import('covey_reference')
 
 # covey libraries - packaging
-from covey import get_data, get_output
-from covey.covey_pricer import Pricer
-from covey.covey_calendar import CoveyCalendar
+from covey import get_output, lazy_import
+from covey.covey_poster import Poster
+from covey.covey_client import get_abi, get_client
+from covey.covey_metrics import Metrics
+covey_pricer = lazy_import('covey.covey_pricer')
+covey_calendar = lazy_import('covey.covey_calendar')
+covey_collector = lazy_import('covey.covey_collector')
+covey_parser = lazy_import('covey.covey_parser')
+covey_universe = lazy_import('covey.covey_universe')
+covey_reference = lazy_import('covey.covey_reference')
+
+# analytics libraries - only imported once trades are read or priced, posting only doesn't need them
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
 
 class Trade:
     def __init__(self, **kwargs):
         # check if posting only - False by default
         self.posting_only = kwargs.get('posting_only',False)
 
-        # Geth web3 for account stuff
-        self.gethWeb3 = Web3(Web3.IPCProvider())
+        # Geth web3 for account stuff - only connected when it's used (see gethWeb3)
+        self.geth_web3 = kwargs.get('gethWeb3', None)
 
         # get the address
         self.address = kwargs.get('address')
@@ -47,32 +58,93 @@ class Trade:
         # VARIABLE : polygon chain id
         self.polygon_chain_id = kwargs.get('polygon_chain_id', 137)
 
-        # set the abi - must pass in the covey ledger file here otherwise will not work
-        self.abi = json.load(open(os.path.join(os.path.dirname(__file__),'CoveyLedger.json')))['abi']
+        # set the abi - read once per process
+        self.abi = get_abi()
+
+        # node connection and covey ledger contract - shared by every Trade in the process unless one is passed in
+        self.client = kwargs.get('client', None)
+        if self.client is None:
+            self.client = get_client(POLYGON_URL=self.polygon_url, covey_ledger_polygon_address=self.covey_ledger_polygon_address)
 
         # set the gas station url
         self.gas_station_url = kwargs.get('gas_station_url','https://gasstation.polygon.technology/v2')
 
+        # shared poster (covey_poster.Poster) - i.e. when posting for many wallets at once
+        self.poster = kwargs.get('poster', None)
+
+        # shared alpaca universe (set of symbols), calendar key and price key - i.e. when running many wallets at once
+        self.universe = kwargs.get('universe', None)
+        self.calendar_key = kwargs.get('calendar_key', None)
+        self.price_key = kwargs.get('price_key', None)
+
+        # bar resolutions when the trades get priced here - the pricer's time frame (alpaca TimeFrame, hourly if None)
+        # and a finer one only around the trade entries (i.e. TimeFrame.Day marks with TimeFrame.Minute entries)
+        self.timeframe = kwargs.get('timeframe', None)
+        self.entry_timeframe = kwargs.get('entry_timeframe', None)
+
+        # demand driven pricing - only the days the trades need priced, not the full history (see covey_pricer.Pricer)
+        self.demand_pricing = kwargs.get('demand_pricing', False)
+
+        # local bar cache for the pricer (covey_cache.BarCache) - no cache if None
+        self.bar_cache = kwargs.get('bar_cache', None)
+
+        # how long the downloaded alpaca universe is reused before it's fetched again
+        self.universe_max_age = kwargs.get('universe_max_age', timedelta(days=1))
+
+        # ledger rows for this address (i.e. partitioned out of one getAllContent scan) - skips the chain call
+        self.ledger = kwargs.get('ledger', None)
+
+        # local indexed ledger store (covey_ledger.LedgerStore) - reads the trades from disk instead of the chain
+        self.ledger_store = kwargs.get('ledger_store', None)
+
+        # stage timings and counters (covey_metrics.Metrics) - pass one in to collect a whole run in one place
+        self.metrics = kwargs.get('metrics', None)
+        if self.metrics is None:
+            self.metrics = Metrics()
+
         # if posting only, we don't need to get the pricer and get alpaca involved
         if not self.posting_only:
 
-            # set up the empty dataframe that all of the trades from all chains will append to
-            self.trades = pd.DataFrame(columns=['address', 'trades', 'entry_date_time'])
+            # already transformed trades can be handed over, otherwise gather them from the chains
+            self.trades = kwargs.get('trades', None)
+
+            # posted entries that couldn't be parsed (i.e. covey-reset) - filled by transform_trades
+            self.malformed_trades = None
+
+            if self.trades is None:
+                # set up the empty dataframe that all of the trades from all chains will append to
+                self.trades = pd.DataFrame(columns=['address', 'trades', 'entry_date_time'])
+
+                # gather the trades
+                asyncio.run(self.gather_trades())
 
-            # gather the trades
-            asyncio.run(self.gather_trades())
+                # transform the trades as necessary to perform any clean up, date renaming etc
+                self.transform_trades()
 
-            # transform the trades as necessary to perform any clean up, date renaming etc
-            self.transform_trades()
-            
-            # generate price key
-            print("Getting price key in the covey trade")
-            p = Pricer(start= self.get_min_trade_entry(), symbols=self.get_symbols())
-            self.price_key = p.price_key
+            # already priced trades can be handed over (i.e. loaded back by covey_export.Exporter)
+            self.trading_key = kwargs.get('trading_key', None)
 
-            # generate trading key with prices
-            self.trading_key = self.get_trading_key()
+            # stop at the trades if pricing is done elsewhere (i.e. one pricer for many wallets)
+            if kwargs.get('pricing', True) and self.trading_key is None:
+                # generate price key
+                if self.price_key is None:
+                    print("Getting price key in the covey trade")
+                    p = covey_pricer.Pricer(start= self.get_min_trade_entry(), symbols=self.get_symbols(), metrics=self.metrics,
+                                            **self.get_pricing_kwargs())
+                    self.price_key = p.price_key
+
+                # generate trading key with prices
+                with self.metrics.stage('trading_key_build'):
+                    self.trading_key = self.get_trading_key()
+                self.metrics.count('trading_key_rows', len(self.trading_key.index))
     
+    # Geth web3 for account stuff
+    @property
+    def gethWeb3(self):
+        if self.geth_web3 is None:
+            self.geth_web3 = Web3(Web3.IPCProvider())
+        return self.geth_web3
+
     # getter for symbols
     def get_symbols(self):
         if len(self.trades.index) < 1:
@@ -125,112 +197,73 @@ class Trade:
 
     # post trades to the polygon chain
     def post_trades_polygon(self,positionString):
-        w3 = Web3(Web3.HTTPProvider(self.polygon_url))
-        w3.middleware_onion.inject(geth_poa_middleware, layer=0)
-        covey_ledger = w3.eth.contract(address=self.covey_ledger_polygon_address, abi=self.abi)
-        my_address = w3.toChecksumAddress(self.address)
-        nonce = w3.eth.get_transaction_count(my_address,'pending')
-        gas = covey_ledger.functions.createContent(positionString).estimate_gas({'from': my_address, 'nonce': nonce}) 
-        gas_price = requests.get(self.gas_station_url).json().get('fast').get('maxFee')
-        txn = covey_ledger.functions.createContent(positionString).build_transaction({
-            'chainId': int(self.polygon_chain_id),
-            'gas': gas,
-            'gasPrice': Web3.toWei(str(round(float(gas_price))), 'gwei'),
-            'nonce': nonce,
-            'from': my_address
-        })
-        signed_txn = w3.eth.account.sign_transaction(txn, private_key= self.address_private)
-        w3.eth.send_raw_transaction(signed_txn.rawTransaction)
+        # one poster (provider, nonces, gas estimates) per trade object unless a shared one was passed in
+        if self.poster is None:
+            self.poster = Poster(client=self.client, polygon_chain_id=self.polygon_chain_id, gas_station_url=self.gas_station_url)
+        transaction_hash = self.poster.post(self.address, self.address_private, positionString)
         print('Posted Trade to: {} for positions: {} on polygon'.format(self.address,positionString))
+        return transaction_hash
 
     # output format [('address', 'position string', unix time),('address', 'position string', unix time),...]
     async def get_trades_polygon(self):
-        w3 = Web3(Web3.HTTPProvider(self.polygon_url))
-        w3.middleware_onion.inject(geth_poa_middleware, layer=0)
-        covey_ledger = w3.eth.contract(address=self.covey_ledger_polygon_address, abi=self.abi)
-        my_address = w3.toChecksumAddress(self.address)
-        result = covey_ledger.functions.getAnalystContent(my_address).call()
-        result_df = pd.DataFrame(result, columns=['address', 'trades', 'entry_date_time'])
+        if self.ledger is not None:
+            result_df = self.ledger[['address', 'trades', 'entry_date_time']].copy()
+        elif self.ledger_store is not None:
+            result_df = self.ledger_store.get_analyst_content(self.address)
+        else:
+            my_address = Web3.toChecksumAddress(self.address)
+            result = self.client.covey_ledger.functions.getAnalystContent(my_address).call()
+            self.metrics.count('chain_calls')
+            result_df = pd.DataFrame(result, columns=['address', 'trades', 'entry_date_time'])
         result_df.insert(0, 'chain', 'MATIC')
-        self.trades = pd.concat([self.trades, result_df])
+        self.trade_chunks.append(result_df)
         return 0
 
     # gather all the chains into one dataframe - gather is an async term in general
     async def gather_trades(self):
-        await asyncio.gather(
-            # skale test net down on 8/5/2022 so commented out for now
-            #self.get_trades_skale(),
-            self.get_trades_polygon()
-            )
+        # every chain adds its trades to the chunks, the trades df gets built once at the end
+        self.trade_chunks = covey_collector.ChunkCollector(columns=['address', 'trades', 'entry_date_time', 'chain'])
+        self.trade_chunks.append(self.trades)
+
+        with self.metrics.stage('chain_fetch'):
+            await asyncio.gather(
+                # skale test net down on 8/5/2022 so commented out for now
+                #self.get_trades_skale(),
+                self.get_trades_polygon()
+                )
+        self.metrics.count('ledger_rows', self.trade_chunks.rows)
 
         # check the trades list, if it's blank we need to put in the DUMMY
-        if len(self.trades) == 0:
+        if self.trade_chunks.rows == 0:
             result_df = pd.DataFrame({'address' : self.address, 
                                         'trades' : 'DUMMY:0', 
                                         'entry_date_time' : time.mktime(datetime.strptime(self.get_min_trade_entry(),'%Y-%m-%d').timetuple())}, index = [0])
             result_df.insert(0, 'chain', 'NONE')
-            self.trades = pd.concat([self.trades, result_df])
-
-    # add BLANK ticker, 0 Target Position for wallets with no activity
-    def cleanup_trade_cells(self,s):
-        return s if len(s) > 0 else 'BLANK:0'
-
-    # check if string is numeric : https://stackoverflow.com/questions/354038/how-do-i-check-if-a-string-is-a-number-float
-    def is_number_repl_isdigit(self,s):
-        """ Returns True is string is a number. """
-        try:
-            return s.lstrip("-").replace('.', '', 1).isdigit()
-        except AttributeError:
-            return False
-    
+            self.trade_chunks.append(result_df)
+
+        self.trades = self.trade_chunks.to_frame()
+
     # grab the alpaca universe - this will be used in the transform trade function
+    # set of tradable and active symbols (i.e. ETHUSD), downloaded at most once per universe max age
     def get_alpaca_universe(self):
-        # initialized trading client
-        b = TradingClient(api_key = os.environ.get('APCA_API_KEY_ID'), secret_key = os.environ.get('APCA_API_SECRET_KEY'))
-        # get the 'list' of assets
-        # search for crypto assets
-        #search_params = GetAssetsRequest(asset_exchange='NYSE')
-        #assets = b.get_all_assets(search_params)
-        
-        asset_list = b.get_all_assets()
-        # put the instance dict() into a dataframe
-        asset_df = pd.DataFrame([a.dict() for a in asset_list])
-        # cleanup
-        asset_df['asset_class'] = asset_df['asset_class'].str.replace('AssetClass.','',regex=True)
-        asset_df['status'] = asset_df['status'].str.replace('AssetStatus.','',regex=True)
-        asset_df['exchange'] = asset_df['exchange'].str.replace('AssetExchange.','', regex=True)
-        asset_df['symbol'] = asset_df['symbol'].str.replace('/','', regex=True)
-        # filter for tradeable and active assets only
-        asset_mask = (asset_df['tradable'] == True) & (asset_df['status'] == 'active')
-        # return filtered df
-        return asset_df[asset_mask]
+        return covey_universe.Universe(max_age=self.universe_max_age).symbols
 
     # transformations to the trades data frame including the actual splitting out of the trades lists
     def transform_trades(self):
         # make sure the trades are actually filled first
         if len(self.trades.index) > 0:
-            # convert unix time to datetime
+            # split the posted strings into one row per ticker : position combo - malformed entries (i.e. covey-reset)
+            # get a 0 target and are kept aside in malformed_trades
+            with self.metrics.stage('trade_parse'):
+                parser = covey_parser.TradeParser(target_dtype='float64', keep_cells=True)
+                self.trades = parser.parse(self.trades)
+                self.malformed_trades = parser.malformed
+            self.metrics.count('positions', len(self.trades.index))
+            self.metrics.count('malformed_positions', len(self.malformed_trades.index))
+
+            # convert unix time to datetime, symbols back to plain strings for the ticker clean up below
             self.trades['entry_date_time'] = pd.to_datetime(self.trades['entry_date_time'], unit='s')
-            # split trades column into multiple rows by delimiter, resulting in each row having one ticker : position combo
-            self.trades = self.trades.assign(trades=self.trades['trades'].str.split(',')).explode('trades')
-            # clean up blank trade cells, empty string
-            self.trades['trades'] = self.trades['trades'].apply(lambda x: self.cleanup_trade_cells(x))
-            # split trades column into symbol, position columns
-            try:
-                self.trades[['symbol', 'target_percentage']] = self.trades['trades'].str.split(':', expand=True).iloc[:,
-                                                                 0:2]
-            except ValueError:
-                self.trades[['symbol', 'target_percentage']] = ['BLANK', 0]
-            
-            # trim the symbol names just in case
-            self.trades['symbol'] = self.trades['symbol'].str.strip()
-
-            # clean up the covey-reset, the target_percentage should be numeric
-            self.trades['target_percentage'] = self.trades['target_percentage'].apply(
-                lambda x: x if self.is_number_repl_isdigit(x) else 0)
-
-            # remove timezone awareness
-            self.trades['entry_date_time'] = self.trades['entry_date_time'].dt.tz_localize(None)
+            self.trades['symbol'] = self.trades['symbol'].astype(str)
 
             # add date only column for the merge
             self.trades['entry_date'] = pd.to_datetime(self.trades['entry_date_time']).dt.date
@@ -239,7 +272,7 @@ class Trade:
             self.trades['entry_date'] = pd.to_datetime(self.trades['entry_date'])
 
             # sort the trades and set the index
-            self.trades.sort_values(by='entry_date_time', ascending=True, inplace=True)
+            self.trades.sort_values(by='entry_date_time', ascending=True, inplace=True, kind='stable')
 
             # set the trade ID - will be in ascending order of entry date time thanks to above line
             self.trades['trade_id'] = [x for x in range(1, len(self.trades.values) + 1)]
@@ -254,7 +287,12 @@ class Trade:
             pre_filter_symbols = self.get_symbols()
 
             # filter on universe - don't want any rogue tickers that will adversely affect the pricer file
-            self.trades = pd.merge(left=self.trades, right=self.get_alpaca_universe()[['symbol']], how='inner', on='symbol')
+            with self.metrics.stage('universe_filter'):
+                if self.universe is None:
+                    self.universe = self.get_alpaca_universe()
+                elif isinstance(self.universe, pd.DataFrame):
+                    self.universe = frozenset(self.universe['symbol'])
+                self.trades = self.trades[covey_universe.is_tradable(self.universe, self.trades['symbol'])].reset_index(drop=True)
 
             # symbols after filter
             post_filter_symbols = self.get_symbols()
@@ -264,6 +302,8 @@ class Trade:
 
             # symbols filtered out
             print(f"{list(set(pre_filter_symbols) - set(post_filter_symbols))} were filtered out.")
+            self.metrics.gauge('symbols', len(post_filter_symbols))
+            self.metrics.count('filtered_symbols', len(set(pre_filter_symbols) - set(post_filter_symbols)))
 
             # print all symbols we've encountered
             #print(f"{list(pre_filter_symbols) + list(post_filter_symbols)} were seen here.")         
@@ -271,53 +311,71 @@ class Trade:
         else:
             print("The trades dataframe has not been filled yet")
 
-    # for debugging sets the reference time as of which we look at prices starting from that time
-    def set_ref_trade_date_time(self,row):
-        date_cols_to_convert = ['entry_date_time', 'date', 'next_market_open_date',
-                                'next_market_open', 'next_market_close']
-        # adjust it to be the next hour where we will take the VWAP of that hour
-        row[date_cols_to_convert] = pd.to_datetime(row[date_cols_to_convert])  # , utc=True)
-        trade_date_time_adj = row['entry_date_time'] + timedelta(minutes=61)
-        trade_date_time_adj = trade_date_time_adj.replace(minute=0, second=0)
-
-        # trade on holiday or non business day, return the next possible
-        if row['date'] != row['next_market_open_date']:
-            new_dt = row['next_market_open'] + timedelta(minutes=61)
-        # trade during pre-market hours but still on a business day
-        elif trade_date_time_adj < row['next_market_open']:
-            new_dt = row['next_market_open'] + timedelta(minutes=61)
-        # trade during post-market hours but still on a business day
-        elif trade_date_time_adj >= row['next_market_close']:
-            new_dt = row['next_market_open_t_plus_1']
-        else:
-            new_dt = trade_date_time_adj
-
-        return new_dt.replace(minute=0, second=0)
-
-    # for updating date time adj based off the prices that we see come in
-    def check_max_timestamp(self,row):
-        date_cols_to_convert = ['max_time_stamp']
-
-        # adjust it to be the next hour where we will take the VWAP of that hour
-        row[date_cols_to_convert] = pd.to_datetime(row[date_cols_to_convert])  # , utc=True)
-        trade_date_time_adj = row['entry_date_time'] + timedelta(minutes=61)
-        trade_date_time_adj = trade_date_time_adj.replace(minute=0, second=0)
+    # pricer time frames - the trade entries get the entry time frame bars (and decide the days priced in demand mode),
+    # the calendar stamps daily bars at the close
+    def get_pricing_kwargs(self):
+        kwargs = {'calendar_key': self.calendar_key}
+        if self.timeframe is not None:
+            kwargs['timeframe'] = self.timeframe
+        if self.entry_timeframe is not None:
+            kwargs['entry_timeframe'] = self.entry_timeframe
+        if self.bar_cache is not None:
+            kwargs['bar_cache'] = self.bar_cache
+        if (self.entry_timeframe is not None or self.demand_pricing) and len(self.trades.index) > 0:
+            kwargs['entries'] = self.trades[['symbol', 'entry_date_time', 'target_percentage']]
+            kwargs['demand'] = self.demand_pricing
+        return kwargs
+
+    # price key step - an hour unless minute bars are priced
+    def get_step(self):
+        return self.price_key.step if self.price_key is not None else timedelta(hours=1)
+
+    # strip what's below the price key step (timestamp.replace(minute=0, second=0) for a whole column when hourly)
+    def floor_step(self, timestamps):
+        return pd.to_datetime(timestamps).dt.floor(self.get_step())
+
+    # sets the reference time as of which we look at prices starting from that time - for all the trades at once
+    def set_ref_trade_date_time(self, df):
+        # adjust it to be the next step (hour) where we will take the VWAP of that step
+        trade_date_time_adj = self.floor_step(pd.to_datetime(df['entry_date_time']) + self.get_step() + timedelta(minutes=1))
+        next_open_adj = self.floor_step(pd.to_datetime(df['next_market_open']) + self.get_step() + timedelta(minutes=1))
+
+        conditions = [
+            # trade on holiday or non business day, return the next possible
+            pd.to_datetime(df['date']) != pd.to_datetime(df['next_market_open_date']),
+            # trade during pre-market hours but still on a business day
+            trade_date_time_adj < pd.to_datetime(df['next_market_open']),
+            # trade during post-market hours but still on a business day
+            trade_date_time_adj >= pd.to_datetime(df['next_market_close'])
+        ]
+        choices = [next_open_adj, next_open_adj, self.floor_step(df['next_market_open_t_plus_1'])]
+
+        return pd.Series(np.select(conditions, choices, trade_date_time_adj), index=df.index, dtype='datetime64[ns]')
+
+    # for updating date time adj based off the prices that we see come in - for all the trades at once
+    def check_max_timestamp(self, df):
+        trade_date_time_adj = self.floor_step(pd.to_datetime(df['entry_date_time']) + self.get_step() + timedelta(minutes=1))
 
         # price history doesn't go all the way up to the floor timestamp (delayed trade time adj)
-        if row['max_time_stamp'] < trade_date_time_adj:
-            new_dt = row['max_time_stamp']
-        else:
-            new_dt = row['market_entry_date_time']
+        max_time_stamp = pd.to_datetime(df['max_time_stamp'])
+        new_dt = max_time_stamp.where(max_time_stamp < trade_date_time_adj, pd.to_datetime(df['market_entry_date_time']))
+
+        return self.floor_step(new_dt)
 
-        return new_dt.replace(minute=0, second=0)
+    # business dates from the start date onwards - sliced from the shared calendar key if we have one
+    def get_calendar_key(self, start_date):
+        with self.metrics.stage('calendar'):
+            if self.calendar_key is None:
+                return covey_calendar.CoveyCalendar(start_date = start_date).business_dates
+            return self.calendar_key[self.calendar_key['date'] >= pd.to_datetime(start_date)]
 
     # check for ticker changes, i.e. CREE -> WOLF on 10/1/2021
     def check_ticker_change(self,trading_key):
-        ticker_change_df = pd.read_csv(get_data('ticker_changes.csv'))
-        df = pd.merge(left = trading_key, right = ticker_change_df, how = 'left', left_on = 'symbol', right_on='symbol')
-        df['record_date'] = pd.to_datetime(df['record_date'])
-        df['symbol'] = df.apply(lambda x : x['new_symbol'] if x['record_date'] <= x['entry_date_time'] else x['symbol'],
-                                axis=1)
+        ticker_change_df = covey_reference.get_ticker_changes().set_index('symbol')
+        df = trading_key.copy()
+        df['new_symbol'] = df['symbol'].map(ticker_change_df['new_symbol'])
+        df['record_date'] = df['symbol'].map(ticker_change_df['record_date'])
+        df['symbol'] = covey_reference.get_symbols_as_of(df['symbol'], df['entry_date_time'])
 
         return df
 
@@ -335,14 +393,13 @@ class Trade:
             pre_price_row_count = len(df.index)
 
             # use the calendar key to get delayed_trade_date (next), and delayed_trade_date_time (next)
-            c = CoveyCalendar(start_date = df['entry_date'].min())
-            calendar_key = c.set_business_dates()
+            calendar_key = self.get_calendar_key(df['entry_date'].min())
 
             # merge trading key with calendar key on date
             df = pd.merge(left= df, right=calendar_key, how='inner', left_on='entry_date', right_on='date')
 
             # set the reference trade date time - adjusting for pre market and post market trade times
-            df['market_entry_date_time'] = df.apply(lambda x: self.set_ref_trade_date_time(x), axis=1)
+            df['market_entry_date_time'] = self.set_ref_trade_date_time(df)
 
             # set the reference date - strip timestamp from market entry date time
             df['market_entry_date'] = pd.to_datetime(df['market_entry_date_time']).dt.date
@@ -354,34 +411,15 @@ class Trade:
             # get_price_key
             #df['symbol'] = df['symbol'].apply(lambda x: x.replace('USDT', 'USD'))
 
-            df = pd.merge(left=df, right=self.price_key, how='left',
-                                   left_on=['symbol', 'market_entry_date'], right_on=['symbol', 'delayed_trade_date'])
-
-            # set max timestamp of prices per trade id, just in case it doesn't show all history between expected open and close times
+            # set max timestamp of prices per trade (last market hour of the market entry date, NaT if the symbol
+            # isn't priced that day), just in case it doesn't show all history between expected open and close times
             # aka RUSL
-            df['max_time_stamp'] = df.groupby('trade_id')['timestamp'].transform('max')
-
-            df['market_entry_date_time'] = df.apply(lambda x: self.check_max_timestamp(x), axis=1)
-
-            # fill in the blank timestamps (no prices returned for that ticker/date) so that it won't be filtered out in the next step
-            # we want to see the un-priced items
-            df['timestamp'].fillna(df['market_entry_date_time'], inplace=True)
-
-            # filter trading key to have trade timestamps fall after the date time adj threshold
-            trading_key_mask = (df['timestamp'] >= df['market_entry_date_time'])
-            df = df[trading_key_mask]
-
-            # add a ranking to grab the next hours only price
-            df['price_rank'] = df.groupby('trade_id')['timestamp'].rank('dense', ascending=True)
-            df = df[df['price_rank'] == 1]
-
-            # don't need price rank anymore
-            df.drop(columns=['price_rank'], inplace=True)
-
-            df.rename(columns=lambda s: s.replace('_x', ''), inplace=True)
+            df['max_time_stamp'] = self.price_key.get_last_timestamp(df['symbol'], df['market_entry_date'])
 
-            df = df.loc[:, ~df.columns.str.endswith('_y')]
+            df['market_entry_date_time'] = self.check_max_timestamp(df)
 
+            # the next hour's vwap at or after the market entry date time - nan for the un-priced items, we want to see them
+            df['timestamp'], df['vwap'] = self.price_key.get_next_price(df['symbol'], df['market_entry_date_time'])
 
             # making sure we did not lose any trades in the price merge
             post_price_row_count = len(df.index)
@@ -394,7 +432,7 @@ class Trade:
             df_post_merge_check.drop(columns = ['trade_id'], inplace=True)
 
             # sort the trades and set the index
-            df_post_merge_check.sort_values(by='entry_date_time', ascending=True, inplace=True)
+            df_post_merge_check.sort_values(by='entry_date_time', ascending=True, inplace=True, kind='stable')
 
             # set the trade ID - will be in ascending order of entry date time thanks to above line
             df_post_merge_check['trade_id'] = [x for x in range(1, len(df_post_merge_check.values) + 1)]
@@ -411,10 +449,9 @@ class Trade:
           
     # checking to see if there's any mergers - using a csv as record keeper for that at the moment
     def merger_check(self, trading_key):
-        merger_df = pd.read_csv(get_data('mergers.csv'))
         df = trading_key.copy()
-        df = pd.merge(left=df, right=merger_df, how = 'left', left_on = 'symbol', right_on='symbol')
-        df['is_merger'] = df.apply(lambda x  : 0 if pd.isnull(x['entry_price']) else 1, axis = 1)
+        df['entry_price'] = covey_reference.get_merger_prices(df['symbol'])
+        df['is_merger'] = df['entry_price'].notnull().astype(int)
         df['symbol_appearance_rank'] = df.groupby('symbol')['trade_id'].rank('dense', ascending=True)
         mergers_only_df = df.loc[(df['is_merger'] == 1) & (df['symbol_appearance_rank'] == 1)]
         mergers_only_df['entry_date_time'] = mergers_only_df['entry_date_time'].dt.normalize()
@@ -429,7 +466,7 @@ class Trade:
         concat_df = concat_df[trading_key.columns]
 
         # re-establish trade id
-        concat_df = concat_df.sort_values(by = 'market_entry_date_time', ascending=True)
+        concat_df = concat_df.sort_values(by = 'market_entry_date_time', ascending=True, kind='stable')
         concat_df['trade_id'] = [x for x in range(1, len(concat_df.values) + 1)]
 
         return concat_df
@@ -438,9 +475,10 @@ class Trade:
     def export_to_csv(self, key : str = 'trading'):
         if len(self.trading_key.index) > 0:
             if key == 'trading':
-                self.trading_key.to_csv(get_output('trading_key.csv'), index=False)
+                # keyed by trade id - portfolio updates patch the earlier rows by it
+                self.trading_key.to_csv(get_output('trading_key.csv'))
             elif key == 'price':
-                self.price_key.to_csv(get_output('price_key.csv'), index=False)
+                self.price_key.bars.to_csv(get_output('price_key.csv'), index=False)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,88 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from datetime import datetime, timedelta
+from alpaca.trading.client import TradingClient
+from alpaca.trading.requests import GetAssetsRequest
+from alpaca.trading.enums import AssetStatus
+
+# # covey libraries - internal test
+# from utils import get_output
+
+# covey libraries - packaging
+from covey import get_output
+
+# tradable symbols per cache file (fetched_at, symbols) - shared by every Trade in the process so the alpaca
+# asset list is only downloaded once per max age
+_universes = {}
+
+
+# the alpaca universe as a set of tradable and active symbols (crypto without the slash, i.e. ETHUSD) - kept in
+# memory and on disk so other processes (i.e. batch workers) don't download it again either
+class Universe:
+    def __init__(self, **kwargs):
+        # load environment variables (aplaca private and public keys)
+        load_dotenv()
+
+        # universe cache file - in the output folder by default
+        self.path = kwargs.get('path', get_output('universe.pkl'))
+
+        # how long before the asset list gets downloaded again
+        self.max_age = kwargs.get('max_age', timedelta(days=1))
+
+        # alpaca trading client - only created when the asset list has to be fetched
+        self.trading_client = kwargs.get('trading_client', None)
+
+        self.symbols = self.get_symbols()
+
+    # tradable symbols of the active alpaca assets - one call, no per asset dict
+    def fetch_symbols(self):
+        if self.trading_client is None:
+            self.trading_client = TradingClient(api_key=os.environ.get('APCA_API_KEY_ID'),
+                                                secret_key=os.environ.get('APCA_API_SECRET_KEY'))
+
+        assets = self.trading_client.get_all_assets(GetAssetsRequest(status=AssetStatus.ACTIVE))
+        return frozenset(a.symbol.replace('/', '') for a in assets if a.tradable and a.status == AssetStatus.ACTIVE)
+
+    # the symbol set from memory or disk, downloaded again once it's older than max age
+    def get_symbols(self):
+        cached = _universes.get(self.path)
+        if cached is None and os.path.exists(self.path):
+            cached = pd.read_pickle(self.path)
+
+        if cached is None or datetime.utcnow() - cached['fetched_at'] > self.max_age:
+            cached = {'fetched_at': datetime.utcnow(), 'symbols': self.fetch_symbols()}
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            pd.to_pickle(cached, self.path)
+
+        _universes[self.path] = cached
+
+        return cached['symbols']
+
+    # membership per symbol - each distinct symbol is only looked up once
+    def contains(self, symbols):
+        return is_tradable(self.symbols, symbols)
+
+
+# True for the symbols in the universe (a set of symbols), for a whole column at once - missing symbols are False
+def is_tradable(universe, symbols):
+    codes, uniques = pd.factorize(pd.Series(np.asarray(symbols, dtype=object)))
+    found = np.fromiter((s in universe for s in uniques), dtype=bool, count=len(uniques))
+    return np.append(found, False)[codes]
+
+
+if __name__ == '__main__':
+    # start the timer
+    start_time = time.time()
+
+    u = Universe()
+
+    print("{} tradable symbols".format(len(u.symbols)))
+
+    # second read comes out of the cache
+    cache_time = time.time()
+    Universe()
+
+    print("---Universe loaded in {} seconds, cached read in {} seconds ---".format(cache_time - start_time, time.time() - cache_time))
@@ -1,4 +1,6 @@
 import os
+import sys
+import importlib
 
 _ROOT = os.path.abspath(os.path.dirname(__file__))
 
@@ -11,3 +13,21 @@ def get_output(path):
 def get_checks(path):
     return os.path.join(_ROOT, 'checks', path)
 
+# stands in for a module until one of its attributes is used - then imports it and takes over its namespace
+class LazyModule:
+    def __init__(self, name):
+        self.__dict__['_lazy_name'] = name
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._lazy_name)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+    def __repr__(self):
+        return "<lazy module '{}'>".format(self._lazy_name)
+
+# the module if it's already imported, a LazyModule otherwise - keeps heavy libraries (pandas, alpaca) out of
+# the import path until they are needed
+def lazy_import(name):
+    return sys.modules[name] if name in sys.modules else LazyModule(name)
+
@@ -0,0 +1,53 @@
+import pytest
+
+from covey.covey_benchmark import SyntheticMarket, StubChainClient, StubStockClient, StubCryptoClient, StubTradingClient
+from covey.covey_pricer import Pricer
+from covey.covey_universe import Universe
+from covey.covey_calendar import CoveyCalendar
+
+
+# small synthetic market (covey_benchmark) - everything below runs offline against its stub clients
+@pytest.fixture(scope='session')
+def market():
+    return SyntheticMarket(wallets=2, trades=60, symbols=12, days=40, seed=0)
+
+
+@pytest.fixture(scope='session')
+def universe(market, tmp_path_factory):
+    path = tmp_path_factory.mktemp('universe') / 'universe.pkl'
+    return Universe(path=str(path), trading_client=StubTradingClient(market)).symbols
+
+
+@pytest.fixture(scope='session')
+def calendar_key(market, tmp_path_factory):
+    path = tmp_path_factory.mktemp('calendar') / 'calendar.pkl'
+    return CoveyCalendar(start_date='2022-01-01', path=str(path), trading_client=StubTradingClient(market)).business_dates
+
+
+# every symbol the ledger can post (crypto as XXXUSDT) plus an unlisted one
+@pytest.fixture(scope='session')
+def symbols(market):
+    return market.equity_symbols + [c + 'T' for c in market.crypto_symbols] + ['ZZZZ']
+
+
+# pricer kwargs for the stub clients over the whole market, no bar cache
+@pytest.fixture
+def pricer_kwargs(market, symbols, calendar_key):
+    return {'start': market.start.strftime('%Y-%m-%d'), 'end': market.end.strftime('%Y-%m-%d'), 'symbols': list(symbols),
+            'stock_client': StubStockClient(market), 'crypto_client': StubCryptoClient(market), 'bar_cache': None,
+            'calendar_key': calendar_key}
+
+
+# hourly price key of the whole market
+@pytest.fixture(scope='session')
+def price_key(market, symbols, calendar_key):
+    return Pricer(start=market.start.strftime('%Y-%m-%d'), end=market.end.strftime('%Y-%m-%d'), symbols=list(symbols),
+                  stock_client=StubStockClient(market), crypto_client=StubCryptoClient(market), bar_cache=None,
+                  calendar_key=calendar_key).price_key
+
+
+# portfolio kwargs for a wallet of the market - no exports
+@pytest.fixture
+def portfolio_kwargs(market, universe, calendar_key, price_key):
+    return {'client': StubChainClient(market), 'universe': universe, 'calendar_key': calendar_key, 'price_key': price_key,
+            'export': False}
@@ -0,0 +1,48 @@
+import os
+from types import SimpleNamespace
+
+import pandas as pd
+
+import covey.covey_batch as covey_batch
+import covey.covey_ledger as covey_ledger
+from covey.covey_batch import PortfolioBatch
+from covey.covey_ledger import Ledger, LedgerStore
+from covey.covey_portfolio import Portfolio
+
+
+def test_batch_reads_the_default_ledger_store(tmp_path, monkeypatch):
+    get_output = lambda f: os.path.join(str(tmp_path), f)
+    monkeypatch.setattr(covey_batch, 'get_output', get_output)
+    monkeypatch.setattr(covey_ledger, 'get_output', get_output)
+
+    # no store built yet - getAllContent scan
+    assert PortfolioBatch(addresses=['0xabc']).ledger_store is None
+
+    LedgerStore()
+    b = PortfolioBatch(addresses=['0xabc'])
+    assert isinstance(b.ledger_store, LedgerStore)
+    assert b.ledger_store.path == get_output('covey_ledger.db')
+
+
+# the synthetic ledger in one getAllContent call
+def get_ledger(market):
+    content = list(market.ledger[['address', 'trades', 'entry_date_time']].itertuples(index=False, name=None))
+    functions = SimpleNamespace(getAllContent=lambda: SimpleNamespace(call=lambda: content))
+    return Ledger(client=SimpleNamespace(covey_ledger=SimpleNamespace(functions=functions)))
+
+
+# the worker processes calculate the same portfolios as one Portfolio per wallet
+def test_batch_matches_sequential_portfolios(market, portfolio_kwargs):
+    b = PortfolioBatch(addresses=market.addresses, ledger=get_ledger(market), universe=portfolio_kwargs['universe'],
+                       calendar_key=portfolio_kwargs['calendar_key'], price_key=portfolio_kwargs['price_key'], max_workers=2)
+    b.calculate_portfolios()
+
+    assert b.failed == []
+    assert list(b.portfolio.index.get_level_values('address').unique()) == market.addresses
+    for address in market.addresses:
+        p = Portfolio(address=address, **portfolio_kwargs)
+        p.calculate_portfolio()
+
+        pd.testing.assert_frame_equal(b.portfolio.loc[address], p.portfolio, check_freq=False, check_names=False)
+        trading_key = b.trading_key[b.trading_key['address'] == address].set_index('trade_id')
+        pd.testing.assert_frame_equal(trading_key, p.trading_key, check_names=False)
@@ -0,0 +1,29 @@
+from covey.covey_benchmark import SyntheticMarket, StubStockClient, Benchmark, compare
+
+
+def test_same_seed_same_market():
+    a = SyntheticMarket(wallets=2, trades=10, symbols=5, days=10, seed=3)
+    b = SyntheticMarket(wallets=2, trades=10, symbols=5, days=10, seed=3)
+    assert a.ledger.equals(b.ledger)
+    assert a.bars.equals(b.bars)
+
+
+def test_stub_client_serves_the_requested_range(market):
+    bars = StubStockClient(market).get_bars(market.equity_symbols[:2], '2022-01-04', '2022-01-05')
+    timestamps = bars.index.get_level_values('timestamp')
+    assert set(bars.index.get_level_values('symbol')) == set(market.equity_symbols[:2])
+    assert timestamps.min().date().isoformat() == '2022-01-04' and timestamps.max().date().isoformat() == '2022-01-04'
+
+
+def test_benchmark_runs_offline():
+    market = SyntheticMarket(wallets=2, trades=20, symbols=6, days=15, seed=1)
+    results = Benchmark(market=market, memory=False).run()
+    assert results['portfolios'] == 2
+    assert set(results['stages']) == {'universe', 'trades', 'calendar', 'prices', 'portfolios'}
+
+
+def test_compare_flags_slower_stages():
+    baseline = {'stages': {'prices': {'seconds': 1.0}, 'portfolios': {'seconds': 1.0}}}
+    results = {'stages': {'prices': {'seconds': 2.0}, 'portfolios': {'seconds': 1.01}}}
+    regressions = compare(results, baseline)
+    assert len(regressions) == 1 and regressions[0].startswith('prices')
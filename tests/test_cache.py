@@ -0,0 +1,66 @@
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+from alpaca.data.timeframe import TimeFrame
+
+from covey.covey_cache import BarCache
+from covey.covey_pricer import Pricer
+
+
+# hourly bars of the symbols between start and end (inclusive dates) - same index as the alpaca bars df
+def get_bars_df(symbols, start, end):
+    timestamps = pd.date_range(start, end + timedelta(days=1), freq='H', inclusive='left', tz='UTC')
+    index = pd.MultiIndex.from_product([symbols, timestamps], names=['symbol', 'timestamp'])
+    return pd.DataFrame({'vwap': range(len(index))}, index=index, dtype='float64')
+
+
+def test_missing_ranges_across_months(tmp_path):
+    cache = BarCache(root=str(tmp_path))
+    cache.write(TimeFrame.Hour, get_bars_df(['XAAA', 'ETH/USD'], date(2022, 1, 25), date(2022, 2, 5)), ['XAAA', 'ETH/USD'],
+                date(2022, 1, 25), date(2022, 2, 5))
+    cache.write(TimeFrame.Hour, get_bars_df(['XAAA'], date(2022, 2, 10), date(2022, 2, 12)), ['XAAA'],
+                date(2022, 2, 10), date(2022, 2, 12))
+
+    # one pickle per symbol and month
+    assert sorted(p.name for p in (tmp_path / str(TimeFrame.Hour) / 'ETH_USD').glob('*.pkl')) == ['2022-01.pkl', '2022-02.pkl']
+
+    assert cache.get_missing(TimeFrame.Hour, 'XAAA', date(2022, 1, 20), date(2022, 2, 15)) == \
+        [(date(2022, 1, 20), date(2022, 1, 24)), (date(2022, 2, 6), date(2022, 2, 9)), (date(2022, 2, 13), date(2022, 2, 15))]
+    assert cache.get_missing(TimeFrame.Hour, 'XAAA', date(2022, 1, 28), date(2022, 2, 3)) == []
+    assert cache.get_missing(TimeFrame.Hour, 'ETH/USD', date(2022, 1, 20), date(2022, 2, 15)) == \
+        [(date(2022, 1, 20), date(2022, 1, 24)), (date(2022, 2, 6), date(2022, 2, 15))]
+    assert cache.get_missing(TimeFrame.Day, 'XAAA', date(2022, 1, 28), date(2022, 2, 3)) == [(date(2022, 1, 28), date(2022, 2, 3))]
+
+    # the read spans the month partitions and stops at the end date
+    bars_df = cache.read(TimeFrame.Hour, ['XAAA'], date(2022, 1, 31), date(2022, 2, 1))
+    expected = get_bars_df(['XAAA', 'ETH/USD'], date(2022, 1, 25), date(2022, 2, 5))
+    expected = expected[(expected.index.get_level_values('symbol') == 'XAAA') &
+                        (expected.index.get_level_values('timestamp') >= pd.Timestamp('2022-01-31', tz='UTC')) &
+                        (expected.index.get_level_values('timestamp') < pd.Timestamp('2022-02-02', tz='UTC'))]
+    pd.testing.assert_frame_equal(bars_df.sort_index(), expected)
+
+    # adjacent ranges merge
+    cache.write(TimeFrame.Hour, get_bars_df(['XAAA'], date(2022, 2, 6), date(2022, 2, 9)), ['XAAA'], date(2022, 2, 6), date(2022, 2, 9))
+    assert cache.get_coverage(TimeFrame.Hour, 'XAAA') == [[date(2022, 1, 25), date(2022, 2, 12)]]
+
+
+def test_open_days_are_not_covered(tmp_path):
+    cache = BarCache(root=str(tmp_path), settle=timedelta(hours=6))
+    today = datetime.utcnow().date()
+    last_closed_day = (datetime.utcnow() - timedelta(hours=6)).date() - timedelta(days=1)
+
+    cache.write(TimeFrame.Hour, get_bars_df(['XAAA'], today - timedelta(days=5), today), ['XAAA'], today - timedelta(days=5), today)
+
+    # the bars are stored, but the days from the last closed one on get downloaded again
+    assert len(cache.read(TimeFrame.Hour, ['XAAA'], today - timedelta(days=5), today).index) == 6 * 24
+    assert cache.get_coverage(TimeFrame.Hour, 'XAAA') == [[today - timedelta(days=5), last_closed_day]]
+    assert cache.get_missing(TimeFrame.Hour, 'XAAA', today - timedelta(days=5), today) == [(last_closed_day + timedelta(days=1), today)]
+
+    # nothing closed yet - nothing covered
+    cache.write(TimeFrame.Hour, get_bars_df(['XAAB'], today, today), ['XAAB'], today, today)
+    assert cache.get_coverage(TimeFrame.Hour, 'XAAB') == []
+
+
+def test_pricer_has_no_cache_by_default(pricer_kwargs):
+    del pricer_kwargs['bar_cache']
+    assert Pricer(**dict(pricer_kwargs, symbols=['XAAA'])).bar_cache is None
@@ -0,0 +1,68 @@
+import copy
+from datetime import timedelta
+
+import pandas as pd
+import pytest
+
+import covey.covey_calendar as covey_calendar
+from covey.covey_benchmark import StubTradingClient
+from covey.covey_calendar import CoveyCalendar
+
+
+# trading client stand in that records the calendar requests - the market publishes its business days up to its end
+class CountingTradingClient(StubTradingClient):
+    def __init__(self, market):
+        super().__init__(copy.copy(market))
+        self.requests = []
+
+    def get_calendar(self, filters=None):
+        self.requests.append((str(filters.start), None if filters.end is None else str(filters.end)))
+        return super().get_calendar(filters)
+
+
+# no calendar in memory for the test
+@pytest.fixture(autouse=True)
+def calendars(monkeypatch):
+    monkeypatch.setattr(covey_calendar, '_calendars', {})
+
+
+def test_calendar_is_extended_earlier_and_later(market, tmp_path):
+    client = CountingTradingClient(market)
+    client.market.end = pd.Timestamp('2022-01-31')
+    path = str(tmp_path / 'calendar.pkl')
+
+    c = CoveyCalendar(start_date='2022-01-10', path=path, trading_client=client)
+    assert client.requests == [('2022-01-10', None)]
+    assert c.business_dates['date'].min() == pd.Timestamp('2022-01-10')
+
+    # a later start is in memory already
+    c = CoveyCalendar(start_date='2022-01-12', path=path, trading_client=client)
+    assert len(client.requests) == 1
+    assert c.business_dates['date'].min() == pd.Timestamp('2022-01-12')
+
+    # an earlier start only fetches the days before the cached ones
+    c = CoveyCalendar(start_date='2022-01-03', path=path, trading_client=client)
+    assert client.requests[1:] == [('2022-01-03', '2022-01-09')]
+    fresh = CoveyCalendar(start_date='2022-01-03', path=str(tmp_path / 'fresh.pkl'), trading_client=client).business_dates
+    pd.testing.assert_frame_equal(c.business_dates.reset_index(drop=True), fresh.reset_index(drop=True))
+
+    # from disk in a new process - nothing fetched until the calendar is older than max age
+    covey_calendar._calendars.clear()
+    client.requests = []
+    client.market.end = pd.Timestamp('2022-02-11')
+    c = CoveyCalendar(start_date='2022-01-03', path=path, trading_client=client)
+    assert client.requests == []
+    assert c.business_dates['next_market_open'].max() < pd.Timestamp('2022-02-01')
+
+    c = CoveyCalendar(start_date='2022-01-03', path=path, trading_client=client, max_age=timedelta(0))
+    assert client.requests == [('2022-02-01', None)]
+    assert c.business_dates['next_market_open'].max() > pd.Timestamp('2022-02-09')
+    fresh = CoveyCalendar(start_date='2022-01-03', path=str(tmp_path / 'fresh_later.pkl'), trading_client=client).business_dates
+    pd.testing.assert_frame_equal(c.business_dates.reset_index(drop=True), fresh.reset_index(drop=True))
+
+    # the extended calendar was persisted
+    covey_calendar._calendars.clear()
+    client.requests = []
+    c = CoveyCalendar(start_date='2022-01-03', path=path, trading_client=client)
+    assert client.requests == []
+    pd.testing.assert_frame_equal(c.business_dates.reset_index(drop=True), fresh.reset_index(drop=True))
@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+
+import pytest
+from web3 import Web3
+
+import covey.covey_client as covey_client
+from covey.covey_client import CoveyClient, get_client
+from covey.covey_ledger import Ledger, LedgerIndexer, LedgerStore
+from covey.covey_poster import Poster
+from covey.covey_trade import Trade
+
+
+# no clients from earlier tests
+@pytest.fixture(autouse=True)
+def clients(monkeypatch):
+    monkeypatch.setattr(covey_client, '_clients', {})
+
+
+def test_one_client_per_node_and_ledger(tmp_path):
+    client = get_client()
+    # an empty ledger so Ledger doesn't go to the node
+    client.covey_ledger = SimpleNamespace(functions=SimpleNamespace(getAllContent=lambda: SimpleNamespace(call=lambda: [])))
+
+    assert Trade(posting_only=True).client is client
+    assert Ledger().client is client
+    assert LedgerIndexer(store=LedgerStore(path=str(tmp_path / 'covey_ledger.db'))).w3 is client.w3
+    assert Poster().client is client
+
+    # another node or ledger address gets its own client
+    other_url = get_client(POLYGON_URL='http://localhost:8545')
+    other_ledger = get_client(covey_ledger_polygon_address='0x0000000000000000000000000000000000000001')
+    assert len({id(client), id(other_url), id(other_ledger)}) == 3
+    assert Trade(posting_only=True, POLYGON_URL='http://localhost:8545').client is other_url
+    assert Poster(POLYGON_URL='http://localhost:8545').client is other_url
+
+
+# json-rpc endpoint stand in - answers the batch out of order, the last call with an error
+class StubSession:
+    def __init__(self):
+        self.requests = []
+
+    def post(self, url, json=None, timeout=None):
+        self.requests.append(json)
+        responses = [{'jsonrpc': '2.0', 'id': r['id'], 'result': '{}:{}'.format(r['method'], r['params'])} for r in json]
+        responses[-1] = {'jsonrpc': '2.0', 'id': json[-1]['id'], 'error': {'code': -32000, 'message': 'failed'}}
+        return SimpleNamespace(raise_for_status=lambda: None, json=lambda: list(reversed(responses)))
+
+
+def test_batch_keeps_the_call_order():
+    c = CoveyClient(w3=Web3())
+    c.session = StubSession()
+
+    calls = [('eth_getTransactionReceipt', ['0x{}'.format(i)]) for i in range(5)] + [('eth_gasPrice', [])]
+    assert c.batch(calls) == ["eth_getTransactionReceipt:['0x{}']".format(i) for i in range(5)] + [None]
+    assert len(c.session.requests) == 1
+    assert c.batch([]) == []
+    assert len(c.session.requests) == 1
@@ -0,0 +1,20 @@
+import pandas as pd
+
+from covey.covey_portfolio import Portfolio
+
+
+# the event driven engine against the row by row evaluate_portfolio_row path
+def test_engine_matches_row_by_row(market, portfolio_kwargs):
+    for address in market.addresses:
+        rows = Portfolio(address=address, use_engine=False, **portfolio_kwargs)
+        rows.calculate_portfolio()
+        engine = Portfolio(address=address, use_engine=True, **portfolio_kwargs)
+        engine.calculate_portfolio()
+
+        assert len(engine.portfolio.index) > 0
+        pd.testing.assert_frame_equal(engine.portfolio.astype(float), rows.portfolio.astype(float), check_freq=False,
+                                      rtol=1e-6)
+
+        columns = ['vwap', 'share_count', 'post_cumulative_share_count', 'cash_used', 'realized_profit']
+        pd.testing.assert_frame_equal(engine.trading_key[columns].astype(float), rows.trading_key[columns].astype(float),
+                                      rtol=1e-6)
@@ -0,0 +1,49 @@
+import pandas as pd
+
+from covey.covey_benchmark import SyntheticMarket, StubChainClient, StubStockClient, StubCryptoClient
+from covey.covey_trade import Trade
+from covey.covey_pricer import Pricer
+from covey.covey_export import Exporter
+from covey.covey_portfolio import Portfolio
+
+
+# each wallet exported with the price key of its own symbols
+def export_wallets(market, universe, calendar_key, exporter):
+    client = StubChainClient(market)
+    portfolios = {}
+    for address in market.addresses:
+        trades = Trade(address=address, client=client, universe=universe, pricing=False).trades
+        price_key = Pricer(start=market.start.strftime('%Y-%m-%d'), end=market.end.strftime('%Y-%m-%d'),
+                           symbols=list(trades['symbol'].unique()), stock_client=StubStockClient(market),
+                           crypto_client=StubCryptoClient(market), bar_cache=None, calendar_key=calendar_key).price_key
+        p = Portfolio(address=address, trades=trades, client=client, universe=universe, calendar_key=calendar_key,
+                      price_key=price_key, exporter=exporter)
+        p.calculate_portfolio()
+        portfolios[address] = p
+    return portfolios
+
+
+def test_load_portfolio_reads_its_own_price_key(universe, calendar_key, tmp_path):
+    # a few posts per wallet - the wallets trade different symbols
+    market = SyntheticMarket(wallets=2, trades=3, symbols=12, days=20, seed=2)
+    e = Exporter(root=str(tmp_path))
+    portfolios = export_wallets(market, universe, calendar_key, e)
+    assert len(set(tuple(sorted(p.price_key.symbols)) for p in portfolios.values())) == 2
+
+    for address, p in portfolios.items():
+        q = e.load_portfolio(address, calendar_key=calendar_key, universe=universe, client=StubChainClient(market))
+        assert sorted(q.price_key.symbols) == sorted(p.price_key.symbols)
+        a, b = [k.source.sort_values(['symbol', 'timestamp']).reset_index(drop=True) for k in (q.price_key, p.price_key)]
+        pd.testing.assert_frame_equal(a, b, check_dtype=False)
+        pd.testing.assert_frame_equal(q.portfolio, p.portfolio, check_freq=False)
+
+
+def test_load_portfolio_falls_back_to_the_universe_price_key(market, price_key, tmp_path):
+    e = Exporter(root=str(tmp_path))
+    e.write_price_key(price_key, key='universe_price_key')
+
+    trades = pd.DataFrame({'symbol': market.equity_symbols[:2]})
+    assert e.read_price_key(market.addresses[0]) is None
+    wallet_price_key = e.read_wallet_price_key(market.addresses[0], trades)
+    assert sorted(wallet_price_key.symbols) == market.equity_symbols[:2]
+    assert set(wallet_price_key.source['symbol']) == set(market.equity_symbols[:2])
@@ -0,0 +1,112 @@
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from covey.covey_gas import GasOracle
+
+
+# gas station stand in - serves the levels (maxFee in gwei) or raises what's set, counts the requests
+class StubSession:
+    def __init__(self, fast=30.0, error=None):
+        self.levels = {'safeLow': {'maxFee': fast / 2}, 'standard': {'maxFee': fast * 0.8}, 'fast': {'maxFee': fast}}
+        self.error = error
+        self.calls = 0
+
+    def get(self, url, timeout=None):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return SimpleNamespace(json=lambda: self.levels)
+
+
+# node stand in - eth_gasPrice in wei, raises when set to an exception
+class StubNode:
+    def __init__(self, gwei):
+        self.gwei = gwei
+        self.eth = self
+
+    @property
+    def gas_price(self):
+        if isinstance(self.gwei, Exception):
+            raise self.gwei
+        return int(self.gwei * 10**9)
+
+
+def test_gas_price_is_cached_for_max_age():
+    session = StubSession(fast=30.0)
+    g = GasOracle(session=session, max_age=timedelta(seconds=60))
+
+    assert g.get_gas_price() == 30.0
+    assert g.get_gas_price() == 30.0
+    assert session.calls == 1
+    assert g.source == 'gas station'
+
+    g.fetched_at -= timedelta(seconds=61)
+    session.levels['fast']['maxFee'] = 35.0
+    assert g.get_gas_price() == 35.0
+    assert session.calls == 2
+
+
+@pytest.mark.parametrize('strategy, multiplier', [('safeLow', 1.0), ('standard', 1.1), ('fast', 1.25)])
+def test_node_fallback_per_strategy(strategy, multiplier):
+    g = GasOracle(session=StubSession(error=ConnectionError('gas station down')), w3=StubNode(40), strategy=strategy)
+
+    with pytest.warns(RuntimeWarning, match='gas station down'):
+        assert g.get_gas_price() == pytest.approx(40 * multiplier)
+    assert g.source == 'node'
+
+
+def test_no_fallback_without_a_node():
+    g = GasOracle(session=StubSession(error=ConnectionError('gas station down')))
+    with pytest.raises(ConnectionError):
+        g.get_gas_price()
+
+
+def test_last_gas_price_kept_when_both_fail():
+    session = StubSession(fast=30.0)
+    node = StubNode(40)
+    g = GasOracle(session=session, w3=node, max_age=timedelta(seconds=60))
+    g.get_gas_price()
+
+    session.error = ConnectionError('gas station down')
+    node.gwei = ValueError('node down')
+    g.fetched_at -= timedelta(seconds=61)
+    with pytest.warns(RuntimeWarning, match='keeping 30.0 gwei'):
+        assert g.get_gas_price() == 30.0
+    assert g.source == 'gas station'
+
+    # the kept price counts as fresh - no lookup per post while everything is down
+    calls = session.calls
+    g.get_gas_price()
+    assert session.calls == calls
+
+
+def test_max_gas_price_caps_the_price():
+    g = GasOracle(session=StubSession(fast=120.0), max_gas_price=60.0)
+    assert g.get_gas_price() == 60.0
+    assert g.gas_price == 120.0
+
+
+def test_background_refresher_starts_and_stops():
+    session = StubSession(fast=30.0)
+    g = GasOracle(session=session, max_age=timedelta(seconds=0.02), background=True)
+    assert g.refresher is not None and g.refresher.is_alive()
+
+    deadline = time.time() + 5
+    while session.calls < 4 and time.time() < deadline:
+        time.sleep(0.01)
+    assert session.calls >= 4
+
+    refresher = g.refresher
+    g.stop()
+    assert g.refresher is None and not refresher.is_alive()
+    calls = session.calls
+    time.sleep(0.05)
+    assert session.calls == calls
+
+    # can be started again
+    g.start()
+    assert g.refresher.is_alive()
+    g.stop()
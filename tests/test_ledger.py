@@ -0,0 +1,111 @@
+from types import SimpleNamespace
+
+from eth_abi import encode
+from hexbytes import HexBytes
+from web3 import Web3
+
+from covey.covey_client import get_abi
+from covey.covey_ledger import LedgerIndexer, LedgerStore
+
+ledger_address = '0x587Ec5a7a3F2DE881B15776BC7aaD97AA44862Be'
+old_address = Web3.toChecksumAddress('0x' + '11' * 20)
+new_address = Web3.toChecksumAddress('0x' + '22' * 20)
+
+
+def get_content_log(block, analyst, content, created_at):
+    return {'address': ledger_address, 'blockNumber': block, 'logIndex': 0, 'transactionIndex': 0,
+            'transactionHash': HexBytes(block.to_bytes(32, 'big')), 'blockHash': HexBytes(block.to_bytes(32, 'big')),
+            'topics': [Web3.keccak(text='ContentCreated(address,string,uint256)'),
+                       HexBytes(encode(['address'], [analyst])), HexBytes(encode(['uint256'], [created_at]))],
+            'data': HexBytes(encode(['string'], [content]))}
+
+
+def get_swap_log(block, old, new):
+    return {'address': ledger_address, 'blockNumber': block, 'logIndex': 0, 'transactionIndex': 0,
+            'transactionHash': HexBytes(block.to_bytes(32, 'big')), 'blockHash': HexBytes(block.to_bytes(32, 'big')),
+            'topics': [Web3.keccak(text='AddressSwapped(address,address)'),
+                       HexBytes(encode(['address'], [old])), HexBytes(encode(['address'], [new]))],
+            'data': HexBytes(b'')}
+
+
+# recorded log stand in - serves get_logs out of a list, ranges wider than max_range fail like a node limit would
+class RecordedChain:
+    def __init__(self, logs, block_number, max_range=None):
+        self.logs = logs
+        self.max_range = max_range
+        self.requests = []
+        self.contract = Web3().eth.contract(address=ledger_address, abi=get_abi())
+        self.eth = SimpleNamespace(block_number=block_number, get_logs=self.get_logs,
+                                   contract=lambda address, abi: self.contract)
+
+    def get_logs(self, params):
+        self.requests.append((params['fromBlock'], params['toBlock']))
+        if self.max_range is not None and params['toBlock'] - params['fromBlock'] + 1 > self.max_range:
+            raise ValueError('query returned more than 10000 results')
+        return [log for log in self.logs if params['fromBlock'] <= log['blockNumber'] <= params['toBlock']]
+
+
+def get_indexer(chain, tmp_path, **kwargs):
+    store = LedgerStore(path=str(tmp_path / 'covey_ledger.db'))
+    return LedgerIndexer(w3=chain, store=store, start_block=100, **kwargs)
+
+
+def test_second_update_starts_at_the_checkpoint(tmp_path):
+    chain = RecordedChain([get_content_log(120, old_address, 'AAPL:0.5', 1), get_content_log(190, old_address, 'MSFT:0.2', 2)],
+                          block_number=210)
+    indexer = get_indexer(chain, tmp_path, chunk_size=50, confirmations=10)
+
+    assert indexer.update() == 2
+    assert chain.requests == [(100, 149), (150, 199), (200, 200)]
+    assert indexer.store.get_checkpoint() == 200
+
+    chain.logs.append(get_content_log(230, old_address, 'TSLA:0.1', 3))
+    chain.eth.block_number = 250
+    chain.requests = []
+
+    assert indexer.update() == 1
+    assert chain.requests == [(201, 240)]
+    assert indexer.store.get_all_content()['trades'].to_list() == ['AAPL:0.5', 'MSFT:0.2', 'TSLA:0.1']
+
+
+def test_failing_range_is_halved(tmp_path):
+    chain = RecordedChain([get_content_log(b, old_address, 'AAPL:0.{}'.format(b), b) for b in (101, 140, 170)],
+                          block_number=200, max_range=30)
+    indexer = get_indexer(chain, tmp_path, chunk_size=100, confirmations=0)
+
+    assert indexer.update() == 3
+    # 100 and 50 blocks fail, 25 block ranges from then on
+    assert chain.requests[:3] == [(100, 199), (100, 149), (100, 124)]
+    assert all(end - start < 30 for start, end in chain.requests[2:])
+    assert chain.requests[-1][1] == 200
+    assert indexer.store.get_all_content()['entry_date_time'].to_list() == [101, 140, 170]
+
+
+def test_confirmations_cutoff(tmp_path):
+    chain = RecordedChain([get_content_log(150, old_address, 'AAPL:0.5', 1), get_content_log(195, old_address, 'MSFT:0.2', 2)],
+                          block_number=200)
+    indexer = get_indexer(chain, tmp_path, confirmations=10)
+
+    # the post at 195 can still reorg - not indexed until the chain is 10 blocks past it
+    assert indexer.update() == 1
+    assert indexer.store.get_checkpoint() == 190
+
+    chain.eth.block_number = 205
+    assert indexer.update() == 1
+    assert indexer.store.get_checkpoint() == 195
+
+
+def test_analyst_content_follows_swap_address(tmp_path):
+    chain = RecordedChain([get_content_log(110, old_address, 'AAPL:0.5', 1),
+                           get_content_log(120, new_address, 'GME:0.9', 2),
+                           get_content_log(130, old_address, 'MSFT:0.2', 3),
+                           get_swap_log(140, old_address, new_address),
+                           get_content_log(150, old_address, 'AMZN:0.1', 4),
+                           get_content_log(160, new_address, 'TSLA:0.1', 5)], block_number=200)
+    indexer = get_indexer(chain, tmp_path, confirmations=0)
+    indexer.update()
+
+    # the swap replaces the new address's content with the old address's up to the swap, later posts get appended
+    assert indexer.store.get_analyst_content(new_address)['trades'].to_list() == ['AAPL:0.5', 'MSFT:0.2', 'TSLA:0.1']
+    assert indexer.store.get_analyst_content(new_address.lower())['trades'].to_list() == ['AAPL:0.5', 'MSFT:0.2', 'TSLA:0.1']
+    assert indexer.store.get_analyst_content(old_address)['trades'].to_list() == ['AAPL:0.5', 'MSFT:0.2', 'AMZN:0.1']
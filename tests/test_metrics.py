@@ -0,0 +1,60 @@
+import pytest
+
+from covey.covey_metrics import Metrics
+from covey.covey_portfolio import Portfolio
+
+
+def test_stages_and_counters_add_up():
+    events = []
+    m = Metrics(sink=events.append)
+
+    for _ in range(3):
+        with m.stage('price_download'):
+            m.count('bar_rows', 10)
+    m.count('bar_rows')
+    m.gauge('symbols', 5)
+    m.gauge('symbols', 7)
+
+    metrics = m.to_dict()
+    assert metrics['timings']['price_download']['calls'] == 3
+    assert metrics['timings']['price_download']['seconds'] > 0
+    assert metrics['counters'] == {'bar_rows': 31, 'symbols': 7}
+
+    # every count, gauge and timing goes to the sink as it happens
+    assert [(e['kind'], e['name']) for e in events] == [('count', 'bar_rows'), ('timing', 'price_download')] * 3 + \
+        [('count', 'bar_rows'), ('gauge', 'symbols'), ('gauge', 'symbols')]
+    assert [e['value'] for e in events if e['kind'] != 'timing'] == [10, 10, 10, 1, 5, 7]
+    assert sum(e['value'] for e in events if e['kind'] == 'timing') == pytest.approx(metrics['timings']['price_download']['seconds'])
+
+    assert m.report().splitlines()[0].startswith('price_download')
+
+
+def test_only_the_outer_stage_is_profiled():
+    m = Metrics(profiler='cprofile')
+    with m.stage('portfolio_loop'):
+        with m.stage('trading_key_build'):
+            sum(range(1000))
+    assert m.get_profile('portfolio_loop') is not None
+    assert m.get_profile('trading_key_build') is None
+    assert m.to_dict()['timings']['trading_key_build']['calls'] == 1
+
+    # only the stages asked for - a nested one too when its outer stage isn't profiled
+    m = Metrics(profiler='cprofile', profile_stages=['trading_key_build'])
+    with m.stage('portfolio_loop'):
+        with m.stage('trading_key_build'):
+            sum(range(1000))
+    assert m.get_profile('portfolio_loop') is None
+    assert 'function calls' in m.get_profile('trading_key_build')
+
+    with pytest.raises(ValueError):
+        Metrics(profiler='perf')
+
+
+# the row by row path counts its rows instead of printing them
+def test_evaluated_portfolio_rows_are_counted(market, portfolio_kwargs):
+    p = Portfolio(address=market.addresses[0], use_engine=False, **portfolio_kwargs)
+    p.calculate_portfolio()
+
+    assert p.metrics.counters['portfolio_rows_evaluated'] == len(p.portfolio.index) - 1
+    assert p.metrics.counters['portfolio_rows'] == len(p.portfolio.index)
+    assert p.metrics.timings['portfolio_loop']['calls'] == 1
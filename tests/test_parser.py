@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+from covey.covey_parser import TradeParser
+
+
+# the explode / apply transform TradeParser replaced
+def parse_row_by_row(df):
+    def is_number_repl_isdigit(s):
+        try:
+            return s.lstrip("-").replace('.', '', 1).isdigit()
+        except AttributeError:
+            return False
+
+    trades = df.assign(trades=df['trades'].str.split(',')).explode('trades')
+    trades['trades'] = trades['trades'].apply(lambda x: x if len(x) > 0 else 'BLANK:0')
+    trades[['symbol', 'target_percentage']] = trades['trades'].str.split(':', expand=True).iloc[:, 0:2]
+    trades['symbol'] = trades['symbol'].str.strip()
+    trades['target_percentage'] = trades['target_percentage'].apply(lambda x: x if is_number_repl_isdigit(x) else 0)
+    return trades
+
+
+def test_parser_matches_row_by_row():
+    rng = np.random.default_rng(0)
+    cells = ['AAPL:0.1', 'MSFT:-0.25', 'ETHUSDT:.5', ' TSLA :1.', 'AMZN:0', 'META:abc', 'NVDA', 'BTCUSDT:0.1:0.2',
+             ':0.3', 'AAPL:-', 'MSFT: 0.2', '', 'covey-reset']
+    posts = [','.join(rng.choice(cells, rng.integers(1, 5))) for _ in range(3000)]
+    df = pd.DataFrame({'address': rng.choice(['0xabc', '0xdef'], len(posts)), 'trades': posts,
+                       'entry_date_time': rng.integers(1640995200, 1650000000, len(posts)), 'chain': 'MATIC'})
+
+    expected = parse_row_by_row(df)
+    parser = TradeParser(target_dtype='float64', keep_cells=True)
+    trades = parser.parse(df)
+
+    assert trades.index.equals(expected.index)
+    for column in ['address', 'chain', 'trades', 'entry_date_time']:
+        assert (trades[column].to_numpy() == expected[column].to_numpy()).all(), column
+    assert (trades['symbol'].astype(str).to_numpy() == expected['symbol'].to_numpy()).all()
+    np.testing.assert_array_equal(trades['target_percentage'].to_numpy(),
+                                  pd.to_numeric(expected['target_percentage']).to_numpy(dtype='float64'))
+
+    # each kind of malformed entry is reported
+    assert len(parser.malformed.index) > 0
+    assert set(parser.malformed['reason']) == {'blank', 'no target', 'bad target', 'no symbol'}
@@ -0,0 +1,90 @@
+import copy
+import os
+
+import pandas as pd
+import pytest
+
+import covey.covey_portfolio as covey_portfolio
+from covey.covey_benchmark import StubChainClient
+from covey.covey_export import Exporter
+from covey.covey_portfolio import Portfolio, load_state
+from covey.covey_pricer import Pricer
+
+columns = ['symbol', 'vwap', 'post_cumulative_share_count', 'realized_profit', 'long_realized_profit',
+           'short_realized_profit', 'cash_used', 'share_count']
+
+
+# the chain as of the cutoff - only the posts entered by then
+def get_chain(market, cutoff):
+    market = copy.copy(market)
+    market.ledger = market.ledger[market.ledger['entry_date_time'] <= int(cutoff.timestamp())]
+    return StubChainClient(market)
+
+
+# full run up to the last close, then a nightly run per split - each from the state the run before saved
+def run_updates(market, portfolio_kwargs, pricer_kwargs, splits, tmp_path, **kwargs):
+    address = market.addresses[0]
+    ref = Portfolio(address=address, **portfolio_kwargs)
+    ref.calculate_portfolio()
+    closes = ref.portfolio.index
+
+    state = None
+    rows = []
+    for b in splits + [len(closes) - 1]:
+        end = closes[b]
+        price_key = portfolio_kwargs['price_key']
+        if b < len(closes) - 1:
+            price_key = Pricer(**dict(pricer_kwargs, end=end.strftime('%Y-%m-%d'))).price_key
+        p = Portfolio(address=address, **dict(portfolio_kwargs, client=get_chain(market, end + pd.Timedelta(hours=3)),
+                                              price_key=price_key, state=state, export=True, **kwargs))
+        p.calculate_portfolio()
+        p.save_state(str(tmp_path / 'state.pkl'))
+        state = load_state(address, str(tmp_path / 'state.pkl'))
+        rows.append(p.portfolio)
+
+    pd.testing.assert_frame_equal(pd.concat(rows), ref.portfolio, check_freq=False, rtol=1e-9)
+    return ref
+
+
+@pytest.mark.parametrize('splits', [[12], [8, 9, 20]])
+def test_update_csv_matches_full_run(market, portfolio_kwargs, pricer_kwargs, splits, tmp_path, monkeypatch):
+    monkeypatch.setattr(covey_portfolio, 'get_output', lambda f: os.path.join(str(tmp_path), f))
+    ref = run_updates(market, portfolio_kwargs, pricer_kwargs, splits, tmp_path)
+
+    portfolio = pd.read_csv(tmp_path / 'portfolio.csv', index_col=0, parse_dates=True)
+    pd.testing.assert_frame_equal(portfolio, ref.portfolio, check_freq=False, check_names=False, rtol=1e-9)
+
+    # realized profit booked on the earlier runs' trades is patched into their rows
+    trading_key = pd.read_csv(tmp_path / 'trading_key.csv', index_col='trade_id')
+    pd.testing.assert_frame_equal(trading_key[columns], ref.trading_key[columns], check_dtype=False, rtol=1e-9)
+
+
+def test_update_exporter_matches_full_run(market, portfolio_kwargs, pricer_kwargs, tmp_path):
+    e = Exporter(root=str(tmp_path / 'export'))
+    ref = run_updates(market, portfolio_kwargs, pricer_kwargs, [8, 9, 20], tmp_path, exporter=e)
+
+    q = e.load_portfolio(market.addresses[0], calendar_key=portfolio_kwargs['calendar_key'],
+                         universe=portfolio_kwargs['universe'], client=portfolio_kwargs['client'])
+    pd.testing.assert_frame_equal(q.portfolio, ref.portfolio, check_freq=False, rtol=1e-9)
+    pd.testing.assert_frame_equal(q.trading_key[columns].sort_index(), ref.trading_key[columns].sort_index(),
+                                  check_dtype=False, rtol=1e-9)
+
+
+# trading_key.csv without the trade ids (written before they were exported) - the update refuses to touch the outputs
+def test_update_refuses_the_old_csv_layout(market, portfolio_kwargs, pricer_kwargs, tmp_path, monkeypatch):
+    monkeypatch.setattr(covey_portfolio, 'get_output', lambda f: os.path.join(str(tmp_path), f))
+    address = market.addresses[0]
+    end = pd.Timestamp(pricer_kwargs['start']) + pd.Timedelta(days=20)
+    p = Portfolio(address=address, **dict(portfolio_kwargs, client=get_chain(market, end + pd.Timedelta(hours=3)),
+                                          price_key=Pricer(**dict(pricer_kwargs, end=end.strftime('%Y-%m-%d'))).price_key,
+                                          export=True))
+    p.calculate_portfolio()
+    p.save_state(str(tmp_path / 'state.pkl'))
+    p.trading_key.to_csv(tmp_path / 'trading_key.csv', index=False)
+    portfolio_csv = (tmp_path / 'portfolio.csv').read_text()
+
+    q = Portfolio(address=address, **dict(portfolio_kwargs, state=load_state(address, str(tmp_path / 'state.pkl')),
+                                          export=True))
+    with pytest.raises(ValueError, match='trade_id'):
+        q.calculate_portfolio()
+    assert (tmp_path / 'portfolio.csv').read_text() == portfolio_csv
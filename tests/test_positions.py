@@ -0,0 +1,31 @@
+import pandas as pd
+
+from covey.covey_portfolio import Portfolio
+
+
+# the trading key scan the position book replaced - latest trades per symbol entered before the date, still holding shares
+def get_latest_positions_scan(trading_key, portfolio_date):
+    df = trading_key[trading_key['market_entry_date_time'] < portfolio_date].copy()
+    df['symbol_date_rank'] = df.groupby('symbol')['entry_date_time'].rank('dense', ascending=False)
+    df['realized_profit_final'] = df.groupby('symbol')['realized_profit'].transform(sum) - df['realized_profit']
+    df = df[(df['symbol_date_rank'] == 1) & (df['post_cumulative_share_count'] != 0)]
+    df['current_position'] = df['current_position'].fillna(0)
+    return df
+
+
+def test_position_book_matches_the_trading_key_scan(market, portfolio_kwargs):
+    p = Portfolio(address=market.addresses[1], **portfolio_kwargs)
+    p.calculate_portfolio()
+
+    # forward through the closes, then back in time (the book starts over)
+    dates = list(p.portfolio.index[1:]) + list(p.portfolio.index[1:][::-3])
+    for portfolio_date in dates:
+        expected = get_latest_positions_scan(p.trading_key, portfolio_date)
+        df = p.get_latest_positions(portfolio_date)
+        pd.testing.assert_frame_equal(df, expected[df.columns])
+
+    # the exported latest positions carry the symbols' earlier realized profit
+    p.export_output = lambda key='trading', df=None: setattr(p, 'exported', df)
+    p.export_latest_positions(p.portfolio.index[-1])
+    expected = get_latest_positions_scan(p.trading_key, p.portfolio.index[-1])
+    pd.testing.assert_series_equal(p.exported['realized_profit_final'], expected['realized_profit_final'])
@@ -0,0 +1,77 @@
+import threading
+from types import SimpleNamespace
+
+from web3 import Web3
+
+from covey.covey_poster import Poster
+
+
+# local dev chain stand in - keeps the pending nonce per address and only takes transactions with the next one,
+# the sends listed in fail raise like a dropped connection would (before the node saw them)
+class StubChain:
+    def __init__(self, start_nonces=None, fail=()):
+        self.nonces = dict(start_nonces or {})
+        self.fail = set(fail)
+        self.sent = []
+        self.lock = threading.Lock()
+        self.eth = SimpleNamespace(get_transaction_count=self.get_transaction_count, send_raw_transaction=self.send,
+                                   account=SimpleNamespace(sign_transaction=self.sign_transaction))
+        functions = SimpleNamespace(createContent=lambda position_string: SimpleNamespace(
+            build_transaction=lambda txn: dict(txn, data=position_string),
+            estimate_gas=lambda txn: 50000 + len(position_string)))
+        self.client = SimpleNamespace(w3=self, covey_ledger=SimpleNamespace(functions=functions), session=None,
+                                      polygon_url='http://localhost:8545', covey_ledger_polygon_address='0x0')
+
+    def get_transaction_count(self, address, block_identifier='latest'):
+        with self.lock:
+            return self.nonces.get(address, 0)
+
+    @staticmethod
+    def sign_transaction(txn, private_key=None):
+        return SimpleNamespace(rawTransaction=txn)
+
+    def send(self, txn):
+        with self.lock:
+            if txn['data'] in self.fail:
+                raise ConnectionError('connection dropped')
+            expected = self.nonces.get(txn['from'], 0)
+            if txn['nonce'] != expected:
+                raise ValueError('nonce {} expected {}'.format(txn['nonce'], expected))
+            self.nonces[txn['from']] = expected + 1
+            self.sent.append(txn)
+            return bytes([len(self.sent)])
+
+
+def get_poster(chain):
+    return Poster(client=chain.client, gas_oracle=SimpleNamespace(get_gas_price=lambda: 30.0), max_workers=4)
+
+
+addresses = ['0x' + '{:040x}'.format(i + 1) for i in range(3)]
+
+
+def test_concurrent_wallets_get_consecutive_nonces():
+    chain = StubChain({Web3.toChecksumAddress(addresses[1]): 7})
+    poster = get_poster(chain)
+    posts = [(addresses[i % 3], 'key', 'AAPL:0.{}'.format(i)) for i in range(15)]
+
+    posted = poster.post_many(posts)
+
+    assert posted['error'].isnull().all()
+    assert posted['positions'].to_list() == [p[2] for p in posts]
+    for address, df in posted.groupby('address'):
+        start = 7 if address.lower() == addresses[1] else 0
+        assert df['nonce'].to_list() == list(range(start, start + 5))
+    assert len(chain.sent) == 15
+
+
+def test_failed_send_resets_the_nonce():
+    chain = StubChain(fail={'AAPL:0.2'})
+    poster = get_poster(chain)
+    posts = [(addresses[0], 'key', 'AAPL:0.{}'.format(i)) for i in range(1, 5)]
+
+    posted = poster.post_many(posts)
+
+    # the failed post didn't use its nonce - the next post asks the node again and takes it
+    assert posted['error'].notnull().to_list() == [False, True, False, False]
+    assert posted['nonce'].to_list()[0] == 0 and posted['nonce'].to_list()[2:] == [1, 2]
+    assert [t['nonce'] for t in chain.sent] == [0, 1, 2]
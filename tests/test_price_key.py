@@ -0,0 +1,93 @@
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from covey.covey_price_key import PriceKey
+
+start = '2022-02-14'
+end = '2022-02-18'
+ticker_changes = pd.DataFrame({'symbol': ['VIAC'], 'new_symbol': ['PARA'], 'record_date': ['02/16/2022']})
+
+
+# dense price key the pricer used to build - every market hour x every symbol, forward then back filled per symbol,
+# 0 if never priced, /USD crypto named USDT and the new symbol named as the old one before the ticker change
+def get_dense_price_key(bars, symbols, crypto_symbols):
+    price_key = bars.set_index(['timestamp', 'symbol'])
+
+    date_range = pd.date_range(start, pd.Timestamp(end) + timedelta(days=1), freq='h')
+    date_range_market_hours = pd.DataFrame(date_range[(date_range.hour >= 13) & (date_range.hour <= 21)], columns=['timestamp'])
+    date_symbol_cross = date_range_market_hours.merge(pd.DataFrame(list(set(symbols)), columns=['symbol']),
+                                                      how='cross').set_index(['timestamp', 'symbol'])
+
+    price_key_full = date_symbol_cross.merge(price_key, how='left', left_index=True, right_index=True).reset_index()
+    price_key_full.sort_values(by='timestamp', ascending=True, inplace=True)
+    price_key_full['vwap'] = price_key_full.groupby('symbol')['vwap'].transform(lambda x: x.ffill().bfill())
+    price_key_full['vwap'].fillna(0, inplace=True)
+
+    price_key_full['symbol'] = price_key_full.apply(lambda x: x['symbol'].replace('/USD', 'USDT') if x['symbol'].endswith('/USD')
+                                                    and x['symbol'] in crypto_symbols else x['symbol'], axis=1)
+
+    changes = ticker_changes.copy()
+    changes['record_date'] = pd.to_datetime(changes['record_date'])
+    price_key_full = pd.merge(left=price_key_full, right=changes, left_on='symbol', right_on='new_symbol', how='left')
+    price_key_full['symbol'] = price_key_full.apply(lambda x: x['symbol_y'] if not (pd.isna(x['symbol_y']))
+                                                    and x['timestamp'] < x['record_date'] else x['symbol_x'], axis=1)
+    return price_key_full[['timestamp', 'symbol', 'vwap']]
+
+
+def test_get_vwap_matches_the_dense_price_key():
+    rng = np.random.default_rng(0)
+    hours = pd.date_range(start, pd.Timestamp(end) + timedelta(days=1), freq='h', inclusive='left')
+    hours = hours[(hours.hour >= 13) & (hours.hour <= 21)]
+
+    frames = []
+    for symbol, keep in [('XAAA', 0.5), ('PARA', 0.7), ('ETH/USD', 0.9)]:
+        timestamps = hours[rng.random(len(hours)) < keep]
+        frames.append(pd.DataFrame({'symbol': symbol, 'timestamp': timestamps, 'vwap': rng.uniform(10, 100, len(timestamps))}))
+    bars = pd.concat(frames, ignore_index=True)
+    # no XAAA bars before the 15th (back filled) or on the 17th, PARA only a few bars around the ticker change
+    bars = bars[~((bars['symbol'] == 'XAAA') & ((bars['timestamp'] < '2022-02-15 16:00') |
+                                                 (bars['timestamp'].dt.normalize() == '2022-02-17')))]
+    bars = bars[~((bars['symbol'] == 'PARA') & ((bars['timestamp'] < '2022-02-15 19:00') | (bars['timestamp'] > '2022-02-16 15:00')))]
+    # bars off the market hour grid are never used
+    bars = pd.concat([bars, pd.DataFrame({'symbol': ['XAAA', 'XAAA', 'PARA'], 'vwap': [-1.0, -2.0, -3.0],
+                                          'timestamp': pd.to_datetime(['2022-02-15 12:00', '2022-02-16 13:30', '2022-02-18 22:00'])})],
+                     ignore_index=True)
+
+    symbols = ['XAAA', 'PARA', 'ETH/USD', 'NOPE']
+    crypto_symbols = ['ETH/USD']
+    dense = get_dense_price_key(bars, symbols, crypto_symbols)
+    price_key = PriceKey(bars=bars, start=start, end=end, symbols=symbols, crypto_symbols=crypto_symbols,
+                         ticker_changes=ticker_changes)
+
+    # every price key symbol and the names that aren't in it, on and off the grid (half hours, outside of the market
+    # hours and the dates)
+    timestamps = pd.date_range(pd.Timestamp(start) - timedelta(days=1), pd.Timestamp(end) + timedelta(days=2), freq='30min')
+    query = pd.DataFrame({'symbol': ['XAAA', 'PARA', 'VIAC', 'ETHUSDT', 'ETH/USD', 'NOPE', 'ZZZZ']}).merge(
+        pd.DataFrame({'timestamp': timestamps}), how='cross')
+    expected = pd.merge(left=query, right=dense, on=['symbol', 'timestamp'], how='left')['vwap'].to_numpy()
+
+    vwap = price_key.get_vwap(query['symbol'], query['timestamp'])
+
+    np.testing.assert_array_equal(vwap, expected)
+    # the cases the fixture is there for
+    assert np.isnan(vwap[(query['symbol'] == 'ETH/USD').to_numpy()]).all()
+    assert (vwap[((query['symbol'] == 'NOPE') & query['timestamp'].isin(hours)).to_numpy()] == 0).all()
+    assert (~np.isnan(vwap[((query['symbol'] == 'VIAC') & (query['timestamp'] < '2022-02-16') &
+                            query['timestamp'].isin(hours)).to_numpy()])).all()
+    assert np.isnan(vwap[((query['symbol'] == 'PARA') & (query['timestamp'] < '2022-02-16')).to_numpy()]).all()
+    assert not np.isin([-1.0, -2.0, -3.0], vwap).any()
+
+
+def test_subset_keeps_the_renamed_symbols():
+    bars = pd.DataFrame({'symbol': ['PARA', 'ETH/USD', 'XAAA'], 'vwap': [1.0, 2.0, 3.0],
+                         'timestamp': pd.to_datetime(['2022-02-15 14:00', '2022-02-15 14:00', '2022-02-15 14:00'])})
+    price_key = PriceKey(bars=bars, start=start, end=end, symbols=['PARA', 'ETH/USD', 'XAAA'], crypto_symbols=['ETH/USD'],
+                         ticker_changes=ticker_changes)
+
+    subset = price_key.subset(['VIAC', 'ETHUSDT'])
+
+    assert sorted(subset.source['symbol']) == ['ETH/USD', 'PARA']
+    np.testing.assert_array_equal(subset.get_vwap(['VIAC', 'ETHUSDT', 'XAAA', 'PARA'], pd.to_datetime(['2022-02-15 15:00'] * 4)),
+                                  [1.0, 2.0, np.nan, np.nan])
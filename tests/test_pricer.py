@@ -0,0 +1,121 @@
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+from alpaca.common.exceptions import APIError
+from alpaca.data.timeframe import TimeFrame
+
+from covey.covey_benchmark import SyntheticMarket, StubChainClient, StubStockClient, StubCryptoClient
+from covey.covey_portfolio import Portfolio
+from covey.covey_pricer import Pricer
+from covey.covey_trade import Trade
+
+
+# fails the first requests with the given http status, then serves the stub bars
+class FlakyStockClient(StubStockClient):
+    def __init__(self, market, failures, status_code=429):
+        super().__init__(market)
+        self.failures = failures
+        self.status_code = status_code
+
+    def get_stock_bars(self, request_params):
+        if self.failures > 0:
+            self.failures -= 1
+            raise APIError('{"code": 0}', SimpleNamespace(response=SimpleNamespace(status_code=self.status_code)))
+        return super().get_stock_bars(request_params)
+
+
+def test_live_download_retries_rate_limits(market, pricer_kwargs, price_key):
+    pricer_kwargs.update(stock_client=FlakyStockClient(market, 2), backoff=0)
+    p = Pricer(**pricer_kwargs)
+
+    assert [t['attempts'] for t in p.request_timings if t['rows'] > 0 and 'XAAA' in t['symbol']] == [3]
+    assert p.price_key.source.equals(price_key.source)
+
+
+def test_live_download_gives_up(market, pricer_kwargs):
+    pricer_kwargs.update(stock_client=FlakyStockClient(market, 10), backoff=0, max_retries=2)
+    with pytest.raises(APIError):
+        Pricer(**pricer_kwargs)
+
+    pricer_kwargs.update(stock_client=FlakyStockClient(market, 1, status_code=403))
+    with pytest.raises(APIError):
+        Pricer(**pricer_kwargs)
+
+
+# trading key of the wallet priced with the time frames given - the entry bars only around the trade entries
+def get_trading_key(market, portfolio_kwargs, pricer_kwargs, address, **timeframes):
+    kwargs = dict(client=portfolio_kwargs['client'], universe=portfolio_kwargs['universe'],
+                  calendar_key=portfolio_kwargs['calendar_key'], **timeframes)
+    trades = Trade(address=address, pricing=False, **kwargs).trades
+    pricing_kwargs = Trade(address=address, trades=trades, pricing=False, **kwargs).get_pricing_kwargs()
+    price_key = Pricer(**dict(pricer_kwargs, **pricing_kwargs)).price_key
+    return Trade(address=address, trades=trades, price_key=price_key, **kwargs).trading_key
+
+
+def test_hourly_entries_with_daily_marks_match_hourly(market, portfolio_kwargs, pricer_kwargs):
+    for address in market.addresses:
+        expected = Trade(address=address, client=portfolio_kwargs['client'], universe=portfolio_kwargs['universe'],
+                         calendar_key=portfolio_kwargs['calendar_key'], price_key=portfolio_kwargs['price_key']).trading_key
+        trading_key = get_trading_key(market, portfolio_kwargs, pricer_kwargs, address, timeframe=TimeFrame.Day,
+                                      entry_timeframe=TimeFrame.Hour)
+
+        assert trading_key['vwap'].notnull().sum() > 0
+        pd.testing.assert_series_equal(trading_key['market_entry_date_time'], expected['market_entry_date_time'])
+        pd.testing.assert_series_equal(trading_key['vwap'], expected['vwap'])
+
+
+def test_minute_entries_match_the_full_minute_history(universe, calendar_key):
+    # minute bars of the whole history only on a small market
+    market = SyntheticMarket(wallets=2, trades=15, symbols=4, days=10, seed=0)
+    client = StubChainClient(market)
+    pricer_kwargs = {'start': market.start.strftime('%Y-%m-%d'), 'end': market.end.strftime('%Y-%m-%d'),
+                     'symbols': market.equity_symbols + [c + 'T' for c in market.crypto_symbols],
+                     'stock_client': StubStockClient(market), 'crypto_client': StubCryptoClient(market),
+                     'bar_cache': None, 'calendar_key': calendar_key}
+    portfolio_kwargs = {'client': client, 'universe': universe, 'calendar_key': calendar_key}
+    minute_price_key = Pricer(**dict(pricer_kwargs, timeframe=TimeFrame.Minute)).price_key
+
+    for address in market.addresses:
+        expected = Trade(address=address, price_key=minute_price_key, **portfolio_kwargs).trading_key
+        trading_key = get_trading_key(market, portfolio_kwargs, pricer_kwargs, address, entry_timeframe=TimeFrame.Minute)
+
+        assert trading_key['vwap'].notnull().sum() > 0
+        pd.testing.assert_series_equal(trading_key['market_entry_date_time'], expected['market_entry_date_time'])
+        pd.testing.assert_series_equal(trading_key['vwap'], expected['vwap'])
+
+
+# day ranges of a symbol are merged when they overlap or touch, clipped to the pricer's dates
+def test_merge_windows(pricer_kwargs):
+    p = Pricer(**dict(pricer_kwargs, start='2022-01-03', end='2022-01-20', symbols=['XAAA']))
+    windows = p.merge_windows(['XAAA', 'XAAB', 'XAAA', 'XAAA', 'XAAA', 'XAAB', 'XAAA'],
+                              pd.to_datetime(['2022-01-04', '2022-01-10', '2022-01-03', '2022-01-08', '2022-01-12',
+                                              '2021-12-20', '2022-01-25']),
+                              pd.to_datetime(['2022-01-07', '2022-01-11', '2022-01-05', '2022-01-09', '2022-01-13',
+                                              '2021-12-30', '2022-01-28']))
+
+    date = lambda d: pd.Timestamp(d).date()
+    # overlapping 3-5 / 4-7 and adjacent 8-9 merge, 12-13 is a day apart - outside the pricer's dates dropped
+    assert windows == {'XAAA': [[date('2022-01-03'), date('2022-01-09')], [date('2022-01-12'), date('2022-01-13')]],
+                       'XAAB': [[date('2022-01-10'), date('2022-01-11')]]}
+
+
+def test_demand_pricing_matches_the_full_history(market, portfolio_kwargs, pricer_kwargs):
+    for address in market.addresses:
+        kwargs = dict(portfolio_kwargs, address=address)
+        del kwargs['price_key']
+        trades = Trade(pricing=False, **kwargs).trades
+
+        portfolios = {}
+        pricers = {}
+        for demand in (False, True):
+            pricing_kwargs = Trade(trades=trades, pricing=False, demand_pricing=demand, **kwargs).get_pricing_kwargs()
+            pricers[demand] = Pricer(**dict(pricer_kwargs, **pricing_kwargs))
+            portfolios[demand] = Portfolio(trades=trades, price_key=pricers[demand].price_key, demand_pricing=demand,
+                                           **kwargs)
+            portfolios[demand].calculate_portfolio()
+
+        assert pricers[True].metrics.counters['demand_windows'] > 0
+        assert len(pricers[True].prices.index) < len(pricers[False].prices.index)
+        pd.testing.assert_series_equal(portfolios[True].trading_key['vwap'], portfolios[False].trading_key['vwap'])
+        pd.testing.assert_frame_equal(portfolios[True].portfolio, portfolios[False].portfolio)
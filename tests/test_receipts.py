@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+import pandas as pd
+import pytest
+
+from covey.covey_receipts import ReceiptTracker
+
+
+def get_receipt(transaction_hash, status, block_number):
+    return {'transactionHash': transaction_hash, 'status': hex(status), 'blockNumber': hex(block_number), 'gasUsed': hex(50000)}
+
+
+# node stand in - answers eth_getTransactionReceipt batches (in reverse order) from the mined receipts, records the
+# batch sizes per poll
+class StubNode:
+    def __init__(self, mined):
+        self.mined = mined
+        self.batches = []
+
+    async def rpc(self, batch):
+        self.batches.append(len(batch))
+        return [{'jsonrpc': '2.0', 'id': r['id'], 'result': self.mined.get(r['params'][0])} for r in reversed(batch)]
+
+
+# poster stand in - a replacement transaction gets mined in the next block
+class StubPoster:
+    def __init__(self, node):
+        self.node = node
+        self.submitted = []
+
+    def submit(self, address, address_private, position_string, gas_price=None, nonce=None):
+        self.submitted.append((address, position_string, gas_price, nonce))
+        transaction_hash = '0xreplacement{}'.format(len(self.submitted))
+        self.node.mined[transaction_hash] = get_receipt(transaction_hash, 1, 12)
+        return transaction_hash, nonce, round(gas_price)
+
+
+def test_track_posts():
+    node = StubNode({'0xa0': get_receipt('0xa0', 1, 10), '0xa1': get_receipt('0xa1', 0, 10), '0xb1': get_receipt('0xb1', 1, 11)})
+    poster = StubPoster(node)
+    posted = pd.DataFrame({'address': ['0xA', '0xA', '0xA', '0xA', '0xB', '0xB'],
+                           'positions': ['AAPL:0.1', 'AAPL:0.2', 'AAPL:0.3', 'AAPL:0.4', 'MSFT:0.1', 'MSFT:0.2'],
+                           'transaction_hash': ['0xa0', '0xa1', '0xa2', None, '0xb0', '0xb1'],
+                           'nonce': [0, 1, 2, None, 5, 6], 'gas_price': [30, 30, 30, None, 30, 30],
+                           'submitted_at': time.time()})
+    r = ReceiptTracker(rpc=node.rpc, poster=poster, batch_size=2, poll_interval=0.01, backoff=1, stuck_after=0.05,
+                       fee_bump=1.25, timeout=0.5)
+
+    # only wallet 0xA can be resubmitted
+    tracked = asyncio.run(r.track(posted, private_keys={'0xa': 'key'}))
+
+    # five pending hashes in batches of two on the first poll
+    assert node.batches[:3] == [2, 2, 1]
+
+    assert tracked['status'].to_list() == ['confirmed', 'failed', 'confirmed', 'not sent', 'pending', 'confirmed']
+    assert tracked['block_number'].to_list()[:3] == [10, 10, 12]
+    assert tracked.loc[2, 'transaction_hash'] == '0xreplacement1'
+    assert tracked['resubmissions'].to_list() == [0, 0, 1, 0, 0, 0]
+    assert poster.submitted == [('0xA', 'AAPL:0.3', 37.5, 2)]
+    assert tracked.loc[4, 'latency'] is None
+
+    summary = r.summarize(tracked)
+    assert summary.loc['0xA', ['posts', 'confirmed', 'failed', 'pending', 'not_sent', 'resubmissions']].to_list() == [4, 2, 1, 0, 1, 1]
+    assert summary.loc['0xB', ['posts', 'confirmed', 'failed', 'pending', 'not_sent', 'resubmissions']].to_list() == [2, 1, 0, 1, 0, 0]
+    assert summary.loc['0xA', 'gas_used'] == 3 * 50000
+    assert summary.loc['0xB', 'max_latency'] == pytest.approx(tracked.loc[5, 'latency'])
+    assert summary.loc['0xA', 'max_latency'] >= 0.05
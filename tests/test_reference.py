@@ -0,0 +1,79 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import covey.covey_reference as covey_reference
+from covey.covey_engine import PortfolioEngine
+
+
+# reference csvs in a temporary data folder with an empty cache
+@pytest.fixture
+def data(tmp_path, monkeypatch):
+    monkeypatch.setattr(covey_reference, 'get_data', lambda name: os.path.join(str(tmp_path), name))
+    monkeypatch.setattr(covey_reference, '_cache', {})
+
+    def write(name, text, mtime=None):
+        path = tmp_path / name
+        path.write_text(text)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+    return write
+
+
+def test_load_reference_reloads_when_the_file_changes(data):
+    parsed = []
+    parse = lambda df: parsed.append(len(df.index)) or df
+
+    data('mergers.csv', 'symbol,entry_price\nXAAA,10.0\n', mtime=1000000)
+    assert covey_reference.load_reference('mergers.csv', parse)['symbol'].to_list() == ['XAAA']
+    covey_reference.load_reference('mergers.csv', parse)
+    assert parsed == [1]
+
+    # same modification time - still the cached parse
+    data('mergers.csv', 'symbol,entry_price\nXAAA,10.0\nXAAB,20.0\n', mtime=1000000)
+    assert covey_reference.load_reference('mergers.csv', parse)['symbol'].to_list() == ['XAAA']
+
+    data('mergers.csv', 'symbol,entry_price\nXAAA,10.0\nXAAB,20.0\n', mtime=1000060)
+    assert covey_reference.load_reference('mergers.csv', parse)['symbol'].to_list() == ['XAAA', 'XAAB']
+    assert parsed == [1, 2]
+
+
+def test_symbols_as_of_the_ticker_change(data):
+    # CREE changed twice - the latest change counts
+    data('ticker_changes.csv', 'symbol,new_symbol,record_date\nCREE,CRE2,01/01/2020\nCREE,WOLF,10/1/2021\nVIAC,PARA,02/16/2022\n')
+
+    symbols = covey_reference.get_symbols_as_of(['CREE', 'CREE', 'VIAC', 'VIAC', 'WOLF', 'AAPL'],
+                                                pd.to_datetime(['2021-09-30 23:59', '2021-10-01', '2022-02-15 20:00',
+                                                                '2022-02-16 13:00', '2021-01-01', '2022-01-01']))
+
+    assert symbols.tolist() == ['CREE', 'WOLF', 'VIAC', 'PARA', 'WOLF', 'AAPL']
+
+
+def test_merger_prices(data):
+    data('mergers.csv', 'symbol,entry_price\nXAAA,10.0\nXAAB,20.0\nXAAA,12.5\n')
+
+    np.testing.assert_array_equal(covey_reference.get_merger_prices(['XAAA', 'XAAC', 'XAAB']), [12.5, np.nan, 20.0])
+
+
+# engine amounts per (portfolio row, symbol) are the ones covey_reference.get_corporate_actions gives for the close
+def test_engine_close_actions(data):
+    data('dividend_split.csv', '"symbol","div_or_split","record_date","payment_date","amount","description"\n'
+                               '"XAAA","dividend","2022-01-03","2022-01-05",0.1,""\n'
+                               '"XAAA","dividend","2022-01-03","2022-01-05",0.05,""\n'
+                               '"XAAB","split","2022-01-03","2022-01-06",2.0,""\n'
+                               '"XAAB","split","2022-01-03","2022-01-06",3.0,""\n'
+                               '"XAAB","dividend","2022-01-03","2022-01-08",1.0,""\n')
+    closes = pd.DatetimeIndex(pd.to_datetime(['2022-01-04', '2022-01-05', '2022-01-06', '2022-01-07']))
+    engine = PortfolioEngine()
+
+    dividends = engine.get_close_actions(closes, 'dividend')
+    splits = engine.get_close_actions(closes, 'split')
+
+    assert dividends == {(1, 'XAAA'): pytest.approx(0.15)}
+    assert splits == {(2, 'XAAB'): 6.0}
+    for kind, actions in [('dividend', dividends), ('split', splits)]:
+        for day, close in enumerate(closes):
+            expected = covey_reference.get_corporate_actions(kind, close, ['XAAA', 'XAAB'])
+            np.testing.assert_array_equal([actions.get((day, s), np.nan) for s in ['XAAA', 'XAAB']], expected)
@@ -0,0 +1,73 @@
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+from alpaca.trading.models import Calendar
+
+from covey.covey_benchmark import StubTradingClient
+from covey.covey_calendar import CoveyCalendar
+from covey.covey_trade import Trade
+
+
+# the row by row versions set_ref_trade_date_time and check_max_timestamp replaced (applied with axis=1)
+def set_ref_trade_date_time_row(row):
+    date_cols_to_convert = ['entry_date_time', 'date', 'next_market_open_date', 'next_market_open', 'next_market_close']
+    row[date_cols_to_convert] = pd.to_datetime(row[date_cols_to_convert])
+    trade_date_time_adj = row['entry_date_time'] + timedelta(minutes=61)
+    trade_date_time_adj = trade_date_time_adj.replace(minute=0, second=0)
+
+    if row['date'] != row['next_market_open_date']:
+        new_dt = row['next_market_open'] + timedelta(minutes=61)
+    elif trade_date_time_adj < row['next_market_open']:
+        new_dt = row['next_market_open'] + timedelta(minutes=61)
+    elif trade_date_time_adj >= row['next_market_close']:
+        new_dt = row['next_market_open_t_plus_1']
+    else:
+        new_dt = trade_date_time_adj
+    return new_dt.replace(minute=0, second=0)
+
+
+def check_max_timestamp_row(row):
+    row[['max_time_stamp']] = pd.to_datetime(row[['max_time_stamp']])
+    trade_date_time_adj = row['entry_date_time'] + timedelta(minutes=61)
+    trade_date_time_adj = trade_date_time_adj.replace(minute=0, second=0)
+    if row['max_time_stamp'] < trade_date_time_adj:
+        new_dt = row['max_time_stamp']
+    else:
+        new_dt = row['market_entry_date_time']
+    return new_dt.replace(minute=0, second=0)
+
+
+# the synthetic calendar plus a holiday and an early close
+class HolidayTradingClient(StubTradingClient):
+    def get_calendar(self, filters=None):
+        days = [d for d in super().get_calendar(filters) if str(d.date) != '2022-01-17']
+        return [Calendar(date=str(d.date), open='09:30', close='13:00') if str(d.date) == '2022-01-14' else d
+                for d in days]
+
+
+def test_market_entry_times_match_the_row_by_row_version(market, universe, tmp_path):
+    calendar_key = CoveyCalendar(start_date='2022-01-01', path=str(tmp_path / 'calendar.pkl'),
+                                 trading_client=HolidayTradingClient(market)).business_dates
+
+    # entries at any second of the day, weekends and the holiday included
+    rng = np.random.default_rng(0)
+    entries = pd.Timestamp('2022-01-03') + pd.to_timedelta(rng.integers(0, 30 * 86400, 2000), unit='s')
+    df = pd.DataFrame({'entry_date_time': entries, 'entry_date': entries.normalize()})
+    df = pd.merge(left=df, right=calendar_key, how='inner', left_on='entry_date', right_on='date')
+    assert (df['date'] != df['next_market_open_date']).any()
+
+    t = Trade(address=market.addresses[0], trades=pd.DataFrame(), universe=universe, calendar_key=calendar_key,
+              pricing=False)
+
+    expected = df.apply(set_ref_trade_date_time_row, axis=1)
+    df['market_entry_date_time'] = t.set_ref_trade_date_time(df)
+    pd.testing.assert_series_equal(df['market_entry_date_time'], pd.to_datetime(expected), check_names=False)
+
+    # price histories ending before, at and after the entry hour - and none at all
+    df['max_time_stamp'] = (df['market_entry_date_time'] + pd.to_timedelta(rng.integers(-3, 3, len(df.index)), unit='h')
+                            + pd.to_timedelta(rng.integers(0, 60, len(df.index)), unit='m'))
+    df.loc[rng.random(len(df.index)) < 0.1, 'max_time_stamp'] = pd.NaT
+
+    expected = df.apply(check_max_timestamp_row, axis=1)
+    pd.testing.assert_series_equal(t.check_max_timestamp(df), pd.to_datetime(expected), check_names=False)
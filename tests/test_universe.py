@@ -0,0 +1,60 @@
+from datetime import timedelta
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from alpaca.trading.enums import AssetStatus
+
+import covey.covey_universe as covey_universe
+from covey.covey_universe import Universe, is_tradable
+
+
+# trading client stand in - the active assets (crypto with the slash like alpaca has them), counts the downloads
+class StubTradingClient:
+    def __init__(self, symbols):
+        self.assets = [SimpleNamespace(symbol=s, tradable=True, status=AssetStatus.ACTIVE) for s in symbols]
+        self.assets.append(SimpleNamespace(symbol='HALT', tradable=False, status=AssetStatus.ACTIVE))
+        self.calls = 0
+
+    def get_all_assets(self, filter=None):
+        self.calls += 1
+        return self.assets
+
+
+# no universe in memory for the test
+@pytest.fixture(autouse=True)
+def universes(monkeypatch):
+    monkeypatch.setattr(covey_universe, '_universes', {})
+
+
+def test_universe_is_shared_and_expires(tmp_path):
+    path = str(tmp_path / 'universe.pkl')
+    client = StubTradingClient(['AAPL', 'ETH/USD'])
+
+    assert Universe(path=path, trading_client=client).symbols == frozenset(['AAPL', 'ETHUSD'])
+    assert client.calls == 1
+
+    # same process - out of memory
+    Universe(path=path, trading_client=client)
+    assert client.calls == 1
+
+    # another process (i.e. a batch worker) - off disk
+    covey_universe._universes.clear()
+    assert Universe(path=path, trading_client=StubTradingClient([])).symbols == frozenset(['AAPL', 'ETHUSD'])
+
+    # older than max age - downloaded again and written back
+    client.assets.append(SimpleNamespace(symbol='BTC/USD', tradable=True, status=AssetStatus.ACTIVE))
+    covey_universe._universes[path]['fetched_at'] -= timedelta(days=2)
+    assert Universe(path=path, trading_client=client).symbols == frozenset(['AAPL', 'ETHUSD', 'BTCUSD'])
+    assert client.calls == 2
+
+    covey_universe._universes.clear()
+    assert Universe(path=path, trading_client=client, max_age=timedelta(days=3)).symbols == frozenset(['AAPL', 'ETHUSD', 'BTCUSD'])
+    assert client.calls == 2
+
+
+def test_is_tradable():
+    universe = frozenset(['AAPL', 'ETHUSD'])
+    np.testing.assert_array_equal(is_tradable(universe, ['AAPL', 'ETHUSD', 'ETH/USD', 'HALT', 'AAPL', None]),
+                                  [True, True, False, False, True, False])
+    assert is_tradable(universe, []).tolist() == []